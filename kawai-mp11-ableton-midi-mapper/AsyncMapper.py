@@ -0,0 +1,240 @@
+import asyncio
+import dataclasses as dc
+import logging
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from MidiOxProxy import EventHandler
+from SocketTransport import FrameReader, encode_short, sys_ex_frame, SHORT_MESSAGE, SYS_EX_MESSAGE
+from SysExDecoder import DecodedSysEx
+from Transport import Transport, SYS_EX, MIDI
+
+logger = logging.getLogger(__name__)
+
+
+@dc.dataclass
+class InputEvent:
+    kind: str
+    message: tuple
+    # handler path the event took
+    path: str = ''
+    decoded: Optional[DecodedSysEx] = None
+
+
+@dc.dataclass
+class OutputEvent:
+    kind: str
+    message: tuple
+
+
+class CollectingTransport(Transport):
+    """
+    Collects the messages the handler sends, so that they can be written and published without blocking the handler.
+    Gaps between the chunks of a batch are collected as seconds to wait.
+    """
+
+    def __init__(self):
+        self.out_port_ids: Dict[str, int] = {}
+        self.in_port_ids: Dict[str, int] = {}
+        self.collected: List[Union[OutputEvent, float]] = []
+
+    def send_sys_ex(self, sys_ex: str):
+        self.collected.append(OutputEvent(SYS_EX, (sys_ex,)))
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        batch_size = batch_size or len(sys_ex_list)
+        for i, sys_ex in enumerate(sys_ex_list):
+            if i and gap and i % batch_size == 0:
+                self.collected.append(gap)
+            self.collected.append(OutputEvent(SYS_EX, (sys_ex,)))
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.collected.append(OutputEvent(MIDI, (port, status, data1, data2)))
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.out_port_ids.setdefault(port_name, len(self.out_port_ids))
+
+    def get_in_port_id(self, port_name: str) -> int:
+        # numbered like SocketTransport, the handler subtracts 1
+        return self.in_port_ids.setdefault(port_name, len(self.in_port_ids)) + 1
+
+    def take(self) -> List[Union[OutputEvent, float]]:
+        collected, self.collected = self.collected, []
+        return collected
+
+
+class EventStream:
+    """Async iterator over the events published after it was opened, publishing waits while its queue is full"""
+
+    def __init__(self, maxsize: int):
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+        # set when an event was taken or the stream was closed, wakes the publishers waiting for space
+        self.changed = asyncio.Event()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        event = await self.queue.get()
+        self.changed.set()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    async def put(self, event):
+        """Waits while the queue is full, the event is dropped if the stream is or gets closed"""
+        while not self.closed:
+            if not self.queue.full():
+                self.queue.put_nowait(event)
+                return
+            self.changed.clear()
+            await self.changed.wait()
+
+    def close(self):
+        self.closed = True
+        self.changed.set()
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+class AsyncMapper:
+    """
+    Runs an EventHandler on the event loop. Input arrives from a socket peer speaking the SocketTransport frames, if
+    an address or Unix path is given, and from the awaitable input methods. Every input event and the messages the
+    handler sends are published to the open input and output streams. Output is written to the peer. Sends wait while
+    the peer or a stream lags behind.
+    """
+
+    def __init__(self, address: Tuple[str, int] = None, unix_path: str = None, maxsize: int = 1024,
+                 **handler_kwargs):
+        self.address = address
+        self.unix_path = unix_path
+        self.maxsize = maxsize
+        self.handler_kwargs = handler_kwargs
+        self.transport = CollectingTransport()
+        self.handler: Optional[EventHandler] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.receiver: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.input_streams: List[EventStream] = []
+        self.output_streams: List[EventStream] = []
+        self.start = time.perf_counter()
+
+    async def __aenter__(self) -> 'AsyncMapper':
+        if self.address is not None:
+            self.reader, self.writer = await asyncio.open_connection(*self.address)
+        elif self.unix_path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_path)
+        self.handler = EventHandler(transport=self.transport, **self.handler_kwargs)
+        self.handler.warm_up()
+        if self.reader is not None:
+            self.receiver = asyncio.create_task(self._receive())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.receiver is not None:
+            self.receiver.cancel()
+            try:
+                await self.receiver
+            except asyncio.CancelledError:
+                pass
+            self.receiver = None
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+        for stream in self.input_streams + self.output_streams:
+            stream.close()
+        self.input_streams.clear()
+        self.output_streams.clear()
+
+    def inputs(self) -> EventStream:
+        """Opens a stream of InputEvents"""
+        stream = EventStream(self.maxsize)
+        self.input_streams.append(stream)
+        return stream
+
+    def outputs(self) -> EventStream:
+        """Opens a stream of OutputEvents"""
+        stream = EventStream(self.maxsize)
+        self.output_streams.append(stream)
+        return stream
+
+    def close_stream(self, stream: EventStream):
+        for streams in [self.input_streams, self.output_streams]:
+            if stream in streams:
+                streams.remove(stream)
+        stream.close()
+
+    async def sys_ex_input(self, sys_ex: Union[str, bytes]) -> str:
+        """Handles SysEx as if it came from the mp11, returns the handler path"""
+        return await self._handle(SYS_EX, (sys_ex,))
+
+    async def midi_input(self, port_key: str, status: int, data1: int, data2: int) -> str:
+        """Handles a MIDI message as if it came from the input port with the key, returns the handler path"""
+        return await self._handle(MIDI, (self._timestamp(), self.handler.in_ports[port_key], status, data1, data2))
+
+    async def send_sys_ex(self, sys_ex: str):
+        async with self.lock:
+            self.transport.send_sys_ex(sys_ex)
+            await self._flush()
+
+    async def output_midi_msg(self, port_key: str, status: int, data1: int, data2: int):
+        async with self.lock:
+            self.transport.output_midi_msg(self.handler.out_ports[port_key], status, data1, data2)
+            await self._flush()
+
+    def _timestamp(self) -> int:
+        return int((time.perf_counter() - self.start) * 1000)
+
+    async def _handle(self, kind: str, message: tuple) -> str:
+        async with self.lock:
+            if kind == SYS_EX:
+                path = self.handler.OnSysExInput(*message)
+            else:
+                path = self.handler.OnMidiInput(*message)
+            if self.input_streams:
+                decoded = self.handler.tables.sys_ex_decoder.decode(message[0]) if kind == SYS_EX else None
+                event = InputEvent(kind=kind, message=message, path=path, decoded=decoded)
+                for stream in list(self.input_streams):
+                    await stream.put(event)
+            await self._flush()
+            return path
+
+    async def _flush(self):
+        for item in self.transport.take():
+            if not isinstance(item, OutputEvent):
+                if self.writer is not None:
+                    await self.writer.drain()
+                await asyncio.sleep(item)
+                continue
+            if self.writer is not None:
+                if item.kind == SYS_EX:
+                    self.writer.write(sys_ex_frame(*item.message))
+                else:
+                    self.writer.write(encode_short(*item.message))
+            for stream in list(self.output_streams):
+                await stream.put(item)
+        if self.writer is not None:
+            await self.writer.drain()
+
+    async def _receive(self):
+        frame_reader = FrameReader()
+        while True:
+            data = await self.reader.read(65536)
+            if not data:
+                return
+            for message_type, port, payload in list(frame_reader.feed(data)):
+                try:
+                    if message_type == SYS_EX_MESSAGE:
+                        await self._handle(SYS_EX, (payload,))
+                    elif message_type == SHORT_MESSAGE:
+                        await self._handle(MIDI, (self._timestamp(), port) + tuple(payload))
+                except Exception:
+                    logger.exception('failed to handle %s', payload)
@@ -0,0 +1,125 @@
+import functools
+from typing import Iterable, Tuple, Union
+
+import numpy as np
+
+from MappingTables import MappingTables
+from MidiOxProxy import EventHandler, TABLES, CC_STATUS_OFFSET
+from SysExDecoder import MMC
+from ToneRouting import TONE_IDS
+from consts import KAWAI_SECTION_NAMES
+
+# decoded SysEx from the mp11, control is the control number of the message, value the data of section messages
+EVENT_DTYPE = np.dtype([('timestamp', 'i8'), ('section', 'u1'), ('control', 'u1'), ('value', 'u2')])
+# CC messages to ableton, track is the channel offset of the status byte
+OUTPUT_DTYPE = np.dtype([('timestamp', 'i8'), ('track', 'u1'), ('control', 'u1'), ('value', 'i2')])
+
+MMC_KIND = 1
+TONE_KIND = 2
+PARAMETER_KIND = 3
+
+
+@functools.lru_cache(maxsize=4)
+def control_lookups(tables: MappingTables) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Control number -> kind (0 for unknown controls), scale and whether the MMC control toggles, for the mapping of
+    the tables
+    """
+    kinds = np.zeros(128, dtype='u1')
+    scales = np.zeros(128, dtype='i2')
+    toggles = np.zeros(128, dtype=bool)
+    for info in tables.simple_sys_ex_info:
+        kinds[info.control_number] = MMC_KIND
+        toggles[info.control_number] = info.name not in ['play', 'record pause']
+    tone_control_number = tables.control_number_dict['tone']
+    for info in tables.prefix_sys_ex_info:
+        kinds[info.control_number] = TONE_KIND if info.control_number == tone_control_number else PARAMETER_KIND
+        scales[info.control_number] = info.scale
+    return kinds, scales, toggles
+
+
+# (section, mp11 tone number) -> tone id, -1 for tone numbers without tone
+TONE_ID_TABLE = np.full((len(KAWAI_SECTION_NAMES), max(tone_number for _, tone_number in TONE_IDS) + 1), -1,
+                        dtype='i2')
+for (_section_index, _tone_number), _tone_id in TONE_IDS.items():
+    TONE_ID_TABLE[_section_index, _tone_number] = _tone_id
+
+
+def decode_events(messages: Iterable[Tuple[int, Union[str, bytes]]], tables: MappingTables = TABLES) -> np.ndarray:
+    """Decodes (timestamp, SysEx) pairs into an event array with the mapping of tables, unknown messages are left out"""
+    decoder = tables.sys_ex_decoder
+    rows = []
+    for timestamp, sys_ex in messages:
+        decoded = decoder.decode(sys_ex)
+        if decoded is not None:
+            value = 0 if decoded.kind == MMC else decoded.value
+            rows.append((timestamp, decoded.section_index, decoded.info.control_number, value))
+    return np.array(rows, dtype=EVENT_DTYPE)
+
+
+def _last_index(mask: np.ndarray) -> np.ndarray:
+    """Index of the last True at or before each position, -1 before the first"""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+
+def convert(events: np.ndarray, handler: EventHandler = None) -> np.ndarray:
+    """
+    Maps an event array to the CC messages EventHandler.OnSysExInput() would send to ableton for the same SysEx. Tone
+    routing and MMC toggles start from the state of handler, or of a new handler if not given. The handler is not
+    changed and nothing is sent to the mp11. Control numbers are looked up in the current tables of the handler.
+    """
+    if handler is None:
+        handler = EventHandler()
+    kinds, scales, toggles = control_lookups(handler.tables)
+    count = len(events)
+    section = events['section'].astype(np.intp)
+    control = events['control']
+    value = events['value'].astype(np.intp)
+    kind = kinds[control]
+    section_count = len(handler.sections)
+    in_section = section < section_count
+    is_mmc = kind == MMC_KIND
+    is_tone = (kind == TONE_KIND) & in_section
+    is_parameter = (kind == PARAMETER_KIND) & in_section
+    # the section is activated by every tone message, even if its tone number has no tone
+    tone_number_known = value < TONE_ID_TABLE.shape[1]
+    tone_id = np.where(is_tone & tone_number_known,
+                       TONE_ID_TABLE[np.minimum(section, section_count - 1), np.where(tone_number_known, value, 0)],
+                       -1)
+    is_tone_switch = tone_id >= 0
+
+    # active tone of each section and the active section after each event
+    active_tones = np.empty((section_count, count), dtype=np.intp)
+    for section_index, section_state in enumerate(handler.sections):
+        last_switch = _last_index(is_tone_switch & (section == section_index))
+        active_tones[section_index] = np.where(last_switch >= 0, tone_id[last_switch], section_state.active_tone.id)
+    last_tone = _last_index(is_tone)
+    active_section = np.where(last_tone >= 0, section[last_tone], handler.active_section.index)
+
+    positions = np.arange(count)
+    track = np.where(is_mmc, active_tones[active_section, positions],
+                     active_tones[np.minimum(section, section_count - 1), positions])
+    output_value = np.where(is_tone_switch, 1, value) * scales[control]
+    for control_number, scale in handler.mmc_scales.items():
+        events_of_control = is_mmc & (control == control_number)
+        if toggles[control_number]:
+            # every message of a toggling control sends the current state and flips it
+            flipped = (np.cumsum(events_of_control) - 1) % 2 == 1
+            scales = np.where(flipped, 1 - scale, scale)
+        else:
+            scales = scale
+        output_value = np.where(events_of_control, scales * 127, output_value)
+
+    sent = is_mmc | is_tone_switch | is_parameter
+    outputs = np.empty(np.count_nonzero(sent), dtype=OUTPUT_DTYPE)
+    outputs['timestamp'] = events['timestamp'][sent]
+    outputs['track'] = track[sent]
+    outputs['control'] = control[sent]
+    outputs['value'] = output_value[sent]
+    return outputs
+
+
+def to_midi_messages(outputs: np.ndarray, port: int) -> np.ndarray:
+    """Returns the outputs as (port, status, data1, data2) rows like they are passed to OutputMidiMsg()"""
+    return np.stack([np.full(len(outputs), port), outputs['track'].astype(np.intp) + CC_STATUS_OFFSET,
+                     outputs['control'], outputs['value']], axis=1)
@@ -0,0 +1,348 @@
+import argparse
+import json
+import platform
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import CcReference
+import MappingCache
+from MidiOxPoller import MidiOxPoller, decode_raw
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET, CONTROL_NUMBER_DICT, REVERSE_CCS
+from SocketTransport import SocketTransport
+from ToneRouting import TONE_COUNT
+from Transport import Transport
+
+DEFAULT_THRESHOLD = 0.2
+
+
+class NullTransport(Transport):
+    """Discards all output, so that benchmarks measure the handler only"""
+
+    def __init__(self):
+        self.port_ids = {}
+
+    def send_sys_ex(self, sys_ex: str):
+        pass
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        pass
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.port_ids.setdefault(port_name, len(self.port_ids))
+
+    def get_in_port_id(self, port_name: str) -> int:
+        return self.port_ids.setdefault(port_name, len(self.port_ids)) + 1
+
+
+def _handler() -> EventHandler:
+    handler = EventHandler(transport=NullTransport())
+    # resolve the lazily built tables before timing
+    handler.cc_dispatch
+    handler.out_ports
+    return handler
+
+
+def load_reference_csv() -> Callable[[], object]:
+    return CcReference.read_reference
+
+
+def compile_reference() -> Callable[[], object]:
+    return CcReference.compile_reference
+
+
+def load_mapping_cache() -> Callable[[], object]:
+    CcReference.get_mapping()
+    return lambda: MappingCache.load(CcReference.REFERENCE_PATH, CcReference.CACHE_PATH, CcReference.compile_reference)
+
+
+def build_tables() -> Callable[[], object]:
+    return lambda: (CcReference.CcReference.get_assigned_control_numbers(),
+                    CcReference.CcReference.get_reverse_control_numbers(),
+                    CcReference.CcReference.get_cc_sys_ex_info())
+
+
+def sys_ex_input(sys_ex: str) -> Callable[[], Callable[[], object]]:
+    def setup():
+        on_sys_ex_input = _handler().OnSysExInput
+        return lambda: on_sys_ex_input(sys_ex)
+
+    return setup
+
+
+def midi_input(status: int, data1: int, port_key: str = 'loopMIDI') -> Callable[[], Callable[[], object]]:
+    def setup():
+        handler = _handler()
+        on_midi_input = handler.OnMidiInput
+        port = handler.in_ports[port_key]
+        return lambda: on_midi_input(0, port, status, data1, 64)
+
+    return setup
+
+
+# the tone is not a parameter of a tone, its SysEx has two data bytes
+TONE_PARAMETERS = sorted(REVERSE_CCS - {CONTROL_NUMBER_DICT['tone']})
+
+
+def recall_all_tones() -> Callable[[], object]:
+    handler = _handler()
+    for tone in handler.tones:
+        for control_number in TONE_PARAMETERS:
+            tone.set(control_number, 64)
+
+    def recall():
+        for tone in handler.tones:
+            handler.recall_tone(tone, force=True)
+
+    return recall
+
+
+def _drain(sock: socket.socket):
+    while sock.recv(65536):
+        pass
+
+
+def recall_parameters(count: int = 16, over_socket: bool = False, batch_size: int = None):
+    def setup():
+        if over_socket:
+            transport_socket, peer_socket = socket.socketpair()
+            threading.Thread(target=_drain, args=(peer_socket,), daemon=True).start()
+            handler = EventHandler(transport=SocketTransport(transport_socket))
+        else:
+            handler = _handler()
+        handler.recall_batch_size = batch_size
+        tone = handler.tones[0]
+        for control_number in TONE_PARAMETERS[:count]:
+            tone.set(control_number, 64)
+        return lambda: handler.recall_tone(tone, force=True)
+
+    return setup
+
+
+class RawInputMox:
+    """Delivers the same packed messages and SysEx on every drain, like the polling methods of MIDI-OX"""
+
+    def __init__(self, messages: List[int], sys_ex_strings: List[str] = ()):
+        self.messages = messages + [0]
+        self.sys_ex_strings = list(sys_ex_strings)
+        self.index = 0
+        self.sys_ex_index = 0
+
+    # noinspection PyPep8Naming
+    def GetMidiInputRaw(self) -> int:
+        message = self.messages[self.index]
+        self.index = self.index + 1 if message else 0
+        return message
+
+    # noinspection PyPep8Naming
+    def GetSysExInput(self) -> str:
+        sys_ex = self.sys_ex_strings[self.sys_ex_index]
+        self.sys_ex_index = (self.sys_ex_index + 1) % len(self.sys_ex_strings)
+        return sys_ex
+
+
+class InputMox(RawInputMox):
+    """Delivers the same messages as strings on every drain, like GetMidiInput() of MIDI-OX"""
+
+    def __init__(self, messages: List[str], sys_ex_strings: List[str] = ()):
+        super().__init__(messages, sys_ex_strings)
+        self.messages[-1] = ''
+
+    # noinspection PyPep8Naming
+    def GetMidiInput(self) -> str:
+        message = self.messages[self.index]
+        self.index = self.index + 1 if message else 0
+        return message
+
+
+def _reverse_cc_messages(count: int) -> List[int]:
+    # alternate the value so every CC changes the parameter
+    return [(CC_STATUS_OFFSET + 5) | 23 << 8 | (i % 2) << 16 for i in range(count)]
+
+
+def callback_input(count: int = 64) -> Callable[[], Callable[[], object]]:
+    """A callback per event, like MIDI-OX calls OnMidiInput() without the cost of COM"""
+    def setup():
+        handler = _handler()
+        on_midi_input = handler.OnMidiInput
+        port = handler.in_ports['loopMIDI']
+        events = [(0, port, *decode_raw(message)) for message in _reverse_cc_messages(count)]
+
+        def deliver():
+            for event in events:
+                on_midi_input(*event)
+
+        return deliver
+
+    return setup
+
+
+def polled_input(count: int = 64, raw: bool = False) -> Callable[[], Callable[[], object]]:
+    """
+    One poll that drains count messages. The strings of GetMidiInput() are what a rig with the MP11 opened in MIDI-OX
+    reads, the packed messages are only read if loopMIDI is the only input.
+    """
+    def setup():
+        handler = _handler()
+        messages = _reverse_cc_messages(count)
+        if raw:
+            return MidiOxPoller(RawInputMox(messages), handler=handler, raw=True).poll
+        port = handler.in_ports['loopMIDI']
+        strings = [f'0,{port},{status},{data1},{data2}' for status, data1, data2 in map(decode_raw, messages)]
+        return MidiOxPoller(InputMox(strings), handler=handler, raw=False).poll
+
+    return setup
+
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {
+    'cc_reference.read_csv': load_reference_csv,
+    'cc_reference.compile': compile_reference,
+    'cc_reference.load_cache': load_mapping_cache,
+    'cc_reference.build_tables': build_tables,
+    'sys_ex.mmc': sys_ex_input('F0 7F 00 06 09 F7 '),
+    'sys_ex.tone_switch': sys_ex_input('F0 40 00 10 00 12 40 02 04 02 00 11 F7 '),
+    'sys_ex.section_parameter': sys_ex_input('F0 40 00 10 00 12 40 01 70 01 40 F7 '),
+    'sys_ex.unknown': sys_ex_input('F0 7E 00 06 01 F7 '),
+    'midi.matching': midi_input(CC_STATUS_OFFSET + 5, 23),
+    'midi.non_matching': midi_input(CC_STATUS_OFFSET + 5, 23, port_key='kawai'),
+    f'recall.{TONE_COUNT}_tones': recall_all_tones,
+    'recall.16_parameters': recall_parameters(),
+    'recall.16_parameters_socket': recall_parameters(over_socket=True),
+    'recall.16_parameters_socket_unbatched': recall_parameters(over_socket=True, batch_size=1),
+    'input.callback_64': callback_input(),
+    'input.polled_64': polled_input(),
+    'input.polled_raw_64': polled_input(raw=True),
+}
+
+
+def measure(operation: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Times batches of calls that run at least min_time seconds each, returns nanoseconds per call"""
+    number = 1
+    while True:
+        elapsed = _time(operation, number)
+        if elapsed >= min_time * 1e9 or number >= 1 << 24:
+            break
+        number *= 10 if elapsed < min_time * 1e8 else 2
+    timings = sorted([elapsed] + [_time(operation, number) for _ in range(repeat - 1)])
+    return {'best_ns': timings[0] / number,
+            'median_ns': timings[len(timings) // 2] / number,
+            'number': number,
+            'repeat': repeat}
+
+
+def _time(operation: Callable[[], object], number: int) -> int:
+    clock = time.perf_counter_ns
+    start = clock()
+    for _ in range(number):
+        operation()
+    return clock() - start
+
+
+# benchmarks of the per-event paths, whose allocations are checked against budgets
+ALLOCATION_BENCHMARKS = ['sys_ex.mmc', 'sys_ex.tone_switch', 'sys_ex.section_parameter', 'sys_ex.unknown',
+                         'midi.matching', 'midi.non_matching', 'recall.16_parameters']
+
+
+def measure_allocations(operation: Callable[[], object], number: int = 1000, warm_up: int = 4096) -> dict:
+    """
+    Traces the memory allocated by single calls, returns the largest peak above the memory in use before a call and
+    the memory still in use after number calls per call. The warm up calls fill caches and the free lists of the
+    interpreter, which would otherwise look like retained memory.
+    """
+    for _ in range(warm_up):
+        operation()
+    get_traced_memory = tracemalloc.get_traced_memory
+    reset_peak = tracemalloc.reset_peak
+    peak_bytes = 0
+    tracemalloc.start()
+    try:
+        start = get_traced_memory()[0]
+        for _ in range(number):
+            before = get_traced_memory()[0]
+            reset_peak()
+            operation()
+            peak_bytes = max(peak_bytes, get_traced_memory()[1] - before)
+        retained = get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes': peak_bytes, 'retained_bytes': retained / number, 'number': number}
+
+
+def run_allocations(names: List[str] = None, number: int = 1000) -> dict:
+    return {'python': platform.python_version(),
+            'results': {name: measure_allocations(BENCHMARKS[name](), number=number)
+                        for name in names or ALLOCATION_BENCHMARKS}}
+
+
+def run(names: List[str] = None, repeat: int = 5, min_time: float = 0.2) -> dict:
+    return {'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': {name: measure(BENCHMARKS[name](), repeat=repeat, min_time=min_time)
+                        for name in names or BENCHMARKS}}
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """Compares the best times of all benchmarks in both runs, a ratio above 1 + threshold is a regression"""
+    comparisons = []
+    for name, result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if baseline_result is None:
+            continue
+        ratio = result['best_ns'] / baseline_result['best_ns']
+        comparisons.append({'name': name,
+                            'baseline_ns': baseline_result['best_ns'],
+                            'current_ns': result['best_ns'],
+                            'ratio': ratio,
+                            'regression': ratio > 1 + threshold})
+    return comparisons
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the CC reference loading and the EventHandler')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--output', help='file for the results, printed if not given')
+    compare_parser = subparsers.add_parser('compare', help='compare against a baseline, fail on regressions')
+    compare_parser.add_argument('baseline', help='results written by run')
+    compare_parser.add_argument('current', nargs='?', help='results written by run, run now if not given')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='allowed slowdown as fraction of the baseline time')
+    allocations_parser = subparsers.add_parser('allocations', help='trace the allocations of the per-event paths')
+    allocations_parser.add_argument('--benchmark', action='append', choices=ALLOCATION_BENCHMARKS, dest='names')
+    allocations_parser.add_argument('--number', type=int, default=1000, help='traced calls per benchmark')
+    for subparser in [run_parser, compare_parser]:
+        subparser.add_argument('--benchmark', action='append', choices=list(BENCHMARKS), dest='names')
+        subparser.add_argument('--repeat', type=int, default=5)
+        subparser.add_argument('--min-time', type=float, default=0.2, help='seconds per timed batch')
+    arguments = parser.parse_args(args)
+    if arguments.command == 'allocations':
+        print(json.dumps(run_allocations(arguments.names, arguments.number), indent=2))
+        return 0
+    if arguments.command == 'run':
+        results = json.dumps(run(arguments.names, arguments.repeat, arguments.min_time), indent=2)
+        if arguments.output is None:
+            print(results)
+        else:
+            with open(arguments.output, 'w') as file:
+                file.write(results)
+        return 0
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    if arguments.current is None:
+        current = run(arguments.names or [name for name in baseline['results'] if name in BENCHMARKS],
+                      arguments.repeat, arguments.min_time)
+    else:
+        with open(arguments.current) as file:
+            current = json.load(file)
+    comparisons = compare(baseline, current, arguments.threshold)
+    for comparison in comparisons:
+        print(f"{comparison['name']:<28} {comparison['baseline_ns']:>14.0f} ns {comparison['current_ns']:>14.0f} ns "
+              f"{comparison['ratio']:>6.2f}x{'  REGRESSION' if comparison['regression'] else ''}")
+    return 1 if any(comparison['regression'] for comparison in comparisons) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
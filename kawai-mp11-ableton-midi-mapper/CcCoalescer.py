@@ -0,0 +1,110 @@
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+
+class CcCoalescer:
+    """
+    Rate limits parameter changes per key. Within the minimum interval of a key only its latest value is kept and
+    delivered when the interval has passed, values equal to the last delivered one are dropped. Pending values are
+    delivered by flush_due(), which runs on every submit and, after start(), on a background thread.
+    """
+
+    def __init__(self, max_rate: float, clock=time.monotonic):
+        self.max_rate = max_rate
+        self.min_interval = 1 / max_rate
+        self.clock = clock
+        self.deliver: Optional[Callable[[Hashable, int], None]] = None
+        self.last_values: Dict[Hashable, int] = {}
+        self.last_times: Dict[Hashable, float] = {}
+        # key -> (value, due time)
+        self.pending: Dict[Hashable, tuple] = {}
+        self.dropped = 0
+        self.delivered = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def attach(self, deliver: Callable[[Hashable, int], None], lock=None):
+        """Delivers values with deliver(), while holding lock if given, which then also guards the coalescer"""
+        self.deliver = deliver
+        if lock is not None:
+            self.condition = threading.Condition(lock)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.pending)
+
+    def submit(self, key: Hashable, value: int):
+        now = self.clock()
+        with self.condition:
+            self._flush_due(now)
+            if key in self.pending:
+                # the pending value is superseded either way
+                self.dropped += 1
+                if value == self.last_values.get(key):
+                    del self.pending[key]
+                else:
+                    self.pending[key] = (value, self.pending[key][1])
+                return
+            if value == self.last_values.get(key):
+                self.dropped += 1
+                return
+            due = self.last_times.get(key, now - self.min_interval) + self.min_interval
+            if due <= now:
+                self._deliver(key, value, now)
+            else:
+                self.pending[key] = (value, due)
+                self.condition.notify()
+
+    def invalidate(self, key: Hashable):
+        """Forgets the last delivered value of the key, e.g. because the receiver changed it by itself"""
+        with self.condition:
+            self.last_values.pop(key, None)
+
+    def flush_due(self) -> Optional[float]:
+        with self.condition:
+            return self._flush_due(self.clock())
+
+    def flush(self):
+        with self.condition:
+            for key, (value, _) in list(self.pending.items()):
+                self._deliver(key, value, self.clock())
+            self.pending.clear()
+
+    def _flush_due(self, now: float) -> Optional[float]:
+        """Delivers all pending values that are due and returns the due time of the next one"""
+        next_due = None
+        for key, (value, due) in list(self.pending.items()):
+            if due <= now:
+                del self.pending[key]
+                self._deliver(key, value, now)
+            elif next_due is None or due < next_due:
+                next_due = due
+        return next_due
+
+    def _deliver(self, key: Hashable, value: int, now: float):
+        self.last_values[key] = value
+        self.last_times[key] = now
+        self.delivered += 1
+        self.deliver(key, value)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='CcCoalescer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _run(self):
+        with self.condition:
+            while self.running:
+                next_due = self._flush_due(self.clock())
+                self.condition.wait(None if next_due is None else max(0.0, next_due - self.clock()))
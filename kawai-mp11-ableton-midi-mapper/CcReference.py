@@ -1,35 +1,98 @@
+import math
 import os
-from typing import Dict
-
-import pandas as pd
+from typing import Dict, List, Tuple
 
+import MappingCache
 from SysExInfo import SysExInfo
 from consts import KAWAI_SECTION_NAMES
 
-data = pd.read_csv(os.path.join(os.path.dirname(__file__), r'..\resources\cc_midi_reference.csv'), sep=';')
-data[['scale', 'Decimal']] = data[['scale', 'Decimal']].fillna(-1).astype('int32')
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), '..', 'resources', 'cc_midi_reference.csv')
+CACHE_PATH = os.path.join(os.path.dirname(__file__), '..', 'resources', 'cc_midi_reference.cache.json')
+
+
+def read_reference(path: str = REFERENCE_PATH):
+    # pandas is only needed to compile the mapping cache
+    import pandas as pd
+    reference = pd.read_csv(path, sep=';')
+    reference[['scale', 'Decimal']] = reference[['scale', 'Decimal']].fillna(-1).astype('int32')
+    return reference
+
+
+def __getattr__(name):
+    if name == 'data':
+        globals()['data'] = read_reference()
+        return globals()['data']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def is_present(value) -> bool:
+    # empty cells are read as NaN
+    return not (isinstance(value, float) and math.isnan(value))
+
+
+def compile_row(row: dict) -> dict:
+    """Compiles the entries one row of the reference contributes to the mapping"""
+    control_number = int(row['Decimal'])
+    name = row['mapping'] if is_present(row['mapping']) else None
+    info = {'name': name, 'control_number': control_number, 'scale': int(row['scale'])}
+    section_sys_ex_strings = [row[f'SysEx {section_name}'] for section_name in KAWAI_SECTION_NAMES]
+    return {'name': name,
+            'control_number': control_number,
+            'reverse': row['reverse mapping'] == 1,
+            'simple_sys_ex_info': {**info, 'sys_ex_strings': [row['SysEx PIANO']]}
+            if row['SysEx type'] == 'MMC' else None,
+            'prefix_sys_ex_info': {**info, 'sys_ex_strings': section_sys_ex_strings}
+            if row['SysEx type'] == 'section' else None}
+
+
+def assemble(rows: List[dict]) -> dict:
+    """Combines compiled rows into the mapping"""
+    return {
+        'assigned_control_numbers': {row['name']: row['control_number'] for row in rows if row['name'] is not None},
+        'reverse_control_numbers': sorted({row['control_number'] for row in rows if row['reverse']}),
+        'simple_sys_ex_info': [row['simple_sys_ex_info'] for row in rows if row['simple_sys_ex_info'] is not None],
+        'prefix_sys_ex_info': [row['prefix_sys_ex_info'] for row in rows if row['prefix_sys_ex_info'] is not None],
+    }
+
+
+def compile_reference(path: str = REFERENCE_PATH) -> dict:
+    return assemble([compile_row(row) for row in read_reference(path).to_dict('records')])
+
+
+_mapping = None
+
+
+def get_mapping() -> dict:
+    global _mapping
+    if _mapping is None:
+        _mapping = MappingCache.load(REFERENCE_PATH, CACHE_PATH, compile_reference)
+    return _mapping
+
+
+def build_mapping() -> dict:
+    global _mapping
+    _mapping = MappingCache.build(REFERENCE_PATH, CACHE_PATH, compile_reference)
+    return _mapping
 
 
 class CcReference:
     @staticmethod
     def get_assigned_control_numbers() -> Dict[str, int]:
-        return {row['mapping']: row['Decimal'] for i, row in
-                data[data['mapping'].notna()][['mapping', 'Decimal']].iterrows()}
+        return dict(get_mapping()['assigned_control_numbers'])
 
     @staticmethod
     def get_reverse_control_numbers():
-        return set(data[data['reverse mapping'] == 1]['Decimal'])
+        return set(get_mapping()['reverse_control_numbers'])
 
     @staticmethod
     def get_cc_sys_ex_info():
-        simple_info = [SysExInfo(name=row['mapping'],
-                                 control_number=row['Decimal'],
-                                 scale=row['scale'],
-                                 sys_ex_strings=[row['SysEx PIANO']])
-                       for _, row in data[data['SysEx type'] == 'MMC'].iterrows()]
-        prefix_info = [SysExInfo(name=row['mapping'],
-                                 control_number=row['Decimal'],
-                                 scale=row['scale'],
-                                 sys_ex_strings=[row[f'SysEx {name}'] for name in KAWAI_SECTION_NAMES])
-                       for _, row in data[data['SysEx type'] == 'section'].iterrows()]
-        return simple_info, prefix_info
+        return sys_ex_info(get_mapping())
+
+
+def sys_ex_info(mapping: dict) -> Tuple[List[SysExInfo], List[SysExInfo]]:
+    """Returns new SysExInfo objects for the MMC and the section messages of the mapping"""
+    simple_info = [SysExInfo(**{**info, 'sys_ex_strings': list(info['sys_ex_strings'])})
+                   for info in mapping['simple_sys_ex_info']]
+    prefix_info = [SysExInfo(**{**info, 'sys_ex_strings': list(info['sys_ex_strings'])})
+                   for info in mapping['prefix_sys_ex_info']]
+    return simple_info, prefix_info
@@ -0,0 +1,43 @@
+import threading
+import time
+from typing import Dict, Hashable
+
+# status used in keys of SysEx parameter messages, whose control is the address of the parameter
+SYS_EX_STATUS = 0xF0
+
+
+class EchoSuppressor:
+    """
+    Remembers the (port name, status, control, value) of sent messages for ttl seconds. An incoming message with the
+    same key within that time is taken as echo of the sent one and consumed. Expired keys are purged every
+    purge_interval expectations.
+    """
+
+    def __init__(self, ttl: float = 0.05, clock=time.monotonic, purge_interval: int = 1024):
+        self.ttl = ttl
+        self.clock = clock
+        self.purge_interval = purge_interval
+        # key -> expiry time
+        self.expected: Dict[Hashable, float] = {}
+        self.expectations = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def expect(self, key: Hashable):
+        now = self.clock()
+        with self.lock:
+            self.expected[key] = now + self.ttl
+            self.expectations += 1
+            if self.expectations % self.purge_interval == 0:
+                self.expected = {key: expiry for key, expiry in self.expected.items() if expiry >= now}
+
+    def is_echo(self, key: Hashable) -> bool:
+        with self.lock:
+            expiry = self.expected.pop(key, None)
+            if expiry is None or expiry < self.clock():
+                return False
+            self.suppressed += 1
+            return True
+
+    def __len__(self):
+        return len(self.expected)
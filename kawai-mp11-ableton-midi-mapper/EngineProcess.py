@@ -0,0 +1,338 @@
+import argparse
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET, DEFAULT_OUT_PORT_NAMES, DEFAULT_IN_PORT_NAMES
+from Transport import Transport, LoopbackTransport, SYS_EX
+
+logger = logging.getLogger(__name__)
+
+# record kinds
+MIDI_RECORD = 1
+SYS_EX_RECORD = 2
+# a SysEx of a batch that is followed by more SysEx of the same batch
+SYS_EX_BATCH_RECORD = 3
+
+# kind, port, payload length, timestamp in ms
+RECORD_HEADER = struct.Struct('<BBHi')
+RECORD_SIZE = 64
+# head and tail are on separate cache lines, so that producer and consumer do not write to the same line
+HEAD = 0
+TAIL = 8
+INDICES_SIZE = 128
+
+
+class RingBuffer:
+    """
+    Single-producer/single-consumer ring of fixed-size records in shared memory. The producer only writes the head
+    index and the consumer only writes the tail index, both count records and never wrap. A record is written before
+    the head is advanced past it and copied out before the tail is, so no lock is needed.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, capacity: int, record_size: int = RECORD_SIZE,
+                 owner: bool = False):
+        self.memory = memory
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.record_size = record_size
+        self.max_payload = record_size - RECORD_HEADER.size
+        self.owner = owner
+        self.buffer = memory.buf
+        self.indices = memory.buf[:INDICES_SIZE].cast('Q')
+
+    @classmethod
+    def create(cls, capacity: int = 4096, record_size: int = RECORD_SIZE) -> 'RingBuffer':
+        if capacity & (capacity - 1):
+            raise ValueError(f'capacity {capacity} is not a power of 2')
+        memory = shared_memory.SharedMemory(create=True, size=INDICES_SIZE + capacity * record_size)
+        memory.buf[:INDICES_SIZE] = bytes(INDICES_SIZE)
+        return cls(memory, capacity, record_size, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, capacity: int, record_size: int = RECORD_SIZE) -> 'RingBuffer':
+        return cls(shared_memory.SharedMemory(name=name), capacity, record_size)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def __len__(self):
+        return self.indices[HEAD] - self.indices[TAIL]
+
+    def put(self, kind: int, port: int, timestamp: int, payload: bytes) -> bool:
+        """Writes a record, returns False if the ring is full"""
+        indices = self.indices
+        head = indices[HEAD]
+        if head - indices[TAIL] >= self.capacity:
+            return False
+        offset = INDICES_SIZE + (head & self.mask) * self.record_size
+        RECORD_HEADER.pack_into(self.buffer, offset, kind, port, len(payload), timestamp)
+        start = offset + RECORD_HEADER.size
+        self.buffer[start:start + len(payload)] = payload
+        indices[HEAD] = head + 1
+        return True
+
+    def drain(self, limit: int = None) -> List[Tuple[int, int, int, bytes]]:
+        """Copies out all available records, at most limit, as (kind, port, timestamp, payload)"""
+        indices = self.indices
+        tail = indices[TAIL]
+        head = indices[HEAD]
+        if limit is not None:
+            head = min(head, tail + limit)
+        buffer = self.buffer
+        records = []
+        while tail != head:
+            offset = INDICES_SIZE + (tail & self.mask) * self.record_size
+            kind, port, length, timestamp = RECORD_HEADER.unpack_from(buffer, offset)
+            start = offset + RECORD_HEADER.size
+            records.append((kind, port, timestamp, bytes(buffer[start:start + length])))
+            tail += 1
+        indices[TAIL] = tail
+        return records
+
+    def close(self):
+        # views into the shared memory have to be released before it can be closed
+        self.indices.release()
+        self.buffer = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class Poller:
+    """Waits for records without a syscall per event: spins while records keep coming, then sleeps interval"""
+
+    def __init__(self, ring: RingBuffer, spins: int = 1000, interval: float = 0.0005):
+        self.ring = ring
+        self.spins = spins
+        self.interval = interval
+        self.idle = 0
+
+    def poll(self) -> List[Tuple[int, int, int, bytes]]:
+        records = self.ring.drain()
+        if records:
+            self.idle = 0
+        else:
+            self.idle += 1
+            time.sleep(0 if self.idle < self.spins else self.interval)
+        return records
+
+
+class RingTransport(Transport):
+    """Transport of the worker process, writes the output of the handler to the output ring"""
+
+    def __init__(self, ring: RingBuffer, out_port_ids: Dict[str, int], in_port_ids: Dict[str, int]):
+        self.ring = ring
+        self.out_port_ids = out_port_ids
+        self.in_port_ids = in_port_ids
+
+    def send_sys_ex(self, sys_ex: str):
+        self._put(SYS_EX_RECORD, 0, sys_ex.encode('ascii'))
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        batch_size = batch_size or len(sys_ex_list)
+        for start in range(0, len(sys_ex_list), batch_size):
+            if start and gap:
+                time.sleep(gap)
+            batch = sys_ex_list[start:start + batch_size]
+            for sys_ex in batch[:-1]:
+                self._put(SYS_EX_BATCH_RECORD, 0, sys_ex.encode('ascii'))
+            self._put(SYS_EX_RECORD, 0, batch[-1].encode('ascii'))
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self._put(MIDI_RECORD, port, bytes((status, data1, data2)))
+
+    def _put(self, kind: int, port: int, payload: bytes):
+        if len(payload) > self.ring.max_payload:
+            raise ValueError(f'{payload!r} does not fit into a record')
+        # the shim drains the output continuously, so a full ring only means waiting briefly
+        while not self.ring.put(kind, port, 0, payload):
+            time.sleep(0)
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.out_port_ids[port_name]
+
+    def get_in_port_id(self, port_name: str) -> int:
+        return self.in_port_ids[port_name]
+
+
+def run_engine(input_name: str, output_name: str, capacity: int, out_port_ids: Dict[str, int],
+               in_port_ids: Dict[str, int], stop, ready, handler_kwargs: dict):
+    """Runs the handler in the worker process on the input records until stop is set and the input ring is drained"""
+    input_ring = RingBuffer.attach(input_name, capacity)
+    output_ring = RingBuffer.attach(output_name, capacity)
+    handler = EventHandler(transport=RingTransport(output_ring, out_port_ids, in_port_ids), **handler_kwargs)
+    handler.warm_up()
+    ready.set()
+    poller = Poller(input_ring)
+    try:
+        while True:
+            # the input written before stop was set is still handled
+            stopping = stop.is_set()
+            for kind, port, timestamp, payload in poller.poll():
+                try:
+                    if kind == MIDI_RECORD:
+                        status, data1, data2 = payload
+                        handler.OnMidiInput(timestamp, port, status, data1, data2)
+                    else:
+                        handler.OnSysExInput(payload)
+                except Exception:
+                    logger.exception('failed to handle %s', payload)
+            if stopping:
+                break
+    finally:
+        input_ring.close()
+        output_ring.close()
+
+
+class EngineProcess:
+    """
+    Runs the EventHandler in a worker process and keeps only a thin shim on the transport: input events are written
+    to an input ring, a thread sends the records of the output ring through the transport. Port IDs are resolved
+    before the worker starts. Input that does not fit into a full input ring is dropped and counted.
+    """
+
+    def __init__(self, transport: Transport, capacity: int = 4096, out_port_names: Dict[str, str] = None,
+                 in_port_names: Dict[str, str] = None, **handler_kwargs):
+        self.transport = transport
+        self.capacity = capacity
+        out_port_names = dict(out_port_names or DEFAULT_OUT_PORT_NAMES)
+        in_port_names = dict(in_port_names or DEFAULT_IN_PORT_NAMES)
+        self.handler_kwargs = dict(handler_kwargs, out_port_names=out_port_names, in_port_names=in_port_names)
+        self.out_port_ids = {name: transport.get_out_port_id(name) for name in out_port_names.values()}
+        self.in_port_ids = {name: transport.get_in_port_id(name) for name in in_port_names.values()}
+        self.input_ring: Optional[RingBuffer] = None
+        self.output_ring: Optional[RingBuffer] = None
+        self.process = None
+        self.thread = None
+        self.stop_event = multiprocessing.Event()
+        self.stop_sending = threading.Event()
+        self.dropped = 0
+
+    def start(self, timeout: float = 10):
+        self.input_ring = RingBuffer.create(self.capacity)
+        self.output_ring = RingBuffer.create(self.capacity)
+        ready = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=run_engine, name='EngineProcess', daemon=True,
+            args=(self.input_ring.name, self.output_ring.name, self.capacity, self.out_port_ids, self.in_port_ids,
+                  self.stop_event, ready, self.handler_kwargs))
+        self.process.start()
+        if not ready.wait(timeout):
+            self.close()
+            raise RuntimeError('engine process did not start')
+        self.thread = threading.Thread(target=self._send_output, args=(self.transport.for_thread(),),
+                                       name='EngineProcess', daemon=True)
+        self.thread.start()
+        # attach last, input is only accepted once the worker reads it
+        self.transport.attach(self)
+
+    # noinspection PyPep8Naming
+    def OnSysExInput(self, bStrSysEx):
+        sys_ex = bytes.fromhex(bStrSysEx) if isinstance(bStrSysEx, str) else bStrSysEx
+        max_payload = self.input_ring.max_payload
+        # long SysEx is split into several records, the handler reassembles it
+        for start in range(0, len(sys_ex), max_payload):
+            self._put(SYS_EX_RECORD, 0, 0, sys_ex[start:start + max_payload])
+
+    # noinspection PyPep8Naming
+    def OnMidiInput(self, nTimestamp, port, status, data1, data2):
+        self._put(MIDI_RECORD, port, nTimestamp, bytes((status, data1, data2)))
+
+    def _put(self, kind: int, port: int, timestamp: int, payload: bytes):
+        if not self.input_ring.put(kind, port, timestamp, payload):
+            self.dropped += 1
+            logger.warning('engine input ring is full, dropped %s', payload)
+
+    def _refuse(self, kind: int, port: int, timestamp: int, payload: bytes):
+        self.dropped += 1
+        logger.warning('engine process is closing, dropped %s', payload)
+
+    def _send_output(self, create_transport):
+        transport = create_transport()
+        poller = Poller(self.output_ring)
+        batch = []
+        while True:
+            # the output the worker wrote before it exited is still sent
+            stopping = self.stop_sending.is_set()
+            for kind, port, _, payload in poller.poll():
+                try:
+                    if kind == MIDI_RECORD:
+                        transport.output_midi_msg(port, *payload)
+                    elif kind == SYS_EX_BATCH_RECORD:
+                        batch.append(payload.decode('ascii'))
+                    elif batch:
+                        batch.append(payload.decode('ascii'))
+                        transport.send_sys_ex_batch(batch)
+                        batch = []
+                    else:
+                        transport.send_sys_ex(payload.decode('ascii'))
+                except Exception:
+                    logger.exception('failed to send %s', payload)
+            if stopping:
+                break
+        if transport is not self.transport:
+            transport.close()
+
+    def close(self):
+        """Refuses further input, lets the worker handle the pending input and sends all of its output"""
+        self._put = self._refuse
+        self.stop_event.set()
+        if self.process is not None:
+            self.process.join()
+            self.process = None
+        self.stop_sending.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for ring in [self.input_ring, self.output_ring]:
+            if ring is not None:
+                ring.close()
+        self.input_ring = self.output_ring = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def benchmark(count: int = 10000) -> List[float]:
+    """Measures the round trip from a CC through the worker process to the SysEx it sends back, in seconds"""
+    transport = LoopbackTransport()
+    with EngineProcess(transport):
+        # activate tone 5 in a single section, so that every CC results in exactly one SysEx
+        transport.inject_midi(DEFAULT_IN_PORT_NAMES['loopMIDI'], CC_STATUS_OFFSET + 5, 23, 1)
+        while len(transport.sent) < 2:
+            time.sleep(0)
+        round_trips = []
+        for i in range(count):
+            sent_count = len(transport.sent)
+            sent = time.perf_counter()
+            # alternate the value so every CC changes the parameter
+            transport.inject_midi(DEFAULT_IN_PORT_NAMES['loopMIDI'], CC_STATUS_OFFSET + 5, 23, i % 2)
+            while len(transport.sent) == sent_count:
+                time.sleep(0)
+            received, kind, _ = transport.sent[-1]
+            assert kind == SYS_EX
+            round_trips.append(received - sent)
+    return round_trips
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the crossing into the engine process and back')
+    parser.add_argument('--count', type=int, default=10000)
+    arguments = parser.parse_args(args)
+    round_trips = sorted(benchmark(arguments.count))
+    print(f'{len(round_trips)} round trips, p50 {round_trips[len(round_trips) // 2] * 1e6:.1f} us, '
+          f'p99 {round_trips[int(len(round_trips) * 0.99)] * 1e6:.1f} us, max {round_trips[-1] * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
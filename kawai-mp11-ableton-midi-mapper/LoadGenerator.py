@@ -0,0 +1,256 @@
+import argparse
+import dataclasses as dc
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from Benchmarks import NullTransport
+from MappingTables import MappingTables
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from SessionReplay import percentile
+from Transport import SYS_EX, MIDI
+
+TONE_SWITCH = 'tone_switch'
+PARAMETER = 'parameter'
+MMC = 'mmc'
+AUTOMATION = 'automation'
+DEFAULT_MIX = {TONE_SWITCH: 1, PARAMETER: 10, MMC: 1, AUTOMATION: 20}
+MIDI_CHANNELS = 16
+
+
+@dc.dataclass
+class LoadProfile:
+    # mean events per second
+    rate: float = 1000
+    duration: float = 60
+    # relative weight of each event class
+    mix: Dict[str, float] = dc.field(default_factory=lambda: dict(DEFAULT_MIX))
+    # events are sent in bursts of burst_size events, burst_spacing seconds apart within a burst
+    burst_size: int = 1
+    burst_spacing: float = 0
+    # seconds per window of the report
+    window: float = 10
+    # seconds of back to back events to measure the throughput ceiling
+    ceiling_duration: float = 1
+    seed: int = 0
+
+
+class CountingTransport(NullTransport):
+    """Counts the output instead of keeping it, so that the memory of the bridge is measured only"""
+
+    def __init__(self):
+        super().__init__()
+        self.sys_ex_count = 0
+        self.midi_count = 0
+
+    def send_sys_ex(self, sys_ex: str):
+        self.sys_ex_count += 1
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.midi_count += 1
+
+
+@dc.dataclass
+class WindowStats:
+    start: float = 0
+    events: int = 0
+    # time spent in the handler per event
+    p50_ns: int = 0
+    p99_ns: int = 0
+    # delay from the scheduled time of an event until it was handled
+    max_lag_ns: int = 0
+    # memory blocks allocated by the interpreter at the end of the window
+    allocated_blocks: int = 0
+
+
+@dc.dataclass
+class LoadReport:
+    rate: float = 0
+    events: int = 0
+    outputs: int = 0
+    ceiling: float = 0
+    windows: List[WindowStats] = dc.field(default_factory=list)
+
+    @property
+    def headroom(self) -> float:
+        """Throughput ceiling as multiple of the offered rate"""
+        return self.ceiling / self.rate if self.rate else 0
+
+    @property
+    def latency_drift_ns(self) -> int:
+        """Change of the p99 latency from the first to the last window"""
+        return self.windows[-1].p99_ns - self.windows[0].p99_ns if self.windows else 0
+
+    @property
+    def block_growth(self) -> int:
+        """Change of the allocated memory blocks from the first to the last window"""
+        return self.windows[-1].allocated_blocks - self.windows[0].allocated_blocks if self.windows else 0
+
+    def __str__(self):
+        lines = [f'{self.events} events at {self.rate:.0f}/s, {self.outputs} outputs, ceiling {self.ceiling:.0f} '
+                 f'events/s ({self.headroom:.1f}x headroom), p99 drift {self.latency_drift_ns / 1000:+.1f} us, '
+                 f'memory growth {self.block_growth:+d} blocks']
+        for window in self.windows:
+            lines.append(f'{window.start:8.1f} s {window.events:8d} events, p50 {window.p50_ns / 1000:.1f} us, '
+                         f'p99 {window.p99_ns / 1000:.1f} us, max lag {window.max_lag_ns / 1000:.1f} us, '
+                         f'{window.allocated_blocks} blocks')
+        return '\n'.join(lines)
+
+
+def generate(tables: MappingTables, in_port: int, mix: Dict[str, float] = None, count: int = 65536,
+             seed: int = 0) -> List[Tuple[str, tuple]]:
+    """
+    Generates input events from the mapping: tone switches of all sections, value sweeps of every section parameter,
+    MMC messages from the mp11 and CC automation from ableton on all 16 channels
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    tone_control_number = tables.control_number_dict['tone']
+    parameter_addresses = [address for control_number, addresses in tables.recall_addresses.items()
+                           if control_number != tone_control_number for address in addresses]
+    mmc_sys_ex = [info.sys_ex_strings[0] for info in tables.simple_sys_ex_info]
+    automation_controls = sorted(tables.reverse_ccs - {tone_control_number})
+    # every parameter and CC is swept through its values
+    sweeps: Dict[tuple, int] = {}
+
+    def sweep(key: tuple) -> int:
+        value = sweeps[key] = (sweeps.get(key, rng.randrange(128)) + 1) % 128
+        return value
+
+    events = []
+    for event_class in rng.choices(list(mix), weights=list(mix.values()), k=count):
+        if event_class == TONE_SWITCH:
+            section_sys_ex = rng.choice(tables.tone_activation_sys_ex)
+            events.append((SYS_EX, (rng.choice(section_sys_ex),)))
+        elif event_class == PARAMETER:
+            address = rng.choice(parameter_addresses)
+            events.append((SYS_EX, (tables.parameter_sys_ex[address][sweep((address,))],)))
+        elif event_class == MMC:
+            events.append((SYS_EX, (rng.choice(mmc_sys_ex),)))
+        elif event_class == AUTOMATION:
+            status = CC_STATUS_OFFSET + rng.randrange(MIDI_CHANNELS)
+            control_number = rng.choice(automation_controls)
+            events.append((MIDI, (0, in_port, status, control_number, sweep((status, control_number)))))
+        else:
+            raise ValueError(f'unknown event class {event_class}')
+    return events
+
+
+def measure_ceiling(handler: EventHandler, events: List[Tuple[str, tuple]], duration: float = 1) -> float:
+    """Handles the events back to back for duration seconds, returns the events per second"""
+    on_sys_ex_input = handler.OnSysExInput
+    on_midi_input = handler.OnMidiInput
+    clock = time.perf_counter
+    handled = 0
+    start = clock()
+    end = start + duration
+    while True:
+        for chunk_start in range(0, len(events), 1024):
+            chunk = events[chunk_start:chunk_start + 1024]
+            for kind, message in chunk:
+                if kind == SYS_EX:
+                    on_sys_ex_input(*message)
+                else:
+                    on_midi_input(*message)
+            handled += len(chunk)
+            now = clock()
+            if now >= end:
+                return handled / (now - start)
+
+
+def drive(handler: EventHandler, events: List[Tuple[str, tuple]], profile: LoadProfile) -> List[WindowStats]:
+    """Sends the events to the handler on the schedule of the profile, cycling through them, for its duration"""
+    on_sys_ex_input = handler.OnSysExInput
+    on_midi_input = handler.OnMidiInput
+    clock = time.perf_counter_ns
+    burst_period_ns = profile.burst_size * 1e9 / profile.rate
+    spacing_ns = profile.burst_spacing * 1e9
+    window_ns = profile.window * 1e9
+    total = int(profile.rate * profile.duration)
+    windows = []
+    latencies = []
+    max_lag = 0
+    window_end = window_ns
+    start = clock()
+    for i in range(total):
+        burst, position = divmod(i, profile.burst_size)
+        scheduled = int(burst * burst_period_ns + position * spacing_ns)
+        if scheduled >= window_end:
+            windows.append(_window_stats(window_end - window_ns, latencies, max_lag))
+            latencies = []
+            max_lag = 0
+            window_end += window_ns
+        scheduled += start
+        wait = scheduled - clock()
+        if wait > 1_000_000:
+            # sleep coarsely, then spin to the scheduled time
+            time.sleep((wait - 500_000) / 1e9)
+        while clock() < scheduled:
+            pass
+        kind, message = events[i % len(events)]
+        t0 = clock()
+        if kind == SYS_EX:
+            on_sys_ex_input(*message)
+        else:
+            on_midi_input(*message)
+        latencies.append(clock() - t0)
+        max_lag = max(max_lag, t0 - scheduled)
+    if latencies:
+        windows.append(_window_stats(window_end - window_ns, latencies, max_lag))
+    return windows
+
+
+def _window_stats(start_ns: float, latencies: List[int], max_lag: int) -> WindowStats:
+    latencies.sort()
+    return WindowStats(start=start_ns / 1e9, events=len(latencies), p50_ns=percentile(latencies, 0.5),
+                       p99_ns=percentile(latencies, 0.99), max_lag_ns=max_lag, allocated_blocks=sys.getallocatedblocks())
+
+
+def run(profile: LoadProfile, handler_factory: Callable[..., EventHandler] = EventHandler) -> LoadReport:
+    """Measures the throughput ceiling on one handler, then drives a fresh handler at the rate of the profile"""
+    ceiling_handler = handler_factory(transport=CountingTransport())
+    ceiling_handler.warm_up()
+    events = generate(ceiling_handler.tables, ceiling_handler.in_ports['loopMIDI'], profile.mix,
+                      count=max(1024, min(65536, int(profile.rate * profile.duration))), seed=profile.seed)
+    ceiling = measure_ceiling(ceiling_handler, events, profile.ceiling_duration)
+    transport = CountingTransport()
+    handler = handler_factory(transport=transport)
+    handler.warm_up()
+    windows = drive(handler, events, profile)
+    return LoadReport(rate=profile.rate, events=sum(window.events for window in windows),
+                      outputs=transport.sys_ex_count + transport.midi_count, ceiling=ceiling, windows=windows)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parses weights like tone_switch=1,parameter=10"""
+    weights = {}
+    for item in mix.split(','):
+        event_class, weight = item.split('=')
+        if event_class not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown event class {event_class}')
+        weights[event_class] = float(weight)
+    return weights
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Drive generated traffic into the EventHandler and report headroom')
+    parser.add_argument('--rate', type=float, default=1000, help='mean events per second')
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help=f'weights of the event classes, default '
+                             f'{",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items())}')
+    parser.add_argument('--burst-size', type=int, default=1, help='events per burst')
+    parser.add_argument('--burst-spacing', type=float, default=0, help='seconds between the events of a burst')
+    parser.add_argument('--window', type=float, default=10, help='seconds per report window')
+    parser.add_argument('--ceiling-duration', type=float, default=1, help='seconds to measure the ceiling')
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args(args)
+    print(run(LoadProfile(rate=arguments.rate, duration=arguments.duration, mix=arguments.mix,
+                          burst_size=arguments.burst_size, burst_spacing=arguments.burst_spacing,
+                          window=arguments.window, ceiling_duration=arguments.ceiling_duration, seed=arguments.seed)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+from typing import Callable
+
+CACHE_VERSION = 1
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def load(source_path: str, cache_path: str, compile_source: Callable[[], dict]) -> dict:
+    """
+    Returns the compiled mapping of the source file from the cache. The cache is valid as long as the modification time
+    and size of the source are unchanged or, if they differ, its content hash still matches. Otherwise the mapping is
+    compiled again and written to the cache.
+    """
+    stat = os.stat(source_path)
+    cached = _read(cache_path)
+    if cached is not None and cached.get('version') == CACHE_VERSION:
+        if cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+            return cached['mapping']
+        if cached['hash'] == file_hash(source_path):
+            _write(cache_path, {**cached, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+            return cached['mapping']
+    return build(source_path, cache_path, compile_source)
+
+
+def build(source_path: str, cache_path: str, compile_source: Callable[[], dict]) -> dict:
+    stat = os.stat(source_path)
+    mapping = compile_source()
+    _write(cache_path, {'version': CACHE_VERSION,
+                        'hash': file_hash(source_path),
+                        'mtime_ns': stat.st_mtime_ns,
+                        'size': stat.st_size,
+                        'mapping': mapping})
+    return mapping
+
+
+def _read(cache_path: str):
+    try:
+        with open(cache_path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(cache_path: str, cached: dict):
+    temp_path = f'{cache_path}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(cached, file, separators=(',', ':'))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # a read-only installation still works, it just compiles the mapping on every start
+        pass
+
+
+def main():
+    import CcReference
+    CcReference.build_mapping()
+    print(f'compiled {CcReference.REFERENCE_PATH} to {CcReference.CACHE_PATH}')
+
+
+if __name__ == '__main__':
+    main()
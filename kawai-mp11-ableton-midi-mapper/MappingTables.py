@@ -0,0 +1,193 @@
+import collections
+import logging
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import CcReference
+from SysExDecoder import SysExDecoder
+from SysExInfo import SysExInfo
+from ToneRouting import MP11_TONE_NUMBERS, TONE_COUNT
+from cachedproperty import cached_property
+from consts import KAWAI_SECTION_NAMES
+
+logger = logging.getLogger(__name__)
+
+
+class MappingTables:
+    """
+    Lookup tables derived from a compiled mapping. EventHandler reads them through one attribute, so that a reloaded
+    mapping is swapped in as a whole.
+    """
+
+    def __init__(self, mapping: dict):
+        self.mapping = mapping
+        self.control_number_dict: Dict[str, int] = dict(mapping['assigned_control_numbers'])
+        self.simple_sys_ex_info, self.prefix_sys_ex_info = CcReference.sys_ex_info(mapping)
+        self.mmc_sys_ex_map: Dict[str, SysExInfo] = {info.sys_ex_strings[0]: info for info in self.simple_sys_ex_info}
+        self.prefix_sys_ex_map: Dict[str, SysExInfo] = {sys_ex: info for info in self.prefix_sys_ex_info
+                                                        for sys_ex in info.sys_ex_strings}
+        self.reverse_prefix_sys_ex_map: Dict[int, SysExInfo] = {info.control_number: info
+                                                                for info in self.prefix_sys_ex_info}
+        self.reverse_ccs = set(mapping['reverse_control_numbers'])
+        self.sys_ex_decoder = SysExDecoder(self.simple_sys_ex_info, self.prefix_sys_ex_info)
+        # every distinct sys ex address of a section parameter is a slot in the shadow of the mp11 state
+        self.address_prefixes: List[str] = list(dict.fromkeys(sys_ex for info in self.prefix_sys_ex_info
+                                                              for sys_ex in info.sys_ex_strings))
+        self.address_ids: Dict[str, int] = {prefix: i for i, prefix in enumerate(self.address_prefixes)}
+        # control number -> address per section
+        self.parameter_addresses: Dict[int, Tuple[int, ...]] = {
+            info.control_number: tuple(self.address_ids[sys_ex] for sys_ex in info.sys_ex_strings)
+            for info in self.prefix_sys_ex_info}
+        # control number -> distinct addresses written when a tone is recalled
+        self.recall_addresses: Dict[int, Tuple[int, ...]] = {
+            control_number: tuple(dict.fromkeys(addresses))
+            for control_number, addresses in self.parameter_addresses.items()}
+        # bitmap of the control numbers that are tone parameters
+        self.parameter_mask = sum(1 << control_number for control_number in self.parameter_addresses)
+
+    @cached_property
+    def parameter_sys_ex(self) -> List[List[str]]:
+        """address -> value -> SysEx that sets the parameter at the address to the value"""
+        return [[f'{prefix} {value:02X} F7' for value in range(128)] for prefix in self.address_prefixes]
+
+    @cached_property
+    def tone_activation_sys_ex(self) -> List[List[str]]:
+        """section -> tone id -> SysEx that activates the tone in the section"""
+        tone_info = self.reverse_prefix_sys_ex_map[self.control_number_dict['tone']]
+        return [[f'{prefix} 00 {MP11_TONE_NUMBERS[tone_id][section_index]:02X} F7' for tone_id in range(TONE_COUNT)]
+                for section_index, prefix in enumerate(tone_info.sys_ex_strings)]
+
+    def warm_up(self):
+        """Builds the outgoing messages ahead of the first event"""
+        self.parameter_sys_ex
+        self.tone_activation_sys_ex
+
+
+def validate(mapping: dict) -> Tuple[List[str], List[str]]:
+    """Returns the errors that prevent using the mapping and warnings about ambiguous entries"""
+    errors = []
+    warnings = []
+    infos = mapping['simple_sys_ex_info'] + mapping['prefix_sys_ex_info']
+    for control_number, count in collections.Counter(info['control_number'] for info in infos).items():
+        if count > 1:
+            errors.append(f'control number {control_number} is mapped to {count} SysEx messages')
+    for info in infos:
+        if info['control_number'] not in range(128):
+            errors.append(f'{info["name"]}: control number {info["control_number"]} is not a valid CC')
+        for sys_ex in info['sys_ex_strings']:
+            try:
+                message = bytes.fromhex(sys_ex)
+            except (TypeError, ValueError):
+                errors.append(f'{info["name"]}: {sys_ex!r} is not a SysEx message')
+                continue
+            if message[:1] != b'\xf0':
+                errors.append(f'{info["name"]}: {sys_ex!r} does not start with F0')
+    for info in mapping['prefix_sys_ex_info']:
+        if len(info['sys_ex_strings']) != len(KAWAI_SECTION_NAMES):
+            errors.append(f'{info["name"]}: expected a prefix for each of the {len(KAWAI_SECTION_NAMES)} sections')
+    if 'tone' not in mapping['assigned_control_numbers']:
+        errors.append('no control number is mapped to tone')
+    prefix_control_numbers = {info['control_number'] for info in mapping['prefix_sys_ex_info']}
+    for control_number in mapping['reverse_control_numbers']:
+        if control_number not in prefix_control_numbers:
+            errors.append(f'reverse control number {control_number} has no section SysEx')
+    prefix_names = collections.defaultdict(set)
+    for info in infos:
+        for sys_ex in info['sys_ex_strings']:
+            prefix_names[sys_ex].add(info['name'])
+    for sys_ex, names in prefix_names.items():
+        if len(names) > 1:
+            warnings.append(f'{sys_ex} is shared by {", ".join(sorted(map(str, names)))}')
+    return errors, warnings
+
+
+class ReferenceWatcher:
+    """
+    Watches the reference csv and hands new tables to the handler when it changed and is valid. Every change reads the
+    whole csv and builds new tables, only the compiled rows of unchanged content are reused. The handler swaps the
+    tables in before it processes its next event.
+    """
+
+    def __init__(self, handler, path: str = CcReference.REFERENCE_PATH, interval: float = 1):
+        self.handler = handler
+        self.path = path
+        self.interval = interval
+        self.stat = self._stat()
+        self.compiled_rows: Dict[tuple, dict] = {}
+        self.rebuilt_rows = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self) -> bool:
+        """Reloads the reference if it changed since the last check, returns whether new tables were handed over"""
+        stat = self._stat()
+        if stat is None or stat == self.stat:
+            return False
+        self.stat = stat
+        try:
+            mapping = self.compile()
+        except Exception:
+            logger.exception('failed to read %s', self.path)
+            return False
+        errors, warnings = validate(mapping)
+        for warning in warnings:
+            logger.warning('%s: %s', self.path, warning)
+        if errors:
+            for error in errors:
+                logger.error('%s: %s', self.path, error)
+            logger.error('%s: keeping the current mapping', self.path)
+            return False
+        tables = MappingTables(mapping)
+        tables.warm_up()
+        self.handler.reload_tables(tables)
+        logger.info('reloaded %s, %d rows changed', self.path, self.rebuilt_rows)
+        return True
+
+    def prime(self):
+        """Compiles the current reference, so that the first change only compiles the rows that differ"""
+        if self.stat is None:
+            return
+        try:
+            self.compile()
+        except Exception:
+            logger.exception('failed to read %s', self.path)
+
+    def compile(self) -> dict:
+        compiled_rows = {}
+        rows = []
+        self.rebuilt_rows = 0
+        for row in CcReference.read_reference(self.path).to_dict('records'):
+            # empty cells are NaN, which never equals itself
+            key = tuple((column, value if CcReference.is_present(value) else None) for column, value in row.items())
+            compiled_row = self.compiled_rows.get(key)
+            if compiled_row is None:
+                compiled_row = CcReference.compile_row(row)
+                self.rebuilt_rows += 1
+            compiled_rows[key] = compiled_row
+            rows.append(compiled_row)
+        self.compiled_rows = compiled_rows
+        return CcReference.assemble(rows)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='ReferenceWatcher', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        # pandas is imported on this thread instead of on the startup path
+        self.prime()
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,209 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+from Transport import Transport
+
+SYS_EX_PORT = 'sys ex'
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Latency histogram with power of two buckets in nanoseconds"""
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, nanoseconds: int):
+        self.buckets[nanoseconds.bit_length()] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def percentile(self, fraction: float) -> int:
+        """Returns the upper bound of the bucket that contains the percentile"""
+        rank = fraction * self.count
+        seen = 0
+        for bit_length, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << bit_length, self.max)
+        return 0
+
+    def summary(self) -> dict:
+        return {'count': self.count,
+                'mean_ns': self.total // self.count if self.count else 0,
+                'p50_ns': self.percentile(0.5),
+                'p99_ns': self.percentile(0.99),
+                'max_ns': self.max}
+
+
+class Metrics:
+    """
+    Counts and times the handler paths and counts outgoing messages per port. Instrumentation wraps the input methods
+    of a handler instance, so a handler that was never instrumented, or is uninstrumented again, pays nothing.
+    """
+
+    def __init__(self, enabled: bool = True, clock=time.perf_counter_ns):
+        self.enabled = enabled
+        self.clock = clock
+        self.histograms: Dict[str, Histogram] = {}
+        self.outgoing: Dict[object, int] = {}
+        self.gauges: Dict[str, Callable[[], object]] = {}
+        self.started = time.time()
+        self.reporter = None
+        self.stop_reporting = threading.Event()
+        self.server = None
+        # (handler, name, wrapper, replaced instance attribute or None) of every callback instrument() wrapped
+        self.wrapped: List[tuple] = []
+
+    def instrument(self, handler):
+        if not self.enabled:
+            return
+        handler.transport = MeteredTransport(transport=handler.transport, metrics=self)
+        on_sys_ex_input = handler.OnSysExInput
+        on_midi_input = handler.OnMidiInput
+        clock = self.clock
+        histograms = self.histograms
+
+        # noinspection PyPep8Naming
+        def OnSysExInput(bStrSysEx):
+            start = clock()
+            path = on_sys_ex_input(bStrSysEx)
+            histogram = histograms.get(path)
+            if histogram is None:
+                histogram = histograms[path] = Histogram()
+            histogram.record(clock() - start)
+            return path
+
+        # noinspection PyPep8Naming
+        def OnMidiInput(nTimestamp, port, status, data1, data2):
+            start = clock()
+            path = on_midi_input(nTimestamp, port, status, data1, data2)
+            histogram = histograms.get(path)
+            if histogram is None:
+                histogram = histograms[path] = Histogram()
+            histogram.record(clock() - start)
+            return path
+
+        # the instrumented callbacks live on the COM object behind the EventsProxy of DispatchWithEvents
+        target = getattr(handler, '_obj_', handler)
+        for name, wrapper in [('OnSysExInput', OnSysExInput), ('OnMidiInput', OnMidiInput)]:
+            self.wrapped.append((target, name, wrapper, vars(target).get(name)))
+            setattr(target, name, wrapper)
+
+    def uninstrument(self, handler):
+        """
+        Restores the callbacks instrument() replaced and takes the metered transport out of the transport chain. A
+        callback that was wrapped again since, e.g. by a SessionRecorder, keeps calling through the timing wrapper.
+        """
+        target = getattr(handler, '_obj_', handler)
+        for wrapped in [wrapped for wrapped in self.wrapped if wrapped[0] is target]:
+            self.wrapped.remove(wrapped)
+            _, name, wrapper, replaced = wrapped
+            if vars(target).get(name) is not wrapper:
+                continue
+            if replaced is None:
+                delattr(target, name)
+            else:
+                setattr(target, name, replaced)
+        outer, transport = handler, handler.transport
+        while transport is not None:
+            if isinstance(transport, MeteredTransport) and transport.outgoing is self.outgoing:
+                outer.transport = transport.transport
+                transport.bypass()
+                break
+            outer, transport = transport, getattr(transport, 'transport', None)
+
+    def gauge(self, name: str, read: Callable[[], object]):
+        self.gauges[name] = read
+
+    def summary(self) -> dict:
+        return {'uptime_s': round(time.time() - self.started, 3),
+                'paths': {path: histogram.summary() for path, histogram in list(self.histograms.items())},
+                'outgoing': {str(port): count for port, count in list(self.outgoing.items())},
+                'gauges': {name: read() for name, read in list(self.gauges.items())}}
+
+    def start_reporting(self, interval: float = 60, report_logger: logging.Logger = logger):
+        """Logs the summary every interval seconds"""
+        def report():
+            while not self.stop_reporting.wait(interval):
+                report_logger.info('metrics %s', json.dumps(self.summary()))
+
+        self.reporter = threading.Thread(target=report, name='MetricsReporter', daemon=True)
+        self.reporter.start()
+
+    def serve(self, port: int = 0) -> int:
+        """Serves the summary as JSON on localhost and returns the port"""
+        metrics = self
+
+        class SummaryRequestHandler(BaseHTTPRequestHandler):
+            # noinspection PyPep8Naming
+            def do_GET(self):
+                body = json.dumps(metrics.summary()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), SummaryRequestHandler)
+        threading.Thread(target=self.server.serve_forever, name='MetricsServer', daemon=True).start()
+        return self.server.server_address[1]
+
+    def close(self):
+        self.stop_reporting.set()
+        if self.reporter is not None:
+            self.reporter.join()
+            self.reporter = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class MeteredTransport(Transport):
+    def __init__(self, transport: Transport, metrics: Metrics):
+        self.transport = transport
+        self.outgoing = metrics.outgoing
+
+    def attach(self, handler):
+        super().attach(handler)
+        self.transport.attach(handler)
+
+    def send_sys_ex(self, sys_ex: str):
+        self.outgoing[SYS_EX_PORT] = self.outgoing.get(SYS_EX_PORT, 0) + 1
+        self.transport.send_sys_ex(sys_ex)
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        self.outgoing[SYS_EX_PORT] = self.outgoing.get(SYS_EX_PORT, 0) + len(sys_ex_list)
+        self.transport.send_sys_ex_batch(sys_ex_list, batch_size, gap)
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.outgoing[port] = self.outgoing.get(port, 0) + 1
+        self.transport.output_midi_msg(port, status, data1, data2)
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.transport.get_out_port_id(port_name)
+
+    def get_in_port_id(self, port_name: str) -> int:
+        return self.transport.get_in_port_id(port_name)
+
+    def bypass(self):
+        """Sends straight through the wrapped transport, for a worker thread that still holds this transport"""
+        self.send_sys_ex = self.transport.send_sys_ex
+        self.send_sys_ex_batch = self.transport.send_sys_ex_batch
+        self.output_midi_msg = self.transport.output_midi_msg
+
@@ -0,0 +1,120 @@
+import time
+from typing import List
+
+try:
+    import pythoncom
+    import win32event
+except ImportError:
+    pythoncom = None
+    win32event = None
+
+SYS_EX_STATUS = 0xF0
+
+
+def decode_raw(message: int):
+    """Splits a packed message of GetMidiInputRaw() into status, data1 and data2"""
+    return message & 0xFF, (message >> 8) & 0x7F, (message >> 16) & 0x7F
+
+
+def open_inputs(mox) -> List[str]:
+    """Names of the MIDI input devices opened in MIDI-OX"""
+    names = []
+    name = mox.GetFirstOpenMidiInDev()
+    while name:
+        names.append(name)
+        name = mox.GetNextOpenMidiInDev()
+    return names
+
+
+def sleep(seconds: float):
+    if win32event is None:
+        time.sleep(seconds)
+    else:
+        # wakes up on window messages, so that COM calls into the apartment are served while waiting
+        win32event.MsgWaitForMultipleObjects([], False, max(1, int(seconds * 1000)), win32event.QS_ALLINPUT)
+        pythoncom.PumpWaitingMessages()
+
+
+class MidiOxPoller:
+    """
+    Polls the input of MIDI-OX with GetMidiInput() instead of a COM callback per event. All pending input is read in
+    one loop, at most max_batch events, and handed to the handler as one batch. SysEx is fetched with GetSysExInput()
+    when its status arrives. The MP11 is opened in MIDI-OX for its SysEx, so this string path is the one that runs.
+    The packed messages of GetMidiInputRaw() are cheaper to decode, but carry neither timestamp nor port: they are
+    timestamped on arrival and assigned to the input port with port_key. They are only read if raw is set, by default
+    if the port of port_key is the only input opened in MIDI-OX, i.e. on a rig whose MP11 SysEx arrives through a
+    separate input.
+    While no input arrives, the poller sleeps for min_sleep seconds, doubling up to max_sleep.
+    """
+
+    def __init__(self, mox, handler=None, port_key: str = 'loopMIDI', raw: bool = None, max_batch: int = 256,
+                 min_sleep: float = 0.0001, max_sleep: float = 0.002, sleep=sleep, clock=time.perf_counter):
+        self.mox = mox
+        self.handler = handler if handler is not None else mox
+        self.port_key = port_key
+        if raw is None:
+            raw = open_inputs(mox) == [self.handler.in_port_names[port_key]]
+        self.raw = raw
+        self.max_batch = max_batch
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+        self.sleep = sleep
+        self.clock = clock
+        self.start = clock()
+        self.idle_sleep = min_sleep
+        self.events = 0
+        self.batches = 0
+
+    def poll(self) -> int:
+        """Reads and handles all pending input, returns the number of events"""
+        batch = self._read_raw() if self.raw else self._read()
+        if batch:
+            self.handler.handle_batch(batch)
+            self.events += len(batch)
+            self.batches += 1
+        return len(batch)
+
+    def _read_raw(self) -> list:
+        get_midi_input_raw = self.mox.GetMidiInputRaw
+        get_sys_ex_input = self.mox.GetSysExInput
+        port = self.handler.in_ports[self.port_key]
+        timestamp = int((self.clock() - self.start) * 1000)
+        batch = []
+        append = batch.append
+        while len(batch) < self.max_batch:
+            message = get_midi_input_raw()
+            if not message:
+                break
+            # decode_raw() inlined
+            status = message & 0xFF
+            if status == SYS_EX_STATUS:
+                append(get_sys_ex_input())
+            else:
+                append((timestamp, port, status, (message >> 8) & 0x7F, (message >> 16) & 0x7F))
+        return batch
+
+    def _read(self) -> list:
+        get_midi_input = self.mox.GetMidiInput
+        get_sys_ex_input = self.mox.GetSysExInput
+        batch = []
+        append = batch.append
+        while len(batch) < self.max_batch:
+            # timestamp,port,status,data1,data2
+            message = get_midi_input()
+            if not message:
+                break
+            timestamp, port, status, data1, data2 = map(int, message.split(','))
+            if status == SYS_EX_STATUS:
+                append(get_sys_ex_input())
+            else:
+                append((timestamp, port, status, data1, data2))
+        return batch
+
+    def run(self, stop):
+        """Polls until stop is set"""
+        while not stop.is_set():
+            if self.poll():
+                self.idle_sleep = self.min_sleep
+            else:
+                self.sleep(self.idle_sleep)
+                self.idle_sleep = min(self.idle_sleep * 2, self.max_sleep)
@@ -1,27 +1,51 @@
-from typing import Dict
+import threading
+from typing import Dict, List, Tuple
 
-import win32com.client as win32
+try:
+    import win32com.client as win32
+except ImportError:
+    win32 = None
 
-from CcReference import CcReference
+from CcCoalescer import CcCoalescer
+from EchoSuppressor import EchoSuppressor, SYS_EX_STATUS
+import CcReference
+from MappingTables import MappingTables, ReferenceWatcher
+from Metrics import Metrics
+from MidiOxPoller import MidiOxPoller, sleep
+from OutputQueue import QueuedTransport
 from Section import Section
+from SessionRecorder import SessionRecorder
+from SysExDecoder import MMC, TONE
+from SysExFramer import SysExFramer, is_complete
 from SysExInfo import SysExInfo
 from Tone import Tone
+from ToneJournal import ToneJournal
+from ToneRouting import MP11_TONE_NUMBERS, TONE_IDS, TONE_COUNT
+from Transport import Transport, LoopbackTransport, MidiOxTransport
 from cachedproperty import cached_property
-from consts import KAWAI_SECTION_NAMES
-
-CONTROL_NUMBER_DICT = CcReference.get_assigned_control_numbers()
-SIMPLE_SYS_EX_INFO, PREFIX_SYS_EX_INFO = CcReference.get_cc_sys_ex_info()
-MMC_SYS_EX_MAP: Dict[str, SysExInfo] = {info.sys_ex_strings[0]: info for info in SIMPLE_SYS_EX_INFO}
-PREFIX_SYS_EX_MAP: Dict[str, SysExInfo] = {sys_ex: info for info in PREFIX_SYS_EX_INFO
-                                           for sys_ex in info.sys_ex_strings}
-REVERSE_PREFIX_SYS_EX_MAP: Dict[int, SysExInfo] = {info.control_number: info for info in PREFIX_SYS_EX_INFO}
+from consts import KAWAI_SECTION_NAMES, MMC_PATH, TONE_SWITCH_PATH, SECTION_PARAMETER_PATH, REVERSE_CC_PATH, \
+    IGNORED_PATH, ECHO_PATH
+
+# tables of the mapping loaded at import, EventHandler reads its tables through self.tables
+TABLES = MappingTables(CcReference.get_mapping())
+CONTROL_NUMBER_DICT = TABLES.control_number_dict
+SIMPLE_SYS_EX_INFO, PREFIX_SYS_EX_INFO = TABLES.simple_sys_ex_info, TABLES.prefix_sys_ex_info
+MMC_SYS_EX_MAP: Dict[str, SysExInfo] = TABLES.mmc_sys_ex_map
+PREFIX_SYS_EX_MAP: Dict[str, SysExInfo] = TABLES.prefix_sys_ex_map
+REVERSE_PREFIX_SYS_EX_MAP: Dict[int, SysExInfo] = TABLES.reverse_prefix_sys_ex_map
 CC_STATUS_OFFSET = 176
 PC_STATUS_OFFSET = 192
 CA_STATUS_OFFSET = 208
-REVERSE_CCS = CcReference.get_reverse_control_numbers()
+REVERSE_CCS = TABLES.reverse_ccs
 REVERSE_SECTIONS_DICT = {name: i for i, name in enumerate(KAWAI_SECTION_NAMES)}
-
-mox = None
+SYS_EX_DECODER = TABLES.sys_ex_decoder
+ADDRESS_PREFIXES: List[str] = TABLES.address_prefixes
+ADDRESS_IDS: Dict[str, int] = TABLES.address_ids
+PARAMETER_ADDRESSES: Dict[int, Tuple[int, ...]] = TABLES.parameter_addresses
+RECALL_ADDRESSES: Dict[int, Tuple[int, ...]] = TABLES.recall_addresses
+UNKNOWN_VALUE = 0xFF
+DEFAULT_OUT_PORT_NAMES = {'kawai': '2- KAWAI USB MIDI', 'loopMIDI': 'loopMIDI Port'}
+DEFAULT_IN_PORT_NAMES = {'kawai': '2- KAWAI USB MIDI', 'loopMIDI': 'loopMIDI Port 1'}
 
 
 def int_to_hex(value):
@@ -33,64 +57,174 @@ def int_to_hex(value):
 
 class EventHandler:
 
-    def __init__(self):
-        self.tones = [Tone(id=i) for i in range(16)]
-        self.sections = [Section(name=name, active_tone=self.tones[0]) for name in KAWAI_SECTION_NAMES]
+    def __init__(self, transport: Transport = None, coalescer: CcCoalescer = None, journal: ToneJournal = None,
+                 out_port_names: Dict[str, str] = None, in_port_names: Dict[str, str] = None,
+                 tables: MappingTables = None, echo_suppressor: EchoSuppressor = None):
+        self.transport = transport if transport is not None else LoopbackTransport()
+        # rate limits parameter changes from ableton per (tone id, control number), if given
+        self.coalescer = coalescer
+        # guards the state of tones, sections and the mp11 against the deliveries of the coalescer thread
+        self.lock = threading.RLock()
+        if coalescer is not None:
+            coalescer.attach(self.send_tone_parameter, lock=self.lock)
+        # persists parameter changes and tone activations, if given
+        self.journal = journal
+        # drops messages that ableton or the mp11 echo back, if given
+        self.echo_suppressor = echo_suppressor
+        self.tables = tables if tables is not None else TABLES
+        # tables handed over by reload_tables(), swapped in before the next event
+        self.pending_tables = None
+        self.tones = [Tone(id=i) for i in range(TONE_COUNT)]
+        self.sections = [Section(name=name, index=i, active_tone=self.tones[0])
+                         for i, name in enumerate(KAWAI_SECTION_NAMES)]
         self.active_section = self.sections[1]
-        self.out_port_names = {'kawai': '2- KAWAI USB MIDI', 'loopMIDI': 'loopMIDI Port'}
-        self.in_port_names = {'kawai': '2- KAWAI USB MIDI', 'loopMIDI': 'loopMIDI Port 1'}
+        # tone id -> indices of the sections the tone is currently active in
+        self.tone_sections = [()] * TONE_COUNT
+        self.tone_sections[0] = tuple(range(len(self.sections)))
+        # address -> value the mp11 is believed to currently hold, UNKNOWN_VALUE if not known
+        self.shadow = bytearray([UNKNOWN_VALUE]) * len(self.tables.address_prefixes)
+        # send all parameters of a recalled tone, even those the mp11 already holds
+        self.full_resync = False
+        # SysEx messages per bulk send of a recall (all if None) and seconds between bulk sends
+        self.recall_batch_size = None
+        self.recall_gap = 0.0
+        # toggle state of the MMC controls, scale of the value sent on the next message
+        self.mmc_scales = {info.control_number: info.scale for info in self.tables.simple_sys_ex_info}
+        self.out_port_names = dict(out_port_names or DEFAULT_OUT_PORT_NAMES)
+        self.in_port_names = dict(in_port_names or DEFAULT_IN_PORT_NAMES)
+        # reassembles SysEx that MIDI-OX delivers in several parts
+        self.sys_ex_framer = SysExFramer()
+        # attach last, transports may start delivering input right away
+        self.transport.attach(self)
 
     @cached_property
     def out_ports(self) -> Dict[str, int]:
-        # noinspection PyUnresolvedReferences
-        return {key: mox.GetOutPortID(port_name) for key, port_name in self.out_port_names.items()}
+        return {key: self.transport.get_out_port_id(port_name) for key, port_name in self.out_port_names.items()}
 
     @cached_property
     def in_ports(self) -> Dict[str, int]:
         # Ports provided by OnMidiInput() are too small by 1, so we subtract 1 from all IDs
-        # noinspection PyUnresolvedReferences
-        return {key: mox.GetInPortID(port_name) - 1 for key, port_name in self.in_port_names.items()}
+        return {key: self.transport.get_in_port_id(port_name) - 1 for key, port_name in self.in_port_names.items()}
+
+    @cached_property
+    def cc_dispatch(self) -> Dict[Tuple[int, int, int], Tuple[int, SysExInfo]]:
+        # (port, status, data1) -> (tone id, sys ex info) for all CCs that are forwarded to the mp11
+        tables = self.tables
+        return {(self.in_ports['loopMIDI'], CC_STATUS_OFFSET + tone_id, control_number):
+                    (tone_id, tables.reverse_prefix_sys_ex_map[control_number])
+                for tone_id in range(TONE_COUNT) for control_number in tables.reverse_ccs}
+
+    def warm_up(self):
+        """Resolves the ports and builds all tables and outgoing messages, so that the first event is not slower"""
+        self.out_ports
+        self.in_ports
+        self.cc_dispatch
+        self.tables.warm_up()
+
+    def reload_tables(self, tables: MappingTables):
+        """Hands over new tables from another thread, they are swapped in before the next event"""
+        with self.lock:
+            self.pending_tables = tables
+
+    def swap_tables(self):
+        """Swaps in the pending tables, keeping the state of parameters and addresses that still exist"""
+        # the coalescer thread must not see the new tables with the old shadow or the other way round, and tables
+        # reloaded meanwhile must stay pending
+        with self.lock:
+            tables, self.pending_tables = self.pending_tables, None
+            if tables is None:
+                return
+            old_tables = self.tables
+            shadow = bytearray([UNKNOWN_VALUE]) * len(tables.address_prefixes)
+            for prefix, address in tables.address_ids.items():
+                old_address = old_tables.address_ids.get(prefix)
+                if old_address is not None:
+                    shadow[address] = self.shadow[old_address]
+            for tone in self.tones:
+                tone.dirty &= tables.parameter_mask
+            self.mmc_scales = {info.control_number: self.mmc_scales.get(info.control_number, info.scale)
+                               for info in tables.simple_sys_ex_info}
+            self.shadow, self.tables = shadow, tables
+            del self.cc_dispatch
+
+    def activate_tone(self, section: Section, tone: Tone):
+        previous_tone = section.active_tone
+        section.active_tone = tone
+        if self.journal is not None:
+            self.journal.record_active_tone(section.index, tone.id)
+        for tone_id in {previous_tone.id, tone.id}:
+            self.tone_sections[tone_id] = tuple(other.index for other in self.sections
+                                                if other.active_tone.id == tone_id)
 
     # noinspection PyPep8Naming
     def OnSysExInput(self, bStrSysEx: str):
-        clean_sys_ex = bStrSysEx[:-1]
-        if clean_sys_ex in MMC_SYS_EX_MAP.keys():
-            sys_ex_info = MMC_SYS_EX_MAP[clean_sys_ex]
-            self.output_cc_signal_2_active_track(cc_code=sys_ex_info.control_number, value=sys_ex_info.scale * 127)
+        if self.pending_tables is not None:
+            self.swap_tables()
+        if isinstance(bStrSysEx, str):
+            try:
+                sys_ex = bytes.fromhex(bStrSysEx)
+            except ValueError:
+                return IGNORED_PATH
+        else:
+            sys_ex = bStrSysEx
+        framer = self.sys_ex_framer
+        # almost every message arrives in one piece and does not need to be copied into the framer
+        if not framer.in_message and is_complete(sys_ex):
+            return self.on_sys_ex_message(sys_ex)
+        path = IGNORED_PATH
+        for message in framer.feed(sys_ex):
+            path = self.on_sys_ex_message(message)
+        return path
+
+    def on_sys_ex_message(self, sys_ex: bytes):
+        decoded = self.tables.sys_ex_decoder.decode(sys_ex)
+        if decoded is None:
+            return IGNORED_PATH
+        sys_ex_info = decoded.info
+        if decoded.kind == MMC:
+            control_number = sys_ex_info.control_number
+            scale = self.mmc_scales[control_number]
+            self.output_cc_signal_2_active_track(cc_code=control_number, value=scale * 127)
             if sys_ex_info.name not in ['play', 'record pause']:
-                sys_ex_info.scale = int(not sys_ex_info.scale)
+                self.mmc_scales[control_number] = int(not scale)
+            return MMC_PATH
         else:
-            sys_ex_prefix = bStrSysEx[:29]
-            if sys_ex_prefix in PREFIX_SYS_EX_MAP.keys():
-                sys_ex_info = PREFIX_SYS_EX_MAP[sys_ex_prefix]
-                section_index = sys_ex_info.map[sys_ex_prefix]
+            section_index = decoded.section_index
+            if self.echo_suppressor is not None and self.echo_suppressor.is_echo(
+                    ('kawai', SYS_EX_STATUS, self.tables.parameter_addresses[sys_ex_info.control_number][section_index],
+                     decoded.value)):
+                return ECHO_PATH
+            with self.lock:
                 section = self.sections[section_index]
-                data_size = int(bStrSysEx[27:29], 16)
-                data = int(bStrSysEx[27 + 3 * data_size:29 + 3 * data_size], 16)
-                if sys_ex_info.name == 'tone':
+                data = decoded.value
+                if decoded.kind == TONE:
                     # activate section
                     self.active_section = section
+                    if self.journal is not None:
+                        self.journal.record_active_section(section_index)
                     # activate tone in section
-                    if section_index in range(2):
-                        tone_id = int(bStrSysEx[30:32] + bStrSysEx[33:35], 16) - (section_index * 12)
-                    else:
-                        raw_channel = int(bStrSysEx[30:32] + bStrSysEx[33:35], 16) - 24
-                        # reserve each 4th tone in sub for return tracks (3, 7, 11, 15 are 12, 13, 14, 15 instead)
-                        tone_id = int(raw_channel - raw_channel // 4 + int(not bool((raw_channel + 1) % 4)) * (
-                                11 - (2 * ((raw_channel + 1) / 4))))
-                    self.active_section.active_tone = self.tones[tone_id]
+                    tone_id = TONE_IDS.get((section_index, decoded.value))
+                    if tone_id is None:
+                        return IGNORED_PATH
+                    self.activate_tone(section=section, tone=self.tones[tone_id])
                     # instead of tone data, always output 127 on respective channel
                     data = 1
                     # load settings from respective tone to mp11
-                    for prefix, postfix in section.active_tone.map.items():
-                        # noinspection PyUnresolvedReferences
-                        mox.SendSysExString(prefix + postfix)
+                    self.recall_tone(tone=section.active_tone, force=self.full_resync)
+                    path = TONE_SWITCH_PATH
                 else:
-                    for sys_ex_string in sys_ex_info.sys_ex_strings:
-                        section.active_tone.map[sys_ex_string] = bStrSysEx[29:]
+                    control_number = sys_ex_info.control_number
+                    self.shadow[self.tables.parameter_addresses[control_number][section_index]] = decoded.value
+                    if self.coalescer is not None:
+                        self.coalescer.invalidate((section.active_tone.id, control_number))
+                    section.active_tone.set(control_number, decoded.value)
+                    if self.journal is not None:
+                        self.journal.record_parameter(section.active_tone.id, control_number, decoded.value)
+                    path = SECTION_PARAMETER_PATH
                 self.output_cc_2_track(track=section.active_tone.id,
                                        cc_code=sys_ex_info.control_number,
                                        value=data * sys_ex_info.scale)
+                return path
 
     # noinspection PyPep8Naming,PyMethodMayBeStatic
     def OnTerminateMidiInput(self):
@@ -98,46 +232,104 @@ class EventHandler:
 
     # noinspection PyPep8Naming,PyUnusedLocal
     def OnMidiInput(self, nTimestamp, port, status, data1, data2):
-        if port == self.in_ports['loopMIDI']:
-            if data1 in REVERSE_CCS:
-                sys_ex_info = REVERSE_PREFIX_SYS_EX_MAP[data1]
-                sys_ex_postfix = f' {int_to_hex(data2 // sys_ex_info.scale)} F7'
-                some_section_was_updated = False
-                affected_tone_id = status - CC_STATUS_OFFSET
-
-                def update_mp11(sys_ex_prefix, sys_ex_postfix):
-                    # noinspection PyUnresolvedReferences
-                    mox.SendSysExString(sys_ex_prefix + sys_ex_postfix)
-                    for sys_ex_string in sys_ex_info.sys_ex_strings:
-                        section.active_tone.map[sys_ex_string] = sys_ex_postfix
-
-                for i, section in enumerate(self.sections):
-                    if section.active_tone.id == affected_tone_id:
-                        update_mp11(sys_ex_prefix=sys_ex_info.sys_ex_strings[i], sys_ex_postfix=sys_ex_postfix)
-                        some_section_was_updated = True
-                if not some_section_was_updated:
-                    self.active_section.active_tone = self.tones[affected_tone_id]
-                    section_id = REVERSE_SECTIONS_DICT[self.active_section.name]
-                    if section_id in range(2):
-                        tone_id = affected_tone_id + section_id * 12
-                    else:
-                        tone_id = affected_tone_id + (affected_tone_id // 3) - (int(affected_tone_id > 11) * (4 + 3 * (
-                                15 - affected_tone_id)) + int(affected_tone_id == 15)) + 24
-                    # activate tone in correct section
-                    # noinspection PyUnresolvedReferences
-                    mox.SendSysExString(
-                        f'{REVERSE_PREFIX_SYS_EX_MAP[CONTROL_NUMBER_DICT["tone"]].sys_ex_strings[section_id]}'
-                        f' 00 {int_to_hex(tone_id)} F7')
-                    # noinspection PyUnresolvedReferences
-                    update_mp11(sys_ex_prefix=sys_ex_info.sys_ex_strings[section_id], sys_ex_postfix=sys_ex_postfix)
+        if self.pending_tables is not None:
+            self.swap_tables()
+        target = self.cc_dispatch.get((port, status, data1))
+        if target is None:
+            return IGNORED_PATH
+        if self.echo_suppressor is not None and self.echo_suppressor.is_echo(('loopMIDI', status, data1, data2)):
+            return ECHO_PATH
+        with self.lock:
+            affected_tone_id, sys_ex_info = target
+            data_byte = data2 // sys_ex_info.scale
+            if not self.tone_sections[affected_tone_id]:
+                section_id = self.active_section.index
+                self.activate_tone(section=self.active_section, tone=self.tones[affected_tone_id])
+                # activate tone in correct section
+                tables = self.tables
+                self.transport.send_sys_ex(tables.tone_activation_sys_ex[section_id][affected_tone_id])
+                if self.echo_suppressor is not None:
+                    tone_address = tables.parameter_addresses[tables.control_number_dict['tone']][section_id]
+                    self.echo_suppressor.expect(
+                        ('kawai', SYS_EX_STATUS, tone_address, MP11_TONE_NUMBERS[affected_tone_id][section_id]))
+            self.tones[affected_tone_id].set(data1, data_byte)
+            if self.journal is not None:
+                self.journal.record_parameter(affected_tone_id, data1, data_byte)
+            if self.coalescer is None:
+                addresses = self.tables.parameter_addresses[data1]
+                for section_index in self.tone_sections[affected_tone_id]:
+                    self.send_parameter(addresses[section_index], data_byte)
+            else:
+                self.coalescer.submit((affected_tone_id, data1), data_byte)
+            return REVERSE_CC_PATH
+
+    def handle_batch(self, batch: list) -> int:
+        """Handles polled input in order, SysEx as str or bytes and MIDI as (timestamp, port, status, data1, data2)"""
+        on_sys_ex_input = self.OnSysExInput
+        on_midi_input = self.OnMidiInput
+        for event in batch:
+            if type(event) is tuple:
+                on_midi_input(*event)
+            else:
+                on_sys_ex_input(event)
+        return len(batch)
+
+    def send_tone_parameter(self, key: Tuple[int, int], data_byte: int):
+        """Sends a parameter of a tone to all sections the tone is currently active in"""
+        tone_id, control_number = key
+        addresses = self.tables.parameter_addresses.get(control_number)
+        # the parameter may have been removed from the mapping since it was queued
+        if addresses is None:
+            return
+        for section_index in self.tone_sections[tone_id]:
+            self.send_parameter(addresses[section_index], data_byte)
+
+    def send_parameter(self, address: int, value: int):
+        self.transport.send_sys_ex(self.prepare_parameter(address, value))
+
+    def prepare_parameter(self, address: int, value: int) -> str:
+        """Returns the SysEx that sets the parameter, which from now on is expected to be held by the mp11"""
+        self.shadow[address] = value
+        if self.echo_suppressor is not None:
+            self.echo_suppressor.expect(('kawai', SYS_EX_STATUS, address, value))
+        return self.tables.parameter_sys_ex[address][value]
+
+    def recall_tone(self, tone: Tone, force: bool = False):
+        """Sends all parameters of the tone the mp11 does not already hold, or all of them if forced, in bulk"""
+        shadow = self.shadow
+        recall_addresses = self.tables.recall_addresses
+        sys_ex_list = []
+        for control_number, value in tone.parameters():
+            for address in recall_addresses[control_number]:
+                if force or shadow[address] != value:
+                    sys_ex_list.append(self.prepare_parameter(address, value))
+        if sys_ex_list:
+            self.transport.send_sys_ex_batch(sys_ex_list, batch_size=self.recall_batch_size, gap=self.recall_gap)
+
+    def resync(self):
+        """Forgets what the mp11 holds and sends the parameters of the active tones of all sections again"""
+        with self.lock:
+            self.shadow[:] = bytearray([UNKNOWN_VALUE]) * len(self.tables.address_prefixes)
+            for tone in {section.active_tone.id: section.active_tone for section in self.sections}.values():
+                self.recall_tone(tone=tone, force=True)
+
+    def snapshot(self) -> List[Tone]:
+        return [tone.copy() for tone in self.tones]
 
     def output_cc_signal_2_active_track(self, cc_code, value):
         self.output_cc_2_track(track=self.active_section.active_tone.id, cc_code=cc_code, value=value)
 
     def output_cc_2_track(self, track: int, cc_code, value):
-        # noinspection PyUnresolvedReferences
-        mox.OutputMidiMsg(self.out_ports['loopMIDI'], CC_STATUS_OFFSET + track, cc_code,
-                          value)
+        self.transport.output_midi_msg(self.out_ports['loopMIDI'], CC_STATUS_OFFSET + track, cc_code, value)
+        if self.echo_suppressor is not None:
+            self.echo_suppressor.expect(('loopMIDI', CC_STATUS_OFFSET + track, cc_code, value))
+
+
+class MidiOxEventHandler(EventHandler):
+    """Event sink for DispatchWithEvents, the instance is the MIDI-OX COM object itself"""
+
+    def __init__(self):
+        super().__init__(transport=MidiOxTransport(self))
 
 
 class MidiOxProxy:
@@ -542,19 +734,150 @@ class MidiOxProxy:
     End If
     """
 
+    def __init__(self, record_path: str = None, full_resync: bool = False, output_queue_size: int = None,
+                 max_cc_rate: float = None, journal_directory: str = None, metrics: Metrics = None,
+                 out_port_names: Dict[str, str] = None, in_port_names: Dict[str, str] = None,
+                 watch_reference: bool = False, echo_ttl: float = None, recall_batch_size: int = None,
+                 recall_gap: float = 0.0, polling: bool = False, engine_process: bool = False):
+        if engine_process:
+            # these act on the handler, which then lives in the worker process
+            in_process_options = {'record_path': record_path, 'full_resync': full_resync,
+                                  'output_queue_size': output_queue_size, 'max_cc_rate': max_cc_rate,
+                                  'journal_directory': journal_directory, 'metrics': metrics,
+                                  'watch_reference': watch_reference, 'echo_ttl': echo_ttl,
+                                  'recall_batch_size': recall_batch_size, 'recall_gap': recall_gap}
+            unsupported = [name for name, value in in_process_options.items() if value]
+            if unsupported:
+                raise ValueError(f'{", ".join(unsupported)} cannot be used with engine_process')
+        self.mox = None
+        self.out_port_names = out_port_names
+        self.in_port_names = in_port_names
+        self.metrics = metrics
+        self.journal_directory = journal_directory
+        self.journal = None
+        self.record_path = record_path
+        self.full_resync = full_resync
+        if output_queue_size is not None and output_queue_size < 1:
+            raise ValueError(f'output_queue_size must be at least 1, not {output_queue_size}')
+        if recall_gap and recall_batch_size is None:
+            raise ValueError('recall_gap needs recall_batch_size, MIDI-OX waits the gap between batches only')
+        if output_queue_size is None and (max_cc_rate is not None or recall_gap):
+            # the coalescer sends from its own thread, which is only safe through the output queue, and the recall gap
+            # is waited on the worker thread of the queue instead of on the COM thread while holding the handler lock
+            output_queue_size = 1024
+        self.output_queue_size = output_queue_size
+        self.max_cc_rate = max_cc_rate
+        self.output_queue = None
+        self.coalescer = None
+        self.recorder = None
+        self.watch_reference = watch_reference
+        self.reference_watcher = None
+        self.echo_ttl = echo_ttl
+        self.recall_batch_size = recall_batch_size
+        self.recall_gap = recall_gap
+        # poll the input in serve() instead of receiving a COM callback per event
+        self.polling = polling
+        self.poller = None
+        # run the mapping in an EngineProcess, the event sink only forwards the input to it
+        self.engine_process = engine_process
+        self.engine = None
+
     def __enter__(self):
-        global mox
-        mox = win32.DispatchWithEvents("MIDIOX.MoxScript.1", EventHandler)
+        self.mox = win32.DispatchWithEvents("MIDIOX.MoxScript.1", MidiOxEventHandler)
+        self.mox.full_resync = self.full_resync
+        self.mox.recall_batch_size = self.recall_batch_size
+        self.mox.recall_gap = self.recall_gap
+        if self.out_port_names is not None:
+            self.mox.out_port_names = dict(self.out_port_names)
+        if self.in_port_names is not None:
+            self.mox.in_port_names = dict(self.in_port_names)
+        if self.engine_process:
+            # imported here, the engine process builds on the handler of this module
+            from EngineProcess import EngineProcess
+            self.engine = EngineProcess(self.mox.transport, out_port_names=self.mox.out_port_names,
+                                        in_port_names=self.mox.in_port_names)
+            self.engine.start()
+            self.mox.OnSysExInput = self.engine.OnSysExInput
+            self.mox.OnMidiInput = self.engine.OnMidiInput
+        if self.echo_ttl is not None:
+            self.mox.echo_suppressor = EchoSuppressor(ttl=self.echo_ttl)
+        if self.journal_directory is not None:
+            self.journal = ToneJournal(self.journal_directory)
+            self.journal.restore(self.mox)
+            self.mox.journal = self.journal
+            self.journal.start()
+        if self.output_queue_size is not None:
+            self.output_queue = QueuedTransport(transport=self.mox.transport, maxsize=self.output_queue_size)
+            self.mox.transport = self.output_queue
+        if self.max_cc_rate is not None:
+            self.coalescer = CcCoalescer(max_rate=self.max_cc_rate)
+            self.coalescer.attach(self.mox.send_tone_parameter, lock=self.mox.lock)
+            self.mox.coalescer = self.coalescer
+            self.coalescer.start()
+        if self.metrics is not None:
+            self.metrics.instrument(self.mox)
+            # the gauges hold on to the objects, the summary can still be read after __exit__()
+            output_queue = self.output_queue
+            coalescer = self.coalescer
+            echo_suppressor = self.mox.echo_suppressor
+            if output_queue is not None:
+                self.metrics.gauge('output queue depth', lambda: output_queue.queue_depth)
+            if coalescer is not None:
+                self.metrics.gauge('coalescer queue depth', lambda: coalescer.queue_depth)
+                self.metrics.gauge('coalescer dropped', lambda: coalescer.dropped)
+            if echo_suppressor is not None:
+                self.metrics.gauge('echoes suppressed', lambda: echo_suppressor.suppressed)
+        if self.record_path is not None:
+            self.recorder = SessionRecorder(self.record_path)
+            self.recorder.attach(self.mox)
+        if self.watch_reference:
+            self.reference_watcher = ReferenceWatcher(self.mox)
+            self.reference_watcher.start()
+        # after the recorder is attached, so that it records the port IDs
+        self.mox.warm_up()
+
+        self.mox.DivertMidiInput = 1
+        if self.polling:
+            self.poller = MidiOxPoller(self.mox)
+        else:
+            self.mox.FireMidiInput = 1
 
-        mox.DivertMidiInput = 1
-        mox.FireMidiInput = 1
+        return self.mox
 
-        return mox
+    def serve(self, stop):
+        """
+        Handles input on the calling thread, which has to be the one that entered the proxy, until stop is set: polls
+        MIDI-OX, or serves the COM messages that deliver the events to the event sink
+        """
+        if self.poller is not None:
+            self.poller.run(stop)
+        while not stop.is_set():
+            # wakes up on COM messages, checks the stop flag at least every 100 ms
+            sleep(0.1)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        global mox
-        mox.FireMidiInput = 0
-        mox.DivertMidiInput = 0
+        self.mox.FireMidiInput = 0
+        self.mox.DivertMidiInput = 0
 
         # Clean up
-        mox = None
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+        if self.reference_watcher is not None:
+            self.reference_watcher.close()
+            self.reference_watcher = None
+        if self.coalescer is not None:
+            self.coalescer.stop()
+            self.coalescer = None
+        if self.output_queue is not None:
+            self.output_queue.flush()
+            self.output_queue.close()
+            self.output_queue = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        self.poller = None
+        self.mox = None
@@ -0,0 +1,82 @@
+import logging
+import queue
+import threading
+from typing import List
+
+from Transport import Transport, SYS_EX, SYS_EX_BATCH, MIDI
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class QueuedTransport(Transport):
+    """
+    Sends through the wrapped transport from a dedicated worker thread, so that the input handlers only have to
+    enqueue. The queue is bounded: when it is full, sending blocks until the worker caught up. A single worker drains
+    the queue in order, which keeps the order of the messages for every port.
+    """
+
+    def __init__(self, transport: Transport, maxsize: int = 1024):
+        self.transport = transport
+        self.queue = queue.Queue(maxsize)
+        self.worker_transport = transport.for_thread()
+        self.thread = threading.Thread(target=self._run, name='QueuedTransport', daemon=True)
+        self.thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def attach(self, handler):
+        super().attach(handler)
+        self.transport.attach(handler)
+
+    def send_sys_ex(self, sys_ex: str):
+        self.queue.put((SYS_EX, (sys_ex,)))
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        # the gap is waited for on the worker thread
+        self.queue.put((SYS_EX_BATCH, (list(sys_ex_list), batch_size, gap)))
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.queue.put((MIDI, (port, status, data1, data2)))
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.transport.get_out_port_id(port_name)
+
+    def get_in_port_id(self, port_name: str) -> int:
+        return self.transport.get_in_port_id(port_name)
+
+    def flush(self):
+        """Blocks until all queued messages are sent"""
+        self.queue.join()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put((_CLOSE, None))
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        transport = self.worker_transport()
+        try:
+            while True:
+                kind, message = self.queue.get()
+                try:
+                    if kind is _CLOSE:
+                        return
+                    if kind == SYS_EX:
+                        transport.send_sys_ex(*message)
+                    elif kind == SYS_EX_BATCH:
+                        transport.send_sys_ex_batch(*message)
+                    else:
+                        transport.output_midi_msg(*message)
+                except Exception:
+                    logger.exception('failed to send %s', message)
+                finally:
+                    self.queue.task_done()
+        finally:
+            if transport is not self.transport:
+                transport.close()
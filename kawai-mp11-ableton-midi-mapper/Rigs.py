@@ -0,0 +1,78 @@
+import dataclasses as dc
+import multiprocessing
+import threading
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
+
+from MidiOxProxy import MidiOxProxy, EventHandler, DEFAULT_OUT_PORT_NAMES, DEFAULT_IN_PORT_NAMES
+from SocketTransport import SocketTransport
+
+
+@dc.dataclass
+class Rig:
+    """A controller and DAW port pair served by its own engine"""
+    name: str = ''
+    out_port_names: Dict[str, str] = dc.field(default_factory=lambda: dict(DEFAULT_OUT_PORT_NAMES))
+    in_port_names: Dict[str, str] = dc.field(default_factory=lambda: dict(DEFAULT_IN_PORT_NAMES))
+
+
+def run_midi_ox_rig(rig: Rig, stop, **proxy_kwargs):
+    """Serves the rig from its own COM apartment and MIDI-OX instance until stop is set"""
+    pythoncom.CoInitialize()
+    try:
+        proxy = MidiOxProxy(out_port_names=rig.out_port_names, in_port_names=rig.in_port_names, **proxy_kwargs)
+        with proxy:
+            proxy.serve(stop)
+    finally:
+        pythoncom.CoUninitialize()
+
+
+def run_socket_rig(rig: Rig, stop, address: Tuple[str, int], **handler_kwargs):
+    """Serves the rig through a socket transport connected to address until stop is set"""
+    transport = SocketTransport.connect_tcp(*address)
+    EventHandler(transport=transport, out_port_names=rig.out_port_names, in_port_names=rig.in_port_names,
+                 **handler_kwargs)
+    stop.wait()
+    transport.close()
+
+
+class RigRunner:
+    """
+    Runs one engine per rig, each on its own thread or, with use_processes, in its own process. Engines share no
+    mutable state, so adding a rig does not slow down the others.
+    """
+
+    def __init__(self, rigs: List[Rig], target: Callable = run_midi_ox_rig, use_processes: bool = False, **kwargs):
+        self.rigs = rigs
+        self.target = target
+        self.use_processes = use_processes
+        self.kwargs = kwargs
+        self.stop_event = multiprocessing.Event() if use_processes else threading.Event()
+        self.workers = []
+
+    def start(self, rig_kwargs: Dict[str, dict] = None):
+        """Starts all engines, rig_kwargs holds additional arguments for the target by rig name"""
+        worker_class = multiprocessing.Process if self.use_processes else threading.Thread
+        for rig in self.rigs:
+            kwargs = {**self.kwargs, **(rig_kwargs or {}).get(rig.name, {})}
+            worker = worker_class(target=self.target, args=(rig, self.stop_event), kwargs=kwargs,
+                                  name=f'Rig {rig.name}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join()
+        self.workers.clear()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
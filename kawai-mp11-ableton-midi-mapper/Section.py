@@ -1,9 +1,13 @@
-import dataclasses as dc
-
 from Tone import Tone
 
 
-@dc.dataclass
 class Section:
-    name: str = ''
-    active_tone: Tone = None
+    __slots__ = ('name', 'index', 'active_tone')
+
+    def __init__(self, name: str = '', index: int = 0, active_tone: Tone = None):
+        self.name = name
+        self.index = index
+        self.active_tone = active_tone
+
+    def __repr__(self):
+        return f'Section(name={self.name!r}, index={self.index}, active_tone={self.active_tone.id})'
@@ -0,0 +1,141 @@
+import dataclasses as dc
+import json
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from Transport import Transport, SYS_EX, MIDI
+
+INPUT = 'I'
+OUTPUT = 'O'
+IN_PORT = 'PI'
+OUT_PORT = 'PO'
+HANDLER_OPTION = 'H'
+SYS_EX_CODE = 'S'
+MIDI_CODE = 'M'
+
+
+@dc.dataclass
+class Session:
+    in_port_ids: Dict[str, int] = dc.field(default_factory=lambda: {})
+    out_port_ids: Dict[str, int] = dc.field(default_factory=lambda: {})
+    # options of the recorded handler that change its output, keyword arguments of the handler factory of replay()
+    handler_options: Dict[str, object] = dc.field(default_factory=lambda: {})
+    # (seconds since start of recording, SYS_EX or MIDI, message)
+    inputs: List[Tuple[float, str, tuple]] = dc.field(default_factory=lambda: [])
+    outputs: List[Tuple[float, str, tuple]] = dc.field(default_factory=lambda: [])
+
+
+class SessionRecorder:
+    """
+    Logs all input events of a handler and all messages it sends to a tab separated text file, one line per event:
+
+    I   <seconds>   S   <sys ex string>
+    I   <seconds>   M   <timestamp> <port> <status> <data1> <data2>
+    O   <seconds>   S   <sys ex string>
+    O   <seconds>   M   <port> <status> <data1> <data2>
+    PI/PO   <port name> <port id>
+    H   <option>    <JSON value>
+    """
+
+    def __init__(self, path: str, clock=time.perf_counter):
+        self.file = open(path, 'w', encoding='utf-8', newline='\n')
+        self.clock = clock
+        self.start = clock()
+        self.lock = threading.Lock()
+
+    def attach(self, handler):
+        """Records all events of the handler from now on, has to be called before the ports are resolved"""
+        for name, value in handler_options(handler).items():
+            self.write(HANDLER_OPTION, name, json.dumps(value))
+        handler.transport = RecordingTransport(transport=handler.transport, recorder=self)
+        on_sys_ex_input = handler.OnSysExInput
+        on_midi_input = handler.OnMidiInput
+
+        # noinspection PyPep8Naming
+        def OnSysExInput(bStrSysEx):
+            self.write(INPUT, f'{self.clock() - self.start:.6f}', SYS_EX_CODE, bStrSysEx)
+            return on_sys_ex_input(bStrSysEx)
+
+        # noinspection PyPep8Naming
+        def OnMidiInput(nTimestamp, port, status, data1, data2):
+            self.write(INPUT, f'{self.clock() - self.start:.6f}', MIDI_CODE, nTimestamp, port, status, data1, data2)
+            return on_midi_input(nTimestamp, port, status, data1, data2)
+
+        handler.OnSysExInput = OnSysExInput
+        handler.OnMidiInput = OnMidiInput
+
+    def write(self, *fields):
+        line = '\t'.join(map(str, fields)) + '\n'
+        with self.lock:
+            self.file.write(line)
+
+    def record_output(self, kind: str, message: tuple):
+        self.write(OUTPUT, f'{self.clock() - self.start:.6f}', SYS_EX_CODE if kind == SYS_EX else MIDI_CODE, *message)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def handler_options(handler) -> Dict[str, object]:
+    """Options of the handler that change the messages it sends"""
+    return {'max_cc_rate': None if handler.coalescer is None else handler.coalescer.max_rate,
+            'echo_ttl': None if handler.echo_suppressor is None else handler.echo_suppressor.ttl,
+            'full_resync': handler.full_resync,
+            'recall_batch_size': handler.recall_batch_size,
+            'recall_gap': handler.recall_gap}
+
+
+class RecordingTransport(Transport):
+    def __init__(self, transport: Transport, recorder: SessionRecorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def attach(self, handler):
+        super().attach(handler)
+        self.transport.attach(handler)
+
+    def send_sys_ex(self, sys_ex: str):
+        self.recorder.record_output(SYS_EX, (sys_ex,))
+        self.transport.send_sys_ex(sys_ex)
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        for sys_ex in sys_ex_list:
+            self.recorder.record_output(SYS_EX, (sys_ex,))
+        self.transport.send_sys_ex_batch(sys_ex_list, batch_size, gap)
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.recorder.record_output(MIDI, (port, status, data1, data2))
+        self.transport.output_midi_msg(port, status, data1, data2)
+
+    def get_out_port_id(self, port_name: str) -> int:
+        port_id = self.transport.get_out_port_id(port_name)
+        self.recorder.write(OUT_PORT, port_name, port_id)
+        return port_id
+
+    def get_in_port_id(self, port_name: str) -> int:
+        port_id = self.transport.get_in_port_id(port_name)
+        self.recorder.write(IN_PORT, port_name, port_id)
+        return port_id
+
+
+def read_session(path: str) -> Session:
+    session = Session()
+    with open(path, encoding='utf-8', newline='\n') as file:
+        for line in file:
+            fields = line.rstrip('\n').split('\t')
+            code = fields[0]
+            if code == IN_PORT:
+                session.in_port_ids[fields[1]] = int(fields[2])
+            elif code == OUT_PORT:
+                session.out_port_ids[fields[1]] = int(fields[2])
+            elif code == HANDLER_OPTION:
+                session.handler_options[fields[1]] = json.loads(fields[2])
+            else:
+                events = session.inputs if code == INPUT else session.outputs
+                if fields[2] == SYS_EX_CODE:
+                    events.append((float(fields[1]), SYS_EX, (fields[3],)))
+                else:
+                    events.append((float(fields[1]), MIDI, tuple(int(field) for field in fields[3:])))
+    return session
@@ -0,0 +1,130 @@
+import argparse
+import dataclasses as dc
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from CcCoalescer import CcCoalescer
+from EchoSuppressor import EchoSuppressor
+from MidiOxProxy import EventHandler
+from SessionRecorder import Session, read_session
+from Transport import Transport, LoopbackTransport, SYS_EX
+
+
+def percentile(sorted_values: List[int], fraction: float) -> int:
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+@dc.dataclass
+class ReplayReport:
+    events: int = 0
+    p50_ns: int = 0
+    p99_ns: int = 0
+    max_ns: int = 0
+    expected_outputs: int = 0
+    outputs: int = 0
+    # index of the first output that differs from the recording, None if the output streams match
+    first_mismatch: Optional[int] = None
+
+    @property
+    def matches(self) -> bool:
+        return self.first_mismatch is None
+
+    def __str__(self):
+        return (f'{self.events} events, latency p50 {self.p50_ns / 1000:.1f} us, p99 {self.p99_ns / 1000:.1f} us, '
+                f'max {self.max_ns / 1000:.1f} us, {self.outputs}/{self.expected_outputs} outputs, '
+                + ('output matches recording' if self.matches else f'first mismatch at output {self.first_mismatch}'))
+
+
+def compare_outputs(expected: List[Tuple[str, tuple]], actual: List[Tuple[str, tuple]]) -> Optional[int]:
+    for i, (expected_output, actual_output) in enumerate(zip(expected, actual)):
+        if expected_output != actual_output:
+            return i
+    if len(expected) != len(actual):
+        return min(len(expected), len(actual))
+    return None
+
+
+class ReplayClock:
+    """Seconds since the start of the recording of the input that is replayed"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_handler(transport: Transport, clock: ReplayClock, max_cc_rate: float = None, echo_ttl: float = None,
+                   full_resync: bool = False, recall_batch_size: int = None, recall_gap: float = 0.0) -> EventHandler:
+    """
+    Creates a handler with the options MidiOxProxy sets up. Coalescer and echo suppressor run on the recorded time, the
+    coalescer delivers when replay() flushes it.
+    """
+    handler = EventHandler(transport=transport,
+                           coalescer=None if max_cc_rate is None else CcCoalescer(max_rate=max_cc_rate, clock=clock),
+                           echo_suppressor=None if echo_ttl is None else EchoSuppressor(ttl=echo_ttl, clock=clock))
+    handler.full_resync = full_resync
+    handler.recall_batch_size = recall_batch_size
+    handler.recall_gap = recall_gap
+    return handler
+
+
+def replay(session: Session, realtime: bool = False, handler_factory=create_handler) -> ReplayReport:
+    """
+    Runs the recorded input through a fresh handler with the recorded options, either as fast as possible or paced
+    like the recording. The handler sees the time of the recording either way, values the coalescer holds back are
+    delivered before the first input at or after their due time.
+    """
+    transport = LoopbackTransport(out_port_ids=session.out_port_ids, in_port_ids=session.in_port_ids)
+    clock = ReplayClock()
+    handler = handler_factory(transport=transport, clock=clock, **session.handler_options)
+    coalescer = handler.coalescer
+    on_sys_ex_input = handler.OnSysExInput
+    on_midi_input = handler.OnMidiInput
+    latencies = []
+    start = time.perf_counter()
+    for offset, kind, message in session.inputs:
+        if realtime:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        clock.now = offset
+        if coalescer is not None:
+            coalescer.flush_due()
+        if kind == SYS_EX:
+            t0 = time.perf_counter_ns()
+            on_sys_ex_input(*message)
+            latencies.append(time.perf_counter_ns() - t0)
+        else:
+            t0 = time.perf_counter_ns()
+            on_midi_input(*message)
+            latencies.append(time.perf_counter_ns() - t0)
+    if coalescer is not None:
+        coalescer.flush()
+    latencies.sort()
+    expected = [(kind, message) for _, kind, message in session.outputs]
+    actual = [(kind, message) for _, kind, message in transport.sent]
+    return ReplayReport(events=len(latencies),
+                        p50_ns=percentile(latencies, 0.5),
+                        p99_ns=percentile(latencies, 0.99),
+                        max_ns=latencies[-1] if latencies else 0,
+                        expected_outputs=len(expected),
+                        outputs=len(actual),
+                        first_mismatch=compare_outputs(expected, actual))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded MIDI-OX session through the EventHandler')
+    parser.add_argument('session', help='log file written by SessionRecorder')
+    parser.add_argument('--realtime', action='store_true', help='pace the input like the recording')
+    arguments = parser.parse_args(args)
+    report = replay(read_session(arguments.session), realtime=arguments.realtime)
+    print(report)
+    return 0 if report.matches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
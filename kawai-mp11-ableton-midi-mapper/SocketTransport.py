@@ -0,0 +1,243 @@
+import argparse
+import functools
+import logging
+import queue
+import socket
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from Transport import Transport
+
+logger = logging.getLogger(__name__)
+
+# frame: type, port, payload length, payload
+HEADER = struct.Struct('>BBH')
+SHORT_MESSAGE = 1
+SYS_EX_MESSAGE = 2
+# SysEx is not sent to a specific port
+ALL_PORTS = 0xFF
+# the length in the header has 16 bits
+MAX_PAYLOAD = 0xFFFF
+
+
+def encode_short(port: int, status: int, data1: int, data2: int) -> bytes:
+    return HEADER.pack(SHORT_MESSAGE, port, 3) + bytes((status, data1, data2))
+
+
+def encode_sys_ex(port: int, sys_ex: bytes) -> bytes:
+    if len(sys_ex) > MAX_PAYLOAD:
+        raise ValueError(f'SysEx of {len(sys_ex)} bytes does not fit into a frame of at most {MAX_PAYLOAD} bytes')
+    return HEADER.pack(SYS_EX_MESSAGE, port, len(sys_ex)) + sys_ex
+
+
+@functools.lru_cache(maxsize=4096)
+def sys_ex_frame(sys_ex: str) -> bytes:
+    return encode_sys_ex(ALL_PORTS, bytes.fromhex(sys_ex))
+
+
+class FrameReader:
+    """Splits a byte stream into frames, frames may arrive in arbitrary chunks"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> Iterator[Tuple[int, int, bytes]]:
+        buffer = self.buffer
+        buffer += data
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            message_type, port, length = HEADER.unpack_from(buffer, offset)
+            end = offset + HEADER.size + length
+            if end > len(buffer):
+                break
+            yield message_type, port, bytes(buffer[offset + HEADER.size:end])
+            offset = end
+        del buffer[:offset]
+
+
+def receive_frames(sock: socket.socket, reader: FrameReader = None) -> Iterator[Tuple[int, int, bytes]]:
+    reader = reader or FrameReader()
+    while True:
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            return
+        if not data:
+            return
+        yield from reader.feed(data)
+
+
+class SocketTransport(Transport):
+    """
+    Exchanges raw MIDI bytes with a peer over a connected stream socket (TCP or Unix). A reader thread delivers the
+    received frames to the attached handler, SysEx as bytes. Port IDs are given by name, input ports are numbered
+    like the handler expects them after its MIDI-OX correction.
+    """
+
+    def __init__(self, sock: socket.socket, out_port_ids: Dict[str, int] = None, in_port_ids: Dict[str, int] = None):
+        self.sock = sock
+        self.sock_lock = threading.Lock()
+        self.out_port_ids = dict(out_port_ids or {})
+        self.in_port_ids = dict(in_port_ids or {})
+        self.start = time.perf_counter()
+        self.thread = None
+
+    @classmethod
+    def connect_tcp(cls, host: str, port: int, **kwargs) -> 'SocketTransport':
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(sock, **kwargs)
+
+    @classmethod
+    def connect_unix(cls, path: str, **kwargs) -> 'SocketTransport':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        return cls(sock, **kwargs)
+
+    def attach(self, handler):
+        super().attach(handler)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._receive, name='SocketTransport', daemon=True)
+            self.thread.start()
+
+    def send_sys_ex(self, sys_ex: str):
+        self._send(sys_ex_frame(sys_ex))
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        batch_size = batch_size or len(sys_ex_list)
+        for start in range(0, len(sys_ex_list), batch_size):
+            if start and gap:
+                time.sleep(gap)
+            self._send(b''.join(sys_ex_frame(sys_ex) for sys_ex in sys_ex_list[start:start + batch_size]))
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self._send(encode_short(port, status, data1, data2))
+
+    def _send(self, frame: bytes):
+        with self.sock_lock:
+            self.sock.sendall(frame)
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.out_port_ids.setdefault(port_name, len(self.out_port_ids))
+
+    def get_in_port_id(self, port_name: str) -> int:
+        # the handler subtracts 1 from input port IDs, like MIDI-OX reports them
+        return self.in_port_ids.setdefault(port_name, len(self.in_port_ids)) + 1
+
+    def _receive(self):
+        for message_type, port, payload in receive_frames(self.sock):
+            try:
+                if message_type == SYS_EX_MESSAGE:
+                    self.handler.OnSysExInput(payload)
+                elif message_type == SHORT_MESSAGE:
+                    status, data1, data2 = payload
+                    self.handler.OnMidiInput(int((time.perf_counter() - self.start) * 1000), port, status, data1,
+                                             data2)
+            except Exception:
+                logger.exception('failed to handle %s', payload)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+
+class SocketEndpoint:
+    """
+    Peer of SocketTransport, e.g. in front of a native MIDI bridge or as loopback peer for tests and benchmarks.
+    Received frames are put into the received queue as (receive time, type, port, payload).
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.received = queue.Queue()
+        self.thread = threading.Thread(target=self._receive, name='SocketEndpoint', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def listen_tcp(cls, host: str = '127.0.0.1', port: int = 0) -> Tuple[socket.socket, int]:
+        server = socket.create_server((host, port))
+        return server, server.getsockname()[1]
+
+    @classmethod
+    def accept(cls, server: socket.socket) -> 'SocketEndpoint':
+        sock, _ = server.accept()
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(sock)
+
+    def send_midi(self, port: int, status: int, data1: int, data2: int):
+        self.sock.sendall(encode_short(port, status, data1, data2))
+
+    def send_sys_ex(self, sys_ex: bytes, port: int = ALL_PORTS):
+        self.sock.sendall(encode_sys_ex(port, sys_ex))
+
+    def _receive(self):
+        for message_type, port, payload in receive_frames(self.sock):
+            self.received.put((time.perf_counter(), message_type, port, payload))
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.thread.join()
+
+
+def pair() -> Tuple[SocketTransport, SocketEndpoint]:
+    """Returns a transport connected to an endpoint through a local socket pair"""
+    transport_socket, endpoint_socket = socket.socketpair()
+    return SocketTransport(transport_socket), SocketEndpoint(endpoint_socket)
+
+
+def benchmark(count: int = 10000, tcp: bool = False) -> List[float]:
+    """Measures the round trip from a CC sent by the endpoint to the SysEx the handler sends back, in seconds"""
+    from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+    if tcp:
+        server, port = SocketEndpoint.listen_tcp()
+        transport = SocketTransport.connect_tcp('127.0.0.1', port)
+        endpoint = SocketEndpoint.accept(server)
+        server.close()
+    else:
+        transport, endpoint = pair()
+    handler = EventHandler(transport=transport)
+    port = handler.in_ports['loopMIDI']
+    # activate tone 5 in a single section, so that every CC results in exactly one SysEx
+    endpoint.send_midi(port, CC_STATUS_OFFSET + 5, 23, 1)
+    for _ in range(2):
+        endpoint.received.get()
+    round_trips = []
+    for i in range(count):
+        sent = time.perf_counter()
+        # alternate the value so every CC changes the parameter
+        endpoint.send_midi(port, CC_STATUS_OFFSET + 5, 23, i % 2)
+        while True:
+            received, message_type, _, _ = endpoint.received.get()
+            if message_type == SYS_EX_MESSAGE:
+                break
+        round_trips.append(received - sent)
+    transport.close()
+    endpoint.close()
+    return round_trips
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the socket transport against a loopback peer')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--tcp', action='store_true', help='use TCP on localhost instead of a Unix socket pair')
+    arguments = parser.parse_args(args)
+    round_trips = sorted(benchmark(arguments.count, arguments.tcp))
+    print(f'{len(round_trips)} round trips, p50 {round_trips[len(round_trips) // 2] * 1e6:.1f} us, '
+          f'p99 {round_trips[int(len(round_trips) * 0.99)] * 1e6:.1f} us, max {round_trips[-1] * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
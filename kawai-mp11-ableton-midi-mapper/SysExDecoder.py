@@ -0,0 +1,63 @@
+import dataclasses as dc
+from typing import Dict, List, Optional, Tuple, Union
+
+from SysExInfo import SysExInfo
+
+MMC = 'mmc'
+TONE = 'tone'
+PARAMETER = 'parameter'
+
+
+@dc.dataclass
+class DecodedSysEx:
+    kind: str
+    info: SysExInfo
+    section_index: int = 0
+    data_size: int = 0
+    value: int = 0
+
+
+class SysExDecoder:
+    """
+    Resolves incoming SysEx messages through a prefix index built once from the SysExInfo tables. MMC messages have to
+    match completely, section messages are matched by their address prefix, whose last byte is the data size of the
+    message.
+    """
+
+    def __init__(self, simple_info: List[SysExInfo], prefix_info: List[SysExInfo]):
+        self.index: Dict[bytes, Tuple[str, SysExInfo, int, int]] = {}
+        for info in simple_info:
+            self.index[bytes.fromhex(info.sys_ex_strings[0])] = (MMC, info, 0, 0)
+        for info in prefix_info:
+            kind = TONE if info.name == 'tone' else PARAMETER
+            for sys_ex in info.sys_ex_strings:
+                prefix = bytes.fromhex(sys_ex)
+                self.index[prefix] = (kind, info, info.map[sys_ex], prefix[-1])
+        # longest prefixes first so that a longer address always wins over a shorter one
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.index}, reverse=True)
+
+    def decode(self, sys_ex: Union[str, bytes]) -> Optional[DecodedSysEx]:
+        if isinstance(sys_ex, str):
+            try:
+                sys_ex = bytes.fromhex(sys_ex.strip())
+            except ValueError:
+                return None
+        message_length = len(sys_ex)
+        for prefix_length in self.prefix_lengths:
+            entry = self.index.get(sys_ex[:prefix_length])
+            if entry is None:
+                continue
+            kind, info, section_index, data_size = entry
+            if kind == MMC:
+                if message_length == prefix_length:
+                    return DecodedSysEx(kind=kind, info=info)
+                continue
+            data_end = prefix_length + data_size
+            if message_length <= data_end:
+                continue
+            return DecodedSysEx(kind=kind,
+                                info=info,
+                                section_index=section_index,
+                                data_size=data_size,
+                                value=int.from_bytes(sys_ex[prefix_length:data_end], 'big'))
+        return None
@@ -0,0 +1,79 @@
+import re
+from typing import Iterator, Union
+
+SYS_EX_START = 0xF0
+SYS_EX_END = 0xF7
+# realtime messages are single status bytes that may appear anywhere, even inside SysEx
+REALTIME_START = 0xF8
+STATUS_BYTES = re.compile(rb'[\x80-\xff]')
+DATA_BYTES = bytes(range(0x80))
+
+# message states besides the number of bytes collected so far
+OUTSIDE = -1
+OVERFLOW = -2
+
+
+def is_complete(sys_ex: bytes) -> bool:
+    """Whether sys_ex is exactly one SysEx message without interleaved status bytes"""
+    return sys_ex[:1] == b'\xf0' and sys_ex[-1:] == b'\xf7' and len(sys_ex.translate(None, DATA_BYTES)) == 2
+
+
+class SysExFramer:
+    """
+    Reassembles SysEx messages from chunks of raw MIDI bytes, e.g. the parts MIDI-OX splits long messages into. Data
+    bytes are copied into a preallocated buffer in runs between status bytes, realtime bytes are skipped. A status byte
+    other than realtime or F7 aborts the current message, messages longer than max_length are dropped.
+    """
+
+    def __init__(self, max_length: int = 65536):
+        self.buffer = bytearray(max_length)
+        self.view = memoryview(self.buffer)
+        self.length = OUTSIDE
+        self.messages = 0
+        self.dropped = 0
+
+    @property
+    def in_message(self) -> bool:
+        return self.length != OUTSIDE
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> Iterator[bytes]:
+        data = memoryview(data)
+        position = 0
+        for match in STATUS_BYTES.finditer(data):
+            status_position = match.start()
+            self._append(data, position, status_position)
+            position = status_position + 1
+            status = data[status_position]
+            if status >= REALTIME_START:
+                continue
+            if status == SYS_EX_END:
+                if self.length > 0:
+                    self.buffer[self.length] = SYS_EX_END
+                    self.messages += 1
+                    yield bytes(self.view[:self.length + 1])
+                self.length = OUTSIDE
+                continue
+            if self.length > 0:
+                self.dropped += 1
+            if status == SYS_EX_START:
+                self.buffer[0] = SYS_EX_START
+                self.length = 1
+            else:
+                self.length = OUTSIDE
+        self._append(data, position, len(data))
+
+    def _append(self, data: memoryview, start: int, end: int):
+        length = self.length
+        if length < 0 or start == end:
+            return
+        new_length = length + end - start
+        # keep room for F7
+        if new_length >= len(self.buffer):
+            self.dropped += 1
+            self.length = OVERFLOW
+            return
+        self.view[length:new_length] = data[start:end]
+        self.length = new_length
+
+    def reset(self):
+        self.length = OUTSIDE
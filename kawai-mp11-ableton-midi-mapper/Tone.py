@@ -1,8 +1,54 @@
-import dataclasses as dc
-from typing import Dict
+from typing import Iterator, Tuple
+
+PARAMETER_COUNT = 128
 
 
-@dc.dataclass
 class Tone:
-    id: int = 0
-    map: Dict = dc.field(default_factory=lambda: {})
+    """
+    Parameter values of a tone indexed by control number, one byte each. The dirty bitmap marks the control numbers
+    that were assigned a value and are restored when the tone is recalled.
+    """
+    __slots__ = ('id', 'values', 'dirty')
+
+    def __init__(self, id: int = 0, values: bytearray = None, dirty: int = 0):
+        self.id = id
+        self.values = bytearray(PARAMETER_COUNT) if values is None else values
+        self.dirty = dirty
+
+    def __repr__(self):
+        return f'Tone(id={self.id}, parameters={dict(self.parameters())})'
+
+    def __eq__(self, other):
+        return (isinstance(other, Tone) and self.id == other.id and self.dirty == other.dirty
+                and self.values == other.values)
+
+    def set(self, control_number: int, value: int):
+        self.values[control_number] = value
+        self.dirty |= 1 << control_number
+
+    def get(self, control_number: int, default: int = None):
+        return self.values[control_number] if self.dirty >> control_number & 1 else default
+
+    def parameters(self) -> Iterator[Tuple[int, int]]:
+        """Yields (control number, value) of all assigned parameters in order of their control numbers"""
+        dirty = self.dirty
+        values = self.values
+        while dirty:
+            lowest_bit = dirty & -dirty
+            control_number = lowest_bit.bit_length() - 1
+            yield control_number, values[control_number]
+            dirty ^= lowest_bit
+
+    def copy(self) -> 'Tone':
+        return Tone(id=self.id, values=bytearray(self.values), dirty=self.dirty)
+
+    def diff(self, other: 'Tone') -> int:
+        """Returns the bitmap of control numbers whose assignment or value differs between both tones"""
+        different = self.dirty ^ other.dirty
+        both = self.dirty & other.dirty
+        if self.values == other.values:
+            return different
+        for control_number, (value, other_value) in enumerate(zip(self.values, other.values)):
+            if value != other_value and both >> control_number & 1:
+                different |= 1 << control_number
+        return different
@@ -0,0 +1,168 @@
+import collections
+import dataclasses as dc
+import os
+import struct
+import threading
+from typing import List
+
+from Tone import Tone, PARAMETER_COUNT
+
+PARAMETER = 1
+ACTIVE_TONE = 2
+ACTIVE_SECTION = 3
+
+RECORD = struct.Struct('4B')
+SNAPSHOT_MAGIC = b'MP11TJ01'
+DIRTY_BYTES = PARAMETER_COUNT // 8
+JOURNAL_FILE = 'tones.journal'
+SNAPSHOT_FILE = 'tones.snapshot'
+
+
+@dc.dataclass
+class JournalState:
+    tones: List[Tone]
+    active_tone_ids: List[int]
+    active_section_index: int = 1
+
+    def apply(self, record_type: int, a: int, b: int, c: int):
+        if record_type == PARAMETER:
+            self.tones[a].set(b, c)
+        elif record_type == ACTIVE_TONE:
+            self.active_tone_ids[a] = b
+        elif record_type == ACTIVE_SECTION:
+            self.active_section_index = a
+
+
+class ToneJournal:
+    """
+    Persists tone state as an append-only journal of fixed-size records in a directory. Recording only appends to an
+    in-memory queue, a background thread writes the records in batches, fsyncs them every flush_interval seconds and
+    compacts the journal into a snapshot after snapshot_records records.
+    """
+
+    def __init__(self, directory: str, tone_count: int = 16, section_count: int = 3, flush_interval: float = 0.5,
+                 snapshot_records: int = 10000):
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.flush_interval = flush_interval
+        self.snapshot_records = snapshot_records
+        self.state = load(directory, tone_count, section_count)
+        self.pending = collections.deque()
+        self.journal_records = 0
+        if os.path.exists(self.journal_path):
+            self.journal_records = os.path.getsize(self.journal_path) // RECORD.size
+            # drop a partially written record, so that new records stay aligned
+            os.truncate(self.journal_path, self.journal_records * RECORD.size)
+        self.file = open(self.journal_path, 'ab')
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def record_parameter(self, tone_id: int, control_number: int, value: int):
+        self.pending.append((PARAMETER, tone_id, control_number, value))
+
+    def record_active_tone(self, section_index: int, tone_id: int):
+        self.pending.append((ACTIVE_TONE, section_index, tone_id, 0))
+
+    def record_active_section(self, section_index: int):
+        self.pending.append((ACTIVE_SECTION, section_index, 0, 0))
+
+    def restore(self, handler):
+        """Loads the persisted state into the handler"""
+        for tone, persisted_tone in zip(handler.tones, self.state.tones):
+            tone.values[:] = persisted_tone.values
+            tone.dirty = persisted_tone.dirty
+        for section, tone_id in zip(handler.sections, self.state.active_tone_ids):
+            handler.activate_tone(section=section, tone=handler.tones[tone_id])
+        handler.active_section = handler.sections[self.state.active_section_index]
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='ToneJournal', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        self.compact()
+        self.file.close()
+
+    def flush(self):
+        """Writes and fsyncs all pending records"""
+        records = bytearray()
+        pending = self.pending
+        while pending:
+            record = pending.popleft()
+            self.state.apply(*record)
+            records += RECORD.pack(*record)
+        if records:
+            self.file.write(records)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.journal_records += len(records) // RECORD.size
+
+    def compact(self):
+        """Writes the current state as snapshot and starts a new journal"""
+        temp_path = f'{self.snapshot_path}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(serialize(self.state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self.file.close()
+        self.file = open(self.journal_path, 'wb')
+        self.journal_records = 0
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+            if self.journal_records >= self.snapshot_records:
+                self.compact()
+
+
+def serialize(state: JournalState) -> bytes:
+    data = bytearray(SNAPSHOT_MAGIC)
+    data += bytes([len(state.tones), len(state.active_tone_ids), state.active_section_index])
+    data += bytes(state.active_tone_ids)
+    for tone in state.tones:
+        data += tone.values
+        data += tone.dirty.to_bytes(DIRTY_BYTES, 'little')
+    return bytes(data)
+
+
+def deserialize(data: bytes) -> JournalState:
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError('not a tone journal snapshot')
+    offset = len(SNAPSHOT_MAGIC)
+    tone_count, section_count, active_section_index = data[offset:offset + 3]
+    offset += 3
+    active_tone_ids = list(data[offset:offset + section_count])
+    offset += section_count
+    tones = []
+    for tone_id in range(tone_count):
+        values = bytearray(data[offset:offset + PARAMETER_COUNT])
+        offset += PARAMETER_COUNT
+        dirty = int.from_bytes(data[offset:offset + DIRTY_BYTES], 'little')
+        offset += DIRTY_BYTES
+        tones.append(Tone(id=tone_id, values=values, dirty=dirty))
+    return JournalState(tones=tones, active_tone_ids=active_tone_ids, active_section_index=active_section_index)
+
+
+def load(directory: str, tone_count: int = 16, section_count: int = 3) -> JournalState:
+    """Restores the state from the snapshot and the journal written after it"""
+    snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+    journal_path = os.path.join(directory, JOURNAL_FILE)
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'rb') as file:
+            state = deserialize(file.read())
+    else:
+        state = JournalState(tones=[Tone(id=i) for i in range(tone_count)], active_tone_ids=[0] * section_count)
+    if os.path.exists(journal_path):
+        with open(journal_path, 'rb') as file:
+            data = file.read()
+        # a record that was only partially written before a crash is ignored
+        for record in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+            state.apply(*record)
+    return state
@@ -0,0 +1,32 @@
+from typing import Dict, List, Tuple
+
+from consts import KAWAI_SECTION_NAMES
+
+TONE_COUNT = 16
+# tone numbers of PIANO, E.PIANO and SUB start at 0, 12 and 24 on the mp11
+SECTION_TONE_OFFSETS = [0, 12, 24]
+
+
+def _mp11_tone_number(tone_id: int, section_index: int) -> int:
+    if section_index in range(2):
+        return tone_id + section_index * 12
+    # each 4th tone in sub is reserved for return tracks (12, 13, 14, 15 are 3, 7, 11, 15 instead)
+    return tone_id + (tone_id // 3) - (int(tone_id > 11) * (4 + 3 * (15 - tone_id)) + int(tone_id == 15)) + 24
+
+
+def _tone_id(section_index: int, tone_number: int) -> int:
+    if section_index in range(2):
+        return tone_number - (section_index * 12)
+    raw_channel = tone_number - 24
+    return int(raw_channel - raw_channel // 4 + int(not bool((raw_channel + 1) % 4)) * (
+            11 - (2 * ((raw_channel + 1) / 4))))
+
+
+# (tone id, section) -> mp11 tone number
+MP11_TONE_NUMBERS: List[List[int]] = [[_mp11_tone_number(tone_id, section_index)
+                                       for section_index in range(len(KAWAI_SECTION_NAMES))]
+                                      for tone_id in range(TONE_COUNT)]
+# (section, mp11 tone number) -> tone id
+TONE_IDS: Dict[Tuple[int, int], int] = {(section_index, tone_number): _tone_id(section_index, tone_number)
+                                        for section_index, offset in enumerate(SECTION_TONE_OFFSETS)
+                                        for tone_number in range(offset, offset + TONE_COUNT)}
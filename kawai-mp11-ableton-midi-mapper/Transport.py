@@ -0,0 +1,143 @@
+import time
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import pythoncom
+    import win32com.client as win32
+except ImportError:
+    pythoncom = None
+    win32 = None
+
+SYS_EX = 'sys_ex'
+SYS_EX_BATCH = 'sys_ex_batch'
+MIDI = 'midi'
+
+
+class Transport:
+    """
+    Interface between EventHandler and the MIDI ports. Input is delivered by calling the OnSysExInput() and
+    OnMidiInput() methods of the attached handler.
+    """
+    handler = None
+
+    def attach(self, handler):
+        self.handler = handler
+
+    def send_sys_ex(self, sys_ex: str):
+        raise NotImplementedError
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        """
+        Sends several SysEx messages with at most batch_size of them in one call of the bulk form of the transport,
+        all of them if not given, and waits gap seconds between calls. Without bulk form every message is a call.
+        """
+        for i, sys_ex in enumerate(sys_ex_list):
+            if i and gap:
+                time.sleep(gap)
+            self.send_sys_ex(sys_ex)
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        raise NotImplementedError
+
+    def get_out_port_id(self, port_name: str) -> int:
+        raise NotImplementedError
+
+    def get_in_port_id(self, port_name: str) -> int:
+        raise NotImplementedError
+
+    def for_thread(self) -> Callable[[], 'Transport']:
+        """
+        Called on the thread that owns the transport, the returned function is called once on another thread and
+        returns a transport that may send from there
+        """
+        return lambda: self
+
+    def close(self):
+        pass
+
+
+class MidiOxTransport(Transport):
+    """Sends through the MIDI-OX COM object, input arrives through its event sink"""
+
+    def __init__(self, mox):
+        self.mox = mox
+
+    def send_sys_ex(self, sys_ex: str):
+        self.mox.SendSysExString(sys_ex)
+
+    def send_sys_ex_batch(self, sys_ex_list: List[str], batch_size: int = None, gap: float = 0):
+        # MIDI-OX sends a string of several messages as one stream
+        batch_size = batch_size or len(sys_ex_list)
+        for start in range(0, len(sys_ex_list), batch_size):
+            if start and gap:
+                time.sleep(gap)
+            self.mox.SendSysExString(' '.join(sys_ex_list[start:start + batch_size]))
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.mox.OutputMidiMsg(port, status, data1, data2)
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.mox.GetOutPortID(port_name)
+
+    def get_in_port_id(self, port_name: str) -> int:
+        return self.mox.GetInPortID(port_name)
+
+    def for_thread(self) -> Callable[[], 'Transport']:
+        # COM objects have to be marshalled to be used from another apartment
+        stream = pythoncom.CoMarshalInterThreadInterfaceInStream(pythoncom.IID_IDispatch, self.mox._oleobj_)
+
+        def unmarshal():
+            pythoncom.CoInitialize()
+            return MidiOxThreadTransport(
+                win32.Dispatch(pythoncom.CoGetInterfaceAndReleaseStream(stream, pythoncom.IID_IDispatch)))
+
+        return unmarshal
+
+
+class MidiOxThreadTransport(MidiOxTransport):
+    def close(self):
+        self.mox = None
+        pythoncom.CoUninitialize()
+
+
+class LoopbackTransport(Transport):
+    """
+    In-memory stand-in for MIDI-OX. Outgoing messages are recorded with timestamps in sent, input events can be
+    injected into the attached handler. Port IDs are assigned in the order the port names are first requested,
+    unless given explicitly.
+    """
+
+    def __init__(self, out_port_ids: Dict[str, int] = None, in_port_ids: Dict[str, int] = None,
+                 clock=time.perf_counter):
+        self.out_port_ids = dict(out_port_ids or {})
+        self.in_port_ids = dict(in_port_ids or {})
+        self.clock = clock
+        self.sent: List[Tuple[float, str, tuple]] = []
+
+    def send_sys_ex(self, sys_ex: str):
+        self.sent.append((self.clock(), SYS_EX, (sys_ex,)))
+
+    def output_midi_msg(self, port: int, status: int, data1: int, data2: int):
+        self.sent.append((self.clock(), MIDI, (port, status, data1, data2)))
+
+    def get_out_port_id(self, port_name: str) -> int:
+        return self.out_port_ids.setdefault(port_name, len(self.out_port_ids))
+
+    def get_in_port_id(self, port_name: str) -> int:
+        # MIDI-OX numbers input ports starting at 1
+        return self.in_port_ids.setdefault(port_name, len(self.in_port_ids) + 1)
+
+    def inject_sys_ex(self, sys_ex: str):
+        return self.handler.OnSysExInput(sys_ex)
+
+    def inject_midi(self, port_name: str, status: int, data1: int, data2: int, timestamp: int = None):
+        if timestamp is None:
+            timestamp = int(self.clock() * 1000)
+        # like MIDI-OX, report input ports too small by 1
+        return self.handler.OnMidiInput(timestamp, self.get_in_port_id(port_name) - 1, status, data1, data2)
+
+    def messages(self, kind: str = None) -> List[tuple]:
+        return [message for _, message_kind, message in self.sent if kind is None or message_kind == kind]
+
+    def clear(self):
+        self.sent.clear()
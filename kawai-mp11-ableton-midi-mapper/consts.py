@@ -1 +1,9 @@
 KAWAI_SECTION_NAMES = ['PIANO', 'E.PIANO', 'SUB']
+
+# handler paths, returned by EventHandler.OnSysExInput() and EventHandler.OnMidiInput()
+MMC_PATH = 'mmc'
+TONE_SWITCH_PATH = 'tone switch'
+SECTION_PARAMETER_PATH = 'section parameter'
+REVERSE_CC_PATH = 'reverse cc'
+IGNORED_PATH = 'ignored'
+ECHO_PATH = 'echo'
@@ -0,0 +1,113 @@
+import asyncio
+
+from pytest import fixture
+
+from AsyncMapper import AsyncMapper, CollectingTransport, InputEvent, OutputEvent
+from MidiOxProxy import CC_STATUS_OFFSET
+from SocketTransport import SocketEndpoint, SHORT_MESSAGE
+from SysExDecoder import PARAMETER
+from Transport import SYS_EX, MIDI
+from consts import MMC_PATH
+
+
+@fixture
+def cut() -> AsyncMapper:
+    return AsyncMapper(maxsize=4)
+
+
+def test_sys_ex_input_is_streamed(cut):
+    async def run():
+        async with cut:
+            inputs = cut.inputs()
+            outputs = cut.outputs()
+            path = await cut.sys_ex_input('F0 40 00 10 00 12 40 03 14 01 40 F7')
+            return path, await inputs.__anext__(), await outputs.__anext__()
+
+    path, input_event, output_event = asyncio.run(run())
+    assert input_event.path == path
+    assert input_event.kind == SYS_EX
+    assert input_event.decoded.kind == PARAMETER
+    assert input_event.decoded.value == 64
+    assert output_event == OutputEvent(MIDI, (cut.handler.out_ports['loopMIDI'], CC_STATUS_OFFSET, 23, 64))
+
+
+def test_midi_input_sends_sys_ex():
+    async def run():
+        async with AsyncMapper() as mapper:
+            outputs = mapper.outputs()
+            await mapper.midi_input('loopMIDI', CC_STATUS_OFFSET + 5, 23, 100)
+            return [await outputs.__anext__() for _ in range(2)]
+
+    assert asyncio.run(run()) == [OutputEvent(SYS_EX, ('F0 40 00 10 00 12 40 02 04 02 00 11 F7',)),
+                                  OutputEvent(SYS_EX, ('F0 40 00 10 00 12 40 03 14 01 64 F7',))]
+
+
+def test_streams_end_on_exit(cut):
+    async def run():
+        async with cut:
+            outputs = cut.outputs()
+            await cut.send_sys_ex('F0 7F 00 06 02 F7')
+        return [event async for event in outputs]
+
+    assert asyncio.run(run()) == [OutputEvent(SYS_EX, ('F0 7F 00 06 02 F7',))]
+
+
+def test_full_stream_applies_backpressure(cut):
+    async def run():
+        async with cut:
+            outputs = cut.outputs()
+            sends = asyncio.gather(*[cut.send_sys_ex('F0 7F 00 06 02 F7') for _ in range(6)])
+            await asyncio.sleep(0.01)
+            blocked = outputs.queue.full() and not sends.done()
+            received = [await outputs.__anext__() for _ in range(6)]
+            await sends
+            return blocked, len(received)
+
+    assert asyncio.run(run()) == (True, 6)
+
+
+def test_closing_full_stream_releases_sends(cut):
+    async def run():
+        async with cut:
+            outputs = cut.outputs()
+            sends = asyncio.gather(*[cut.send_sys_ex('F0 7F 00 06 02 F7') for _ in range(6)])
+            await asyncio.sleep(0.01)
+            blocked = outputs.queue.full() and not sends.done()
+            cut.close_stream(outputs)
+            await asyncio.wait_for(sends, 1)
+            path = await asyncio.wait_for(cut.sys_ex_input('F0 7F 00 06 02 F7'), 1)
+            return blocked, path, [event async for event in outputs]
+
+    blocked, path, received = asyncio.run(run())
+    assert blocked
+    assert path == MMC_PATH
+    # the events queued before the stream was closed are still delivered
+    assert len(received) == 4
+
+
+def test_batch_gap_is_awaited():
+    transport = CollectingTransport()
+    transport.send_sys_ex_batch(['F0 7F 00 06 02 F7'] * 3, batch_size=2, gap=0.01)
+    assert transport.take() == [OutputEvent(SYS_EX, ('F0 7F 00 06 02 F7',))] * 2 + [0.01] + \
+        [OutputEvent(SYS_EX, ('F0 7F 00 06 02 F7',))]
+    assert transport.collected == []
+
+
+def test_tcp_peer():
+    server, port = SocketEndpoint.listen_tcp()
+
+    async def run():
+        async with AsyncMapper(address=('127.0.0.1', port)) as mapper:
+            inputs = mapper.inputs()
+            endpoint = SocketEndpoint.accept(server)
+            endpoint.send_sys_ex(bytes.fromhex('F0 40 00 10 00 12 40 03 14 01 40 F7'))
+            event = await asyncio.wait_for(inputs.__anext__(), 5)
+            received = await asyncio.get_running_loop().run_in_executor(None, endpoint.received.get, True, 5)
+            endpoint.close()
+            return mapper.handler.out_ports['loopMIDI'], event, received
+
+    out_port, event, received = asyncio.run(run())
+    server.close()
+    assert isinstance(event, InputEvent)
+    assert event.message == (bytes.fromhex('F0 40 00 10 00 12 40 03 14 01 40 F7'),)
+    assert received[1:] == (SHORT_MESSAGE, out_port, bytes((CC_STATUS_OFFSET, 23, 64)))
@@ -0,0 +1,84 @@
+import copy
+import random
+
+from pytest import fixture, importorskip
+
+np = importorskip('numpy')
+
+from BatchConverter import EVENT_DTYPE, convert, decode_events, to_midi_messages
+from MappingTables import MappingTables
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET, PREFIX_SYS_EX_INFO, SIMPLE_SYS_EX_INFO, int_to_hex
+from ToneRouting import MP11_TONE_NUMBERS
+from Transport import LoopbackTransport, MIDI
+
+
+def random_sys_ex(count: int, seed: int = 0):
+    generator = random.Random(seed)
+    tone_info = next(info for info in PREFIX_SYS_EX_INFO if info.name == 'tone')
+    parameter_info = [info for info in PREFIX_SYS_EX_INFO if info.name != 'tone']
+    messages = []
+    for i in range(count):
+        kind = generator.random()
+        section_index = generator.randrange(3)
+        if kind < 0.1:
+            sys_ex = generator.choice(SIMPLE_SYS_EX_INFO).sys_ex_strings[0]
+        elif kind < 0.3:
+            # mostly known tones, sometimes tone numbers without tone
+            tone_number = (MP11_TONE_NUMBERS[generator.randrange(16)][section_index] if generator.random() < 0.9
+                           else generator.randrange(128))
+            sys_ex = f'{tone_info.sys_ex_strings[section_index]} 00 {int_to_hex(tone_number)} F7'
+        elif kind < 0.95:
+            info = generator.choice(parameter_info)
+            sys_ex = f'{info.sys_ex_strings[section_index]} {int_to_hex(generator.randrange(128))} F7'
+        else:
+            sys_ex = 'F0 7E 00 06 01 F7'
+        messages.append((i * 10, sys_ex))
+    return messages
+
+
+@fixture
+def handler() -> EventHandler:
+    yield EventHandler(transport=LoopbackTransport())
+
+
+def test_matches_per_event_path(handler):
+    messages = random_sys_ex(5000)
+    # start from a state that differs from a new handler
+    handler.OnSysExInput('F0 7F 00 06 09 F7')
+    handler.OnSysExInput(handler.tables.tone_activation_sys_ex[2][5])
+    assert handler.active_section.index == 2
+    assert handler.sections[2].active_tone.id == 5
+    outputs = convert(decode_events(messages), handler=handler)
+    transport = handler.transport
+    transport.clear()
+    for _, sys_ex in messages:
+        handler.OnSysExInput(sys_ex)
+    expected = transport.messages(MIDI)
+    assert to_midi_messages(outputs, handler.out_ports['loopMIDI']).tolist() == [list(message) for message in expected]
+
+
+def test_uses_reloaded_tables(handler):
+    mapping = copy.deepcopy(handler.tables.mapping)
+    # move the section volume from control number 23 to 40
+    for info in mapping['prefix_sys_ex_info']:
+        if info['control_number'] == 23:
+            info['control_number'] = 40
+    mapping['assigned_control_numbers']['section volume'] = 40
+    mapping['reverse_control_numbers'] = [40 if control_number == 23 else control_number
+                                          for control_number in mapping['reverse_control_numbers']]
+    handler.reload_tables(MappingTables(mapping))
+    handler.OnSysExInput('F0 7E 00 06 01 F7')
+    messages = [(0, 'F0 40 00 10 00 12 40 03 14 01 40 F7')]
+    outputs = convert(decode_events(messages, handler.tables), handler=handler)
+    assert to_midi_messages(outputs, handler.out_ports['loopMIDI']).tolist() == [
+        [handler.out_ports['loopMIDI'], CC_STATUS_OFFSET, 40, 64]]
+
+
+def test_timestamps():
+    outputs = convert(decode_events([(5, 'F0 40 00 10 00 12 40 03 14 01 40 F7'), (6, 'F0 7E 00 06 01 F7'),
+                                     (7, 'F0 7F 00 06 09 F7')]))
+    assert outputs['timestamp'].tolist() == [5, 7]
+
+
+def test_empty():
+    assert len(convert(np.empty(0, dtype=EVENT_DTYPE))) == 0
@@ -0,0 +1,52 @@
+import json
+import os
+
+from pytest import mark
+
+from Benchmarks import ALLOCATION_BENCHMARKS, BENCHMARKS, compare, main, measure_allocations, run
+
+with open(os.path.join(os.path.dirname(__file__), 'allocation_budgets.json')) as budgets_file:
+    ALLOCATION_BUDGETS = json.load(budgets_file)
+
+
+def results(best_ns: dict) -> dict:
+    return {'results': {name: {'best_ns': ns} for name, ns in best_ns.items()}}
+
+
+def test_compare():
+    comparisons = compare(results({'sys_ex.mmc': 1000, 'midi.matching': 1000, 'sys_ex.unknown': 1000}),
+                          results({'sys_ex.mmc': 1100, 'midi.matching': 1300, 'recall.all': 1000}), threshold=0.2)
+    assert [(comparison['name'], comparison['regression']) for comparison in comparisons] == [
+        ('sys_ex.mmc', False), ('midi.matching', True)]
+
+
+def test_run_all_benchmarks():
+    assert set(run(repeat=1, min_time=0)['results']) == set(BENCHMARKS)
+
+
+def test_main_fails_on_regression(tmp_path):
+    baseline_path = tmp_path / 'baseline.json'
+    current_path = tmp_path / 'current.json'
+    baseline_path.write_text(json.dumps(results({'sys_ex.mmc': 1000})))
+    current_path.write_text(json.dumps(results({'sys_ex.mmc': 1500})))
+    assert main(['compare', str(baseline_path), str(current_path)]) == 1
+    assert main(['compare', str(baseline_path), str(current_path), '--threshold', '0.6']) == 0
+
+
+def test_all_allocation_benchmarks_have_budgets():
+    assert set(ALLOCATION_BUDGETS) == set(ALLOCATION_BENCHMARKS)
+
+
+@mark.parametrize('name', ALLOCATION_BENCHMARKS)
+def test_allocation_budget(name):
+    allocations = measure_allocations(BENCHMARKS[name]())
+    budget = ALLOCATION_BUDGETS[name]
+    assert allocations['peak_bytes'] <= budget['peak_bytes']
+    assert allocations['retained_bytes'] <= budget['retained_bytes']
+
+
+def test_measure_allocations_detects_retained_memory():
+    retained = []
+    allocations = measure_allocations(lambda: retained.append(bytearray(100)), number=100, warm_up=0)
+    assert allocations['retained_bytes'] >= 100
+    assert allocations['peak_bytes'] >= 100
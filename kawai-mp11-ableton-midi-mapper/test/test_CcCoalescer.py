@@ -0,0 +1,120 @@
+import time
+
+from pytest import fixture
+
+from CcCoalescer import CcCoalescer
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from Transport import LoopbackTransport, SYS_EX
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@fixture
+def clock() -> Clock:
+    yield Clock()
+
+
+@fixture
+def delivered():
+    yield []
+
+
+@fixture
+def cut(clock, delivered) -> CcCoalescer:
+    coalescer = CcCoalescer(max_rate=10, clock=clock)
+    coalescer.attach(lambda key, value: delivered.append((key, value)))
+    yield coalescer
+
+
+def test_first_value_is_delivered_immediately(cut, delivered):
+    cut.submit('a', 1)
+    assert delivered == [('a', 1)]
+    assert cut.queue_depth == 0
+
+
+def test_keeps_only_latest_value_within_interval(cut, clock, delivered):
+    cut.submit('a', 1)
+    for value in range(2, 10):
+        clock.now += 0.01
+        cut.submit('a', value)
+    assert delivered == [('a', 1)]
+    assert cut.queue_depth == 1
+    assert cut.dropped == 7
+    clock.now = 0.1
+    cut.flush_due()
+    assert delivered == [('a', 1), ('a', 9)]
+    assert cut.queue_depth == 0
+
+
+def test_keys_are_limited_independently(cut, clock, delivered):
+    cut.submit('a', 1)
+    cut.submit('b', 1)
+    cut.submit('a', 2)
+    assert delivered == [('a', 1), ('b', 1)]
+
+
+def test_drops_unchanged_values(cut, clock, delivered):
+    cut.submit('a', 1)
+    clock.now = 1
+    cut.submit('a', 1)
+    cut.submit('a', 2)
+    clock.now = 1.01
+    cut.submit('a', 1)
+    cut.submit('a', 2)
+    assert delivered == [('a', 1), ('a', 2)]
+    assert cut.queue_depth == 0
+    assert cut.dropped == 2
+    cut.invalidate('a')
+    clock.now = 2
+    cut.submit('a', 2)
+    assert delivered == [('a', 1), ('a', 2), ('a', 2)]
+
+
+def test_background_thread_delivers_last_value(delivered):
+    cut = CcCoalescer(max_rate=100)
+    cut.attach(lambda key, value: delivered.append((key, value)))
+    cut.start()
+    for value in range(50):
+        cut.submit('a', value)
+    cut.stop()
+    assert delivered[0] == ('a', 0)
+    assert delivered[-1] == ('a', 49)
+
+
+def test_event_handler_coalesces_ccs(clock):
+    transport = LoopbackTransport()
+    handler = EventHandler(transport=transport, coalescer=CcCoalescer(max_rate=10, clock=clock))
+    for value in range(0, 128, 8):
+        transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 23, value)
+    assert transport.messages(SYS_EX)[-1] == ('F0 40 00 10 00 12 40 04 38 01 00 F7',)
+    clock.now = 1
+    handler.coalescer.flush_due()
+    assert transport.messages(SYS_EX)[-1] == ('F0 40 00 10 00 12 40 04 38 01 78 F7',)
+    assert len(transport.messages(SYS_EX)) == 6
+    assert handler.tones[0].get(23) == 0x78
+
+
+def test_background_thread_delivers_under_handler_lock():
+    class LockCheckingTransport(LoopbackTransport):
+        def send_sys_ex(self, sys_ex: str):
+            locked.append(handler.lock._is_owned())
+            super().send_sys_ex(sys_ex)
+
+    locked = []
+    transport = LockCheckingTransport()
+    handler = EventHandler(transport=transport, coalescer=CcCoalescer(max_rate=20))
+    handler.coalescer.start()
+    for value in [10, 20]:
+        transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 23, value)
+    deadline = time.monotonic() + 2
+    while handler.coalescer.queue_depth and time.monotonic() < deadline:
+        time.sleep(0.01)
+    handler.coalescer.stop()
+    assert transport.messages(SYS_EX)[-1] == ('F0 40 00 10 00 12 40 04 38 01 14 F7',)
+    assert locked == [True] * 6
@@ -0,0 +1,74 @@
+from pytest import fixture
+
+from EchoSuppressor import EchoSuppressor
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from Transport import LoopbackTransport, SYS_EX, MIDI
+from consts import ECHO_PATH, REVERSE_CC_PATH, SECTION_PARAMETER_PATH
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@fixture
+def clock() -> Clock:
+    yield Clock()
+
+
+@fixture
+def cut(clock) -> EchoSuppressor:
+    yield EchoSuppressor(ttl=0.05, clock=clock, purge_interval=4)
+
+
+@fixture
+def transport() -> LoopbackTransport:
+    yield LoopbackTransport()
+
+
+@fixture
+def handler(transport, cut) -> EventHandler:
+    yield EventHandler(transport=transport, echo_suppressor=cut)
+
+
+def test_echo_is_consumed(cut):
+    cut.expect(('loopMIDI', 176, 23, 100))
+    assert cut.is_echo(('loopMIDI', 176, 23, 100))
+    assert not cut.is_echo(('loopMIDI', 176, 23, 100))
+    assert cut.suppressed == 1
+
+
+def test_echo_expires(cut, clock):
+    cut.expect(('loopMIDI', 176, 23, 100))
+    clock.now = 0.06
+    assert not cut.is_echo(('loopMIDI', 176, 23, 100))
+    assert cut.suppressed == 0
+
+
+def test_expired_keys_are_purged(cut, clock):
+    for value in range(3):
+        cut.expect(('loopMIDI', 176, 23, value))
+    clock.now = 0.06
+    cut.expect(('loopMIDI', 176, 23, 3))
+    assert len(cut) == 1
+
+
+def test_ableton_echo(handler, transport, cut):
+    assert transport.inject_sys_ex('F0 40 00 10 00 12 40 01 70 01 40 F7') == SECTION_PARAMETER_PATH
+    assert transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 23, 64) == ECHO_PATH
+    assert transport.messages(SYS_EX) == []
+    # a real change of the same control still goes through
+    assert transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 23, 65) == REVERSE_CC_PATH
+    assert cut.suppressed == 1
+
+
+def test_mp11_echo(handler, transport, cut):
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    # the mp11 reports the tone activation and the parameter change back
+    assert transport.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 11 F7') == ECHO_PATH
+    assert transport.inject_sys_ex('F0 40 00 10 00 12 40 03 14 01 64 F7') == ECHO_PATH
+    assert transport.messages(MIDI) == []
+    assert cut.suppressed == 2
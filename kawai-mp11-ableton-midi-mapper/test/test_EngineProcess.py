@@ -0,0 +1,131 @@
+import time
+import types
+
+from pytest import fixture, raises
+
+from EngineProcess import EngineProcess, RingBuffer, RingTransport, MIDI_RECORD, SYS_EX_RECORD, SYS_EX_BATCH_RECORD, \
+    benchmark
+import MidiOxProxy
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET, DEFAULT_IN_PORT_NAMES
+from Transport import LoopbackTransport, MIDI
+
+LOOP_MIDI = DEFAULT_IN_PORT_NAMES['loopMIDI']
+
+
+@fixture
+def ring():
+    ring = RingBuffer.create(capacity=4)
+    yield ring
+    ring.close()
+
+
+@fixture
+def cut():
+    transport = LoopbackTransport()
+    with EngineProcess(transport) as engine_process:
+        yield engine_process, transport
+
+
+def wait_for_messages(transport: LoopbackTransport, count: int, timeout: float = 5) -> list:
+    deadline = time.monotonic() + timeout
+    while len(transport.sent) < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return transport.messages()
+
+
+def test_ring_keeps_order_across_wrap_around(ring):
+    for i in range(10):
+        assert ring.put(MIDI_RECORD, 1, i, bytes((CC_STATUS_OFFSET, 23, i)))
+        assert ring.drain() == [(MIDI_RECORD, 1, i, bytes((CC_STATUS_OFFSET, 23, i)))]
+    assert len(ring) == 0
+
+
+def test_full_ring_rejects_records(ring):
+    assert all(ring.put(SYS_EX_RECORD, 0, 0, bytes([i])) for i in range(4))
+    assert not ring.put(SYS_EX_RECORD, 0, 0, b'\x04')
+    assert [payload for _, _, _, payload in ring.drain(limit=3)] == [b'\x00', b'\x01', b'\x02']
+    assert ring.put(SYS_EX_RECORD, 0, 0, b'\x04')
+    assert [payload for _, _, _, payload in ring.drain()] == [b'\x03', b'\x04']
+
+
+def test_attached_ring_shares_records(ring):
+    attached = RingBuffer.attach(ring.name, ring.capacity)
+    try:
+        ring.put(SYS_EX_RECORD, 0, 0, bytes.fromhex('F0 7F 00 06 02 F7'))
+        assert attached.drain() == [(SYS_EX_RECORD, 0, 0, bytes.fromhex('F0 7F 00 06 02 F7'))]
+        assert len(ring) == 0
+    finally:
+        attached.close()
+
+
+def test_reverse_cc_is_mapped_in_worker(cut):
+    engine_process, transport = cut
+    transport.inject_midi(LOOP_MIDI, CC_STATUS_OFFSET + 5, 23, 100)
+    assert wait_for_messages(transport, 2) == [('F0 40 00 10 00 12 40 02 04 02 00 11 F7',),
+                                               ('F0 40 00 10 00 12 40 03 14 01 64 F7',)]
+
+
+def test_sys_ex_is_mapped_in_worker(cut):
+    engine_process, transport = cut
+    # parts of a split message are reassembled by the handler in the worker
+    sys_ex = bytes.fromhex('F0 40 00 10 00 12 40 03 14 01 40 F7')
+    transport.handler.OnSysExInput(sys_ex[:5])
+    transport.handler.OnSysExInput(sys_ex[5:])
+    assert wait_for_messages(transport, 1) == [(transport.get_out_port_id('loopMIDI Port'), CC_STATUS_OFFSET, 23, 64)]
+    assert transport.sent[0][1] == MIDI
+
+
+def test_midi_ox_proxy_forwards_input_to_worker(monkeypatch):
+    transport = LoopbackTransport()
+    # the event sink of MIDI-OX on a loopback transport
+    monkeypatch.setattr(MidiOxProxy, 'win32', types.SimpleNamespace(
+        DispatchWithEvents=lambda prog_id, sink: EventHandler(transport=transport)))
+    with MidiOxProxy.MidiOxProxy(engine_process=True) as mox:
+        assert mox.OnMidiInput(0, mox.in_ports['loopMIDI'], CC_STATUS_OFFSET + 5, 23, 100) is None
+        assert wait_for_messages(transport, 2) == [('F0 40 00 10 00 12 40 02 04 02 00 11 F7',),
+                                                   ('F0 40 00 10 00 12 40 03 14 01 64 F7',)]
+    # the mapping ran in the worker only
+    assert mox.tones[5].get(23) != 0x64
+
+
+def test_close_sends_the_output_of_pending_input():
+    transport = LoopbackTransport()
+    engine_process = EngineProcess(transport)
+    engine_process.start()
+    for i in range(200):
+        transport.inject_midi(LOOP_MIDI, CC_STATUS_OFFSET + 5, 23, i % 2)
+    engine_process.close()
+    # the tone switch plus a SysEx per CC
+    assert len(transport.sent) == 201
+    transport.inject_midi(LOOP_MIDI, CC_STATUS_OFFSET + 5, 23, 1)
+    assert engine_process.dropped == 1
+
+
+def test_batch_is_marked_until_its_last_message(ring):
+    transport = RingTransport(ring, {}, {})
+    transport.send_sys_ex_batch(['F0 7F 00 06 02 F7', 'F0 7F 00 06 09 F7', 'F0 7F 00 06 01 F7'], batch_size=2)
+    assert [(kind, payload) for kind, _, _, payload in ring.drain()] == [
+        (SYS_EX_BATCH_RECORD, b'F0 7F 00 06 02 F7'), (SYS_EX_RECORD, b'F0 7F 00 06 09 F7'),
+        (SYS_EX_RECORD, b'F0 7F 00 06 01 F7')]
+
+
+def test_full_input_ring_drops_input():
+    engine_process = EngineProcess(LoopbackTransport(), capacity=2)
+    engine_process.input_ring = RingBuffer.create(capacity=2)
+    try:
+        for _ in range(3):
+            engine_process.OnMidiInput(0, 1, CC_STATUS_OFFSET, 23, 1)
+        assert engine_process.dropped == 1
+    finally:
+        engine_process.close()
+
+
+def test_benchmark():
+    round_trips = benchmark(count=10)
+    assert len(round_trips) == 10
+    assert all(round_trip > 0 for round_trip in round_trips)
+
+
+def test_rejects_capacity_that_is_no_power_of_2():
+    with raises(ValueError):
+        RingBuffer.create(capacity=3)
@@ -0,0 +1,68 @@
+import collections
+
+from pytest import fixture
+
+from LoadGenerator import LoadProfile, LoadReport, WindowStats, generate, main, run, AUTOMATION, MMC, PARAMETER, \
+    TONE_SWITCH
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from Transport import SYS_EX, MIDI, LoopbackTransport
+from consts import IGNORED_PATH, MMC_PATH, SECTION_PARAMETER_PATH, TONE_SWITCH_PATH, REVERSE_CC_PATH
+
+
+@fixture
+def cut() -> EventHandler:
+    handler = EventHandler(transport=LoopbackTransport())
+    handler.warm_up()
+    return handler
+
+
+def test_generate_covers_all_event_classes(cut):
+    events = generate(cut.tables, cut.in_ports['loopMIDI'], count=2000, seed=1)
+    paths = collections.Counter(cut.OnSysExInput(*message) if kind == SYS_EX else cut.OnMidiInput(*message)
+                                for kind, message in events)
+    assert set(paths) == {MMC_PATH, TONE_SWITCH_PATH, SECTION_PARAMETER_PATH, REVERSE_CC_PATH}
+    assert paths[IGNORED_PATH] == 0
+    statuses = {message[2] for kind, message in events if kind == MIDI}
+    assert statuses == set(range(CC_STATUS_OFFSET, CC_STATUS_OFFSET + 16))
+
+
+def test_generate_follows_mix(cut):
+    events = generate(cut.tables, cut.in_ports['loopMIDI'], mix={MMC: 1, AUTOMATION: 3}, count=4000)
+    midi_events = sum(kind == MIDI for kind, _ in events)
+    assert 2800 < midi_events < 3200
+    assert all(message[0] in [info.sys_ex_strings[0] for info in cut.tables.simple_sys_ex_info]
+               for kind, message in events if kind == SYS_EX)
+
+
+def test_generate_sweeps_parameters(cut):
+    events = generate(cut.tables, cut.in_ports['loopMIDI'], mix={AUTOMATION: 1}, count=1000)
+    values = collections.defaultdict(list)
+    for _, (_, _, status, control_number, value) in events:
+        values[status, control_number].append(value)
+    assert all((b - a) % 128 == 1 for sweep in values.values() for a, b in zip(sweep, sweep[1:]))
+
+
+def test_run():
+    profile = LoadProfile(rate=2000, duration=0.3, window=0.1, burst_size=4, burst_spacing=0.0001,
+                          ceiling_duration=0.05, mix={TONE_SWITCH: 1, PARAMETER: 1})
+    report = run(profile)
+    assert report.events == 600
+    assert len(report.windows) == 3
+    assert all(window.p50_ns <= window.p99_ns for window in report.windows)
+    assert report.outputs > 0
+    assert report.ceiling > 0
+
+
+def test_report():
+    report = LoadReport(rate=1000, ceiling=5000, windows=[WindowStats(p99_ns=10000, allocated_blocks=100),
+                                                          WindowStats(p99_ns=12000, allocated_blocks=150)])
+    assert report.headroom == 5
+    assert report.latency_drift_ns == 2000
+    assert report.block_growth == 50
+    assert 'p99 drift +2.0 us' in str(report)
+
+
+def test_main(capsys):
+    assert main(['--rate', '1000', '--duration', '0.1', '--ceiling-duration', '0.05', '--mix', 'mmc=1,parameter=2']) \
+           == 0
+    assert '100 events at 1000/s' in capsys.readouterr().out
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import MappingCache
+
+
+def compile_counter():
+    compiled = []
+
+    def compile_source():
+        compiled.append(True)
+        return {'compiled': len(compiled)}
+
+    return compiled, compile_source
+
+
+def test_cache_is_reused(tmp_path):
+    source_path = str(tmp_path / 'source.csv')
+    cache_path = str(tmp_path / 'source.cache.json')
+    with open(source_path, 'w') as file:
+        file.write('a;b\n')
+    compiled, compile_source = compile_counter()
+    assert MappingCache.load(source_path, cache_path, compile_source) == {'compiled': 1}
+    assert MappingCache.load(source_path, cache_path, compile_source) == {'compiled': 1}
+    # touching the file without changing it only refreshes the modification time in the cache
+    os.utime(source_path, ns=(0, 0))
+    assert MappingCache.load(source_path, cache_path, compile_source) == {'compiled': 1}
+    assert len(compiled) == 1
+
+
+def test_cache_is_invalidated_by_content(tmp_path):
+    source_path = str(tmp_path / 'source.csv')
+    cache_path = str(tmp_path / 'source.cache.json')
+    with open(source_path, 'w') as file:
+        file.write('a;b\n')
+    compiled, compile_source = compile_counter()
+    MappingCache.load(source_path, cache_path, compile_source)
+    with open(source_path, 'w') as file:
+        file.write('a;c\n')
+    os.utime(source_path, ns=(0, 0))
+    assert MappingCache.load(source_path, cache_path, compile_source) == {'compiled': 2}
+
+
+def test_loading_from_cache_does_not_import_pandas():
+    import CcReference
+    CcReference.get_mapping()
+    result = subprocess.run([sys.executable, '-c', 'import sys, MidiOxProxy; print("pandas" in sys.modules)'],
+                            cwd=os.path.dirname(CcReference.__file__), capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
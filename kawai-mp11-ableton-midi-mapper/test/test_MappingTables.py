@@ -0,0 +1,106 @@
+import os
+import shutil
+import time
+
+from pytest import fixture
+
+import CcReference
+from MappingTables import MappingTables, ReferenceWatcher, validate
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from Transport import LoopbackTransport, SYS_EX
+
+REVERB_ROW = ('28;1C;Undefined;0-127;MSB;reverb;1;F0 40 00 10 00 12 40 01 27 01;F0 40 00 10 00 12 40 02 4B 01;'
+              'F0 40 00 10 00 12 40 03 6F 01;section;127')
+
+
+@fixture
+def reference_path(tmp_path) -> str:
+    path = str(tmp_path / 'cc_midi_reference.csv')
+    shutil.copyfile(CcReference.REFERENCE_PATH, path)
+    yield path
+
+
+@fixture
+def handler() -> EventHandler:
+    yield EventHandler(transport=LoopbackTransport())
+
+
+@fixture
+def cut(handler, reference_path) -> ReferenceWatcher:
+    watcher = ReferenceWatcher(handler, path=reference_path)
+    watcher.prime()
+    yield watcher
+
+
+def edit(path: str, old: str, new: str):
+    with open(path, encoding='utf-8-sig') as file:
+        content = file.read()
+    assert old in content
+    with open(path, 'w', encoding='utf-8-sig') as file:
+        file.write(content.replace(old, new))
+    # make sure the change is noticed even if the modification time does not advance
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 1,) * 2)
+
+
+def test_reference_is_valid():
+    errors, warnings = validate(CcReference.get_mapping())
+    assert errors == []
+    assert warnings == ['F0 40 00 10 00 12 40 02 3E 01 is shared by amp, efx2']
+
+
+def test_invalid_mappings():
+    mapping = CcReference.get_mapping()
+    duplicate_info = {**mapping['prefix_sys_ex_info'][1], 'name': 'copy'}
+    errors, _ = validate({**mapping, 'prefix_sys_ex_info': mapping['prefix_sys_ex_info'] + [duplicate_info]})
+    assert errors == ['control number 23 is mapped to 2 SysEx messages']
+    broken_info = {**mapping['simple_sys_ex_info'][0], 'sys_ex_strings': ['F0 7F 0']}
+    errors, _ = validate({**mapping, 'simple_sys_ex_info': [broken_info] + mapping['simple_sys_ex_info'][1:]})
+    assert errors == ["play: 'F0 7F 0' is not a SysEx message"]
+
+
+def test_unchanged_reference_is_not_reloaded(cut, handler):
+    assert not cut.check()
+    assert handler.pending_tables is None
+
+
+def test_reload_keeps_tone_state(cut, handler, reference_path):
+    transport = handler.transport
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 23, 100)
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 28, 127)
+    edit(reference_path, REVERB_ROW, REVERB_ROW.replace('reverb;1;', 'reverb;;').replace('section;127', ';127'))
+    assert cut.check()
+    assert cut.rebuilt_rows == 1
+    # the tables are swapped with the next event
+    assert 28 in handler.tables.parameter_addresses
+    transport.clear()
+    assert transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 28, 0) == 'ignored'
+    assert 28 not in handler.tables.parameter_addresses
+    assert dict(handler.tones[0].parameters()) == {23: 100}
+    assert transport.sent == []
+    # the mp11 still holds the section volume, so nothing has to be sent on recall
+    handler.recall_tone(handler.tones[0])
+    assert transport.messages(SYS_EX) == []
+
+
+def test_watcher_compiles_on_its_thread(handler, reference_path):
+    watcher = ReferenceWatcher(handler, path=reference_path, interval=0.01)
+    assert watcher.compiled_rows == {}
+    watcher.start()
+    edit(reference_path, REVERB_ROW, REVERB_ROW.replace('reverb;1;', 'reverb;;').replace('section;127', ';127'))
+    deadline = time.monotonic() + 10
+    while handler.pending_tables is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    watcher.close()
+    assert handler.pending_tables is not None
+    assert len(watcher.compiled_rows) > 1
+
+
+def test_invalid_reference_is_rejected(cut, handler, reference_path):
+    edit(reference_path, 'F0 40 00 10 00 12 40 01 27 01', 'F0 40 00 10 00 12 40 01 27 0')
+    assert not cut.check()
+    assert handler.pending_tables is None
+
+
+def test_tables_match_module_tables():
+    tables = MappingTables(CcReference.compile_reference())
+    assert tables.address_prefixes == MappingTables(CcReference.get_mapping()).address_prefixes
@@ -0,0 +1,116 @@
+import json
+import urllib.request
+
+from pytest import fixture
+
+from Metrics import Metrics, Histogram, MeteredTransport, SYS_EX_PORT
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from OutputQueue import QueuedTransport
+from SessionRecorder import SessionRecorder, read_session
+from Transport import LoopbackTransport
+from consts import MMC_PATH, TONE_SWITCH_PATH, SECTION_PARAMETER_PATH, REVERSE_CC_PATH, IGNORED_PATH
+
+
+class EventsProxy:
+    """Forwards attribute access to the event sink like the proxy DispatchWithEvents() returns"""
+
+    def __init__(self, ob):
+        self.__dict__['_obj_'] = ob
+
+    def __getattr__(self, attr):
+        return getattr(self._obj_, attr)
+
+    def __setattr__(self, attr, val):
+        setattr(self._obj_, attr, val)
+
+
+@fixture
+def transport() -> LoopbackTransport:
+    yield LoopbackTransport()
+
+
+@fixture
+def handler(transport) -> EventHandler:
+    yield EventHandler(transport=transport)
+
+
+@fixture
+def cut(handler) -> Metrics:
+    metrics = Metrics()
+    metrics.instrument(handler)
+    yield metrics
+    metrics.close()
+
+
+def test_histogram():
+    histogram = Histogram()
+    for nanoseconds in [100, 200, 300, 5000]:
+        histogram.record(nanoseconds)
+    assert histogram.count == 4
+    assert histogram.max == 5000
+    assert histogram.percentile(0.5) == 256
+    assert histogram.percentile(0.99) == 5000
+
+
+def test_counts_paths(cut, handler, transport):
+    transport.inject_sys_ex('F0 7F 00 06 02 F7 ')
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 28 02 00 1B F7 ')
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 14 01 40 F7 ')
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 7F 7F 01 00 F7 ')
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 0, 100)
+    summary = cut.summary()
+    assert {path: histogram['count'] for path, histogram in summary['paths'].items()} == {
+        MMC_PATH: 1, TONE_SWITCH_PATH: 1, SECTION_PARAMETER_PATH: 1, REVERSE_CC_PATH: 1, IGNORED_PATH: 2}
+    assert summary['outgoing'] == {str(handler.out_ports['loopMIDI']): 3, SYS_EX_PORT: 2}
+
+
+def test_uninstrument(cut, handler, transport):
+    cut.uninstrument(handler)
+    assert 'OnSysExInput' not in handler.__dict__
+    assert isinstance(handler.transport, LoopbackTransport)
+    transport.inject_sys_ex('F0 7F 00 06 02 F7 ')
+    assert cut.summary()['paths'] == {}
+
+
+def test_uninstrument_proxied_handler(transport):
+    proxy = EventsProxy(EventHandler(transport=transport))
+    metrics = Metrics()
+    metrics.instrument(proxy)
+    metrics.uninstrument(proxy)
+    assert 'OnMidiInput' not in proxy._obj_.__dict__
+    assert isinstance(proxy.transport, LoopbackTransport)
+    transport.inject_sys_ex('F0 7F 00 06 02 F7 ')
+    assert metrics.summary()['paths'] == {}
+    metrics.close()
+
+
+def test_uninstrument_keeps_later_wrappers(cut, handler, transport, tmp_path):
+    path = str(tmp_path / 'session.log')
+    recorder = SessionRecorder(path)
+    recorder.attach(handler)
+    handler.transport = QueuedTransport(handler.transport)
+    cut.uninstrument(handler)
+    # the recorder still sees the input, the metered transport is gone from below the recorder and the queue
+    transport.inject_sys_ex('F0 7F 00 06 02 F7 ')
+    handler.transport.close()
+    recorder.close()
+    assert len(read_session(path).inputs) == 1
+    assert not isinstance(handler.transport.transport.transport, MeteredTransport)
+    assert cut.summary()['outgoing'] == {}
+
+
+def test_disabled(handler, transport):
+    Metrics(enabled=False).instrument(handler)
+    assert 'OnMidiInput' not in handler.__dict__
+    assert handler.transport is transport
+
+
+def test_serve(cut, transport):
+    transport.inject_sys_ex('F0 7F 00 06 02 F7 ')
+    cut.gauge('answer', lambda: 42)
+    port = cut.serve()
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/') as response:
+        summary = json.load(response)
+    assert summary['paths'][MMC_PATH]['count'] == 1
+    assert summary['gauges'] == {'answer': 42}
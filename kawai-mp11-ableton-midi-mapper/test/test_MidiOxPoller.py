@@ -0,0 +1,121 @@
+import threading
+
+from pytest import fixture
+
+from MidiOxPoller import MidiOxPoller, decode_raw
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from Transport import LoopbackTransport, SYS_EX, MIDI
+from consts import REVERSE_CC_PATH
+
+
+class MoxScript:
+    """Delivers queued input through the polling methods of MIDI-OX"""
+
+    def __init__(self):
+        self.messages = []
+        self.sys_ex_strings = []
+        self.open_inputs = ['2- KAWAI USB MIDI', 'loopMIDI Port 1']
+
+    # noinspection PyPep8Naming
+    def GetMidiInputRaw(self) -> int:
+        return self.messages.pop(0) if self.messages else 0
+
+    # noinspection PyPep8Naming
+    def GetMidiInput(self) -> str:
+        return self.messages.pop(0) if self.messages else ''
+
+    # noinspection PyPep8Naming
+    def GetFirstOpenMidiInDev(self) -> str:
+        self.next_input = 0
+        return self.GetNextOpenMidiInDev()
+
+    # noinspection PyPep8Naming
+    def GetNextOpenMidiInDev(self) -> str:
+        self.next_input += 1
+        return self.open_inputs[self.next_input - 1] if self.next_input <= len(self.open_inputs) else ''
+
+    # noinspection PyPep8Naming
+    def GetSysExInput(self) -> str:
+        return self.sys_ex_strings.pop(0)
+
+
+@fixture
+def mox() -> MoxScript:
+    yield MoxScript()
+
+
+@fixture
+def transport() -> LoopbackTransport:
+    yield LoopbackTransport()
+
+
+@fixture
+def cut(mox, transport) -> MidiOxPoller:
+    yield MidiOxPoller(mox, handler=EventHandler(transport=transport), raw=True, sleep=lambda seconds: None)
+
+
+def test_decode_raw():
+    assert decode_raw(0x007F6090) == (0x90, 0x60, 0x7F)
+
+
+def test_poll_hands_over_all_pending_input(cut, mox, transport):
+    mox.messages = [(CC_STATUS_OFFSET + 5) | 23 << 8 | 100 << 16, 0xF0, 0xF0]
+    mox.sys_ex_strings = ['F0 40 00 10 00 12 40 03 14 01 40 F7 ', 'F0 7F 00 06 02 F7 ']
+    assert cut.poll() == 3
+    assert cut.batches == 1
+    # tone 5 is activated in the e.piano section before its parameter is set
+    assert transport.messages(SYS_EX) == [('F0 40 00 10 00 12 40 02 04 02 00 11 F7',),
+                                          ('F0 40 00 10 00 12 40 03 14 01 64 F7',)]
+    assert transport.messages(MIDI) == [(1, CC_STATUS_OFFSET + 5, 23, 64), (1, CC_STATUS_OFFSET + 5, 9, 127)]
+    assert cut.poll() == 0
+
+
+def test_poll_keeps_ports_of_several_inputs(mox, transport):
+    handler = EventHandler(transport=transport)
+    cut = MidiOxPoller(mox, handler=handler)
+    assert not cut.raw
+    # a CC from the mp11 on a mapped control number is not sent back to it
+    mox.messages = [f'10,{handler.in_ports["kawai"]},{CC_STATUS_OFFSET + 5},23,100',
+                    f'11,{handler.in_ports["loopMIDI"]},{CC_STATUS_OFFSET + 5},23,100', '12,0,240,0,0']
+    mox.sys_ex_strings = ['F0 7F 00 06 02 F7 ']
+    assert cut.poll() == 3
+    assert transport.messages(SYS_EX) == [('F0 40 00 10 00 12 40 02 04 02 00 11 F7',),
+                                          ('F0 40 00 10 00 12 40 03 14 01 64 F7',)]
+    assert transport.messages(MIDI) == [(1, CC_STATUS_OFFSET + 5, 9, 127)]
+
+
+def test_raw_only_if_loop_midi_is_the_only_input(mox, transport):
+    mox.open_inputs = ['loopMIDI Port 1']
+    assert MidiOxPoller(mox, handler=EventHandler(transport=transport)).raw
+
+
+def test_poll_limits_batch(cut, mox):
+    cut.max_batch = 2
+    mox.messages = [CC_STATUS_OFFSET | 23 << 8 | i << 16 for i in range(3)]
+    assert [cut.poll(), cut.poll(), cut.poll()] == [2, 1, 0]
+    assert cut.events == 3
+
+
+def test_handle_batch_returns_paths():
+    handler = EventHandler()
+    port = handler.in_ports['loopMIDI']
+    assert handler.handle_batch([(0, port, CC_STATUS_OFFSET, 23, 1), 'F0 7F 00 06 02 F7']) == 2
+    assert handler.OnMidiInput(0, port, CC_STATUS_OFFSET, 23, 2) == REVERSE_CC_PATH
+
+
+def test_run_sleeps_adaptively(mox, transport):
+    stop = threading.Event()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            mox.messages.append(CC_STATUS_OFFSET | 23 << 8 | 1 << 16)
+        if len(sleeps) == 6:
+            stop.set()
+
+    cut = MidiOxPoller(mox, handler=EventHandler(transport=transport), raw=True, min_sleep=0.001, max_sleep=0.003,
+                       sleep=sleep)
+    cut.run(stop)
+    assert sleeps == [0.001, 0.002, 0.003, 0.001, 0.002, 0.003]
+    assert cut.events == 1
@@ -1,13 +1,163 @@
-from pytest import fixture
+import threading
+import types
 
-from MidiOxProxy import MidiOxProxy, EventHandler
+from pytest import fixture, raises
+
+from Metrics import Metrics
+from MidiOxProxy import EventHandler, MidiOxProxy, CC_STATUS_OFFSET
+from Transport import LoopbackTransport, SYS_EX, MIDI
+from consts import IGNORED_PATH, SECTION_PARAMETER_PATH
 
 
 @fixture
-def cut() -> EventHandler:
-    with MidiOxProxy() as mox:
-        yield mox._obj_
+def transport() -> LoopbackTransport:
+    yield LoopbackTransport()
+
+
+@fixture
+def cut(transport) -> EventHandler:
+    yield EventHandler(transport=transport)
 
 
 def test_midi_ox_proxy(cut):
     assert len(cut.sections) == 3
+
+
+def test_tone_switch(cut, transport):
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 28 02 00 1B F7 ')
+    assert cut.active_section is cut.sections[2]
+    assert cut.sections[2].active_tone.id == 12
+    assert cut.tone_sections[12] == (2,)
+    assert transport.messages() == [(cut.out_ports['loopMIDI'], CC_STATUS_OFFSET + 12, 3, 127)]
+
+
+def test_section_parameter(cut, transport):
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 01 70 01 40 F7 ')
+    assert cut.tones[0].get(23) == 0x40
+    assert transport.messages(MIDI) == [(cut.out_ports['loopMIDI'], CC_STATUS_OFFSET, 23, 64)]
+
+
+def test_reverse_cc_to_active_tone(cut, transport):
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 23, 100)
+    assert transport.messages(SYS_EX) == [('F0 40 00 10 00 12 40 01 70 01 64 F7',),
+                                          ('F0 40 00 10 00 12 40 03 14 01 64 F7',),
+                                          ('F0 40 00 10 00 12 40 04 38 01 64 F7',)]
+
+
+def test_reverse_cc_activates_tone(cut, transport):
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    assert cut.sections[1].active_tone.id == 5
+    assert transport.messages(SYS_EX) == [('F0 40 00 10 00 12 40 02 04 02 00 11 F7',),
+                                          ('F0 40 00 10 00 12 40 03 14 01 64 F7',)]
+    assert cut.tones[5].get(23) == 0x64
+
+
+def test_ignored_input(cut, transport):
+    transport.inject_sys_ex('F0 7E 00 06 01 F7 ')
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET, 0, 100)
+    transport.inject_midi('2- KAWAI USB MIDI', CC_STATUS_OFFSET, 23, 100)
+    assert transport.sent == []
+
+
+def test_recall_sends_only_changed_parameters(cut, transport):
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 28, 127)
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 0C F7 ')
+    transport.clear()
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 11 F7 ')
+    assert transport.messages(SYS_EX) == [('F0 40 00 10 00 12 40 01 70 01 64 F7',),
+                                          ('F0 40 00 10 00 12 40 04 38 01 64 F7',),
+                                          ('F0 40 00 10 00 12 40 01 27 01 01 F7',),
+                                          ('F0 40 00 10 00 12 40 03 6F 01 01 F7',)]
+    transport.clear()
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 11 F7 ')
+    assert transport.messages(SYS_EX) == []
+
+
+def test_full_resync(cut, transport):
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    cut.full_resync = True
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 11 F7 ')
+    assert len(transport.messages(SYS_EX)) == 2 + 3
+    transport.clear()
+    cut.resync()
+    assert len(transport.messages(SYS_EX)) == 3
+
+
+def test_mmc_toggle_state_per_handler(cut, transport):
+    other_transport = LoopbackTransport()
+    EventHandler(transport=other_transport)
+    transport.inject_sys_ex('F0 7F 00 06 09 F7 ')
+    transport.inject_sys_ex('F0 7F 00 06 09 F7 ')
+    other_transport.inject_sys_ex('F0 7F 00 06 09 F7 ')
+    assert [message[3] for message in transport.messages(MIDI)] == [127, 0]
+    assert [message[3] for message in other_transport.messages(MIDI)] == [127]
+
+
+def test_port_names(transport):
+    cut = EventHandler(transport=transport, out_port_names={'kawai': 'MP11 B', 'loopMIDI': 'loopMIDI Port B'},
+                       in_port_names={'kawai': 'MP11 B', 'loopMIDI': 'loopMIDI Port B 1'})
+    transport.inject_midi('loopMIDI Port B 1', CC_STATUS_OFFSET, 23, 100)
+    assert len(transport.messages(SYS_EX)) == 3
+    assert set(cut.out_ports.values()) == {transport.out_port_ids['MP11 B'], transport.out_port_ids['loopMIDI Port B']}
+    assert cut.in_ports['loopMIDI'] == transport.in_port_ids['loopMIDI Port B 1'] - 1
+
+
+def test_split_sys_ex(cut, transport):
+    assert transport.inject_sys_ex('F0 40 00 10 00 12 ') == IGNORED_PATH
+    assert transport.inject_sys_ex('40 01 70 01 40 F7 ') == SECTION_PARAMETER_PATH
+    assert cut.tones[0].get(23) == 0x40
+
+
+def test_warm_up(cut, transport):
+    cut.warm_up()
+    assert set(transport.out_port_ids) == {'2- KAWAI USB MIDI', 'loopMIDI Port'}
+    assert set(transport.in_port_ids) == {'2- KAWAI USB MIDI', 'loopMIDI Port 1'}
+    assert cut.tables.parameter_sys_ex[cut.tables.address_ids['F0 40 00 10 00 12 40 03 14 01']][0x64] == \
+           'F0 40 00 10 00 12 40 03 14 01 64 F7'
+    assert cut.tables.tone_activation_sys_ex[1][5] == 'F0 40 00 10 00 12 40 02 04 02 00 11 F7'
+
+
+def test_output_queue_size():
+    assert MidiOxProxy().output_queue_size is None
+    assert MidiOxProxy(max_cc_rate=100).output_queue_size == 1024
+    assert MidiOxProxy(output_queue_size=16, max_cc_rate=100).output_queue_size == 16
+    with raises(ValueError):
+        MidiOxProxy(output_queue_size=0)
+
+
+def test_recall_gap():
+    assert MidiOxProxy(recall_batch_size=8, recall_gap=0.01).output_queue_size == 1024
+    assert MidiOxProxy(recall_batch_size=8).output_queue_size is None
+    with raises(ValueError, match='recall_gap needs recall_batch_size'):
+        MidiOxProxy(recall_gap=0.01)
+
+
+def test_gauges_outlive_the_session(monkeypatch):
+    monkeypatch.setattr('MidiOxProxy.win32', types.SimpleNamespace(
+        DispatchWithEvents=lambda prog_id, sink: EventHandler(transport=LoopbackTransport())))
+    metrics = Metrics()
+    with MidiOxProxy(max_cc_rate=100, echo_ttl=0.05, metrics=metrics):
+        pass
+    assert metrics.summary()['gauges'] == {'output queue depth': 0, 'coalescer queue depth': 0, 'coalescer dropped': 0,
+                                           'echoes suppressed': 0}
+
+
+def test_serve_runs_poller_until_stopped():
+    class Poller:
+        def run(self, stop):
+            runs.append(stop)
+            stop.set()
+
+    runs = []
+    proxy = MidiOxProxy(polling=True)
+    proxy.poller = Poller()
+    stop = threading.Event()
+    proxy.serve(stop)
+    assert runs == [stop]
+
+
+def test_engine_process_rejects_in_process_options():
+    assert MidiOxProxy(engine_process=True, polling=True).engine_process
+    with raises(ValueError, match='max_cc_rate, echo_ttl cannot be used with engine_process'):
+        MidiOxProxy(engine_process=True, max_cc_rate=100, echo_ttl=0.05)
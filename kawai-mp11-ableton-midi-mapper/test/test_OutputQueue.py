@@ -0,0 +1,81 @@
+import threading
+
+from pytest import fixture
+
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from OutputQueue import QueuedTransport
+from Transport import LoopbackTransport, SYS_EX, MIDI
+
+
+class BlockingTransport(LoopbackTransport):
+    def __init__(self):
+        super().__init__()
+        self.sending = threading.Event()
+        self.release = threading.Event()
+
+    def send_sys_ex(self, sys_ex: str):
+        self.sending.set()
+        self.release.wait()
+        super().send_sys_ex(sys_ex)
+
+
+@fixture
+def loopback() -> LoopbackTransport:
+    yield LoopbackTransport()
+
+
+@fixture
+def cut(loopback) -> QueuedTransport:
+    transport = QueuedTransport(transport=loopback, maxsize=4)
+    yield transport
+    transport.close()
+
+
+def test_keeps_order(cut, loopback):
+    for i in range(100):
+        cut.send_sys_ex(f'F0 {i:02X} F7')
+        cut.output_midi_msg(1, 176, i, 127)
+    cut.flush()
+    assert loopback.messages() == [message for i in range(100)
+                                   for message in [(f'F0 {i:02X} F7',), (1, 176, i, 127)]]
+
+
+def test_close_sends_queued_messages(cut, loopback):
+    for i in range(10):
+        cut.send_sys_ex(f'F0 {i:02X} F7')
+    cut.close()
+    assert len(loopback.messages(SYS_EX)) == 10
+
+
+def test_backpressure():
+    blocking = BlockingTransport()
+    cut = QueuedTransport(transport=blocking, maxsize=2)
+    cut.send_sys_ex('F0 00 F7')
+    blocking.sending.wait()
+    cut.send_sys_ex('F0 01 F7')
+    cut.send_sys_ex('F0 02 F7')
+    assert cut.queue.full()
+    sender = threading.Thread(target=cut.send_sys_ex, args=('F0 03 F7',))
+    sender.start()
+    sender.join(0.05)
+    assert sender.is_alive()
+    blocking.release.set()
+    sender.join()
+    cut.close()
+    assert len(blocking.messages(SYS_EX)) == 4
+
+
+def test_event_handler_enqueues(loopback):
+    transport = QueuedTransport(transport=loopback)
+    handler = EventHandler(transport=transport)
+    loopback.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    loopback.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 11 F7 ')
+    transport.close()
+    assert loopback.messages(MIDI) == [(handler.out_ports['loopMIDI'], CC_STATUS_OFFSET + 5, 3, 127)]
+    assert len(loopback.messages(SYS_EX)) == 4
+
+
+def test_sys_ex_batch(cut, loopback):
+    cut.send_sys_ex_batch(['F0 7F 00 06 02 F7', 'F0 7F 00 06 09 F7'])
+    cut.flush()
+    assert loopback.messages(SYS_EX) == [('F0 7F 00 06 02 F7',), ('F0 7F 00 06 09 F7',)]
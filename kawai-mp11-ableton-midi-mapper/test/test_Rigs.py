@@ -0,0 +1,41 @@
+from pytest import fixture, mark
+
+from MidiOxProxy import CC_STATUS_OFFSET
+from Rigs import Rig, RigRunner, run_socket_rig
+from SocketTransport import SocketEndpoint, SYS_EX_MESSAGE, SHORT_MESSAGE
+
+RIGS = [Rig(name='a'), Rig(name='b')]
+
+
+@fixture
+def servers():
+    servers = [SocketEndpoint.listen_tcp() for _ in RIGS]
+    yield servers
+    for server, _ in servers:
+        server.close()
+
+
+@mark.parametrize('use_processes', [False, True])
+def test_rigs_are_independent(servers, use_processes):
+    cut = RigRunner(RIGS, target=run_socket_rig, use_processes=use_processes)
+    cut.start(rig_kwargs={rig.name: {'address': ('127.0.0.1', port)} for rig, (_, port) in zip(RIGS, servers)})
+    endpoints = [SocketEndpoint.accept(server) for server, _ in servers]
+    try:
+        a, b = endpoints
+        # activates tone 5 on rig a only, loopMIDI is the second input port the rig requests
+        a.send_midi(1, CC_STATUS_OFFSET + 5, 23, 100)
+        assert [a.received.get(timeout=5)[1] for _ in range(2)] == [SYS_EX_MESSAGE] * 2
+        # tone 0 is still active in all sections of rig b
+        b.send_midi(1, CC_STATUS_OFFSET, 23, 100)
+        assert [b.received.get(timeout=5)[1] for _ in range(3)] == [SYS_EX_MESSAGE] * 3
+        # MMC goes to the active track of each rig, toggle state is not shared either
+        for endpoint in [a, a, b]:
+            endpoint.send_sys_ex(bytes.fromhex('F0 7F 00 06 09 F7'))
+        assert [a.received.get(timeout=5)[1:] for _ in range(2)] == [
+            (SHORT_MESSAGE, 1, bytes((CC_STATUS_OFFSET + 5, 20, 127))),
+            (SHORT_MESSAGE, 1, bytes((CC_STATUS_OFFSET + 5, 20, 0)))]
+        assert b.received.get(timeout=5)[1:] == (SHORT_MESSAGE, 1, bytes((CC_STATUS_OFFSET, 20, 127)))
+    finally:
+        cut.stop()
+        for endpoint in endpoints:
+            endpoint.close()
@@ -0,0 +1,83 @@
+import dataclasses as dc
+
+from pytest import fixture
+
+from CcCoalescer import CcCoalescer
+from EchoSuppressor import EchoSuppressor
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from SessionRecorder import SessionRecorder, read_session
+from SessionReplay import replay
+from Transport import LoopbackTransport, SYS_EX
+
+
+@fixture
+def session_path(tmp_path):
+    path = str(tmp_path / 'session.log')
+    transport = LoopbackTransport()
+    handler = EventHandler(transport=transport)
+    recorder = SessionRecorder(path)
+    recorder.attach(handler)
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 28 02 00 1B F7 ')
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 14 01 40 F7 ')
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 02 04 02 00 0C F7 ')
+    transport.inject_sys_ex('F0 7F 00 06 02 F7 ')
+    recorder.close()
+    yield path
+
+
+def test_read_session(session_path):
+    session = read_session(session_path)
+    assert len(session.inputs) == 5
+    assert session.inputs[0][1:] == (SYS_EX, ('F0 40 00 10 00 12 40 03 28 02 00 1B F7 ',))
+    assert len(session.outputs) == 8
+    assert set(session.in_port_ids) == {'2- KAWAI USB MIDI', 'loopMIDI Port 1'}
+
+
+def test_replay(session_path):
+    report = replay(read_session(session_path))
+    assert report.events == 5
+    assert report.matches
+    assert report.p50_ns <= report.p99_ns <= report.max_ns
+
+
+def test_replay_detects_mismatch(session_path):
+    session = read_session(session_path)
+    del session.outputs[3]
+    assert replay(session).first_mismatch == 3
+
+
+def test_replay_uses_recorded_options(tmp_path):
+    path = str(tmp_path / 'session.log')
+    now = [0.0]
+
+    def clock():
+        return now[0]
+
+    def inject_midi(at, status, data1, data2):
+        # the coalescer thread delivers whatever is due by then
+        now[0] = at
+        handler.coalescer.flush_due()
+        transport.inject_midi('loopMIDI Port 1', status, data1, data2)
+
+    transport = LoopbackTransport()
+    handler = EventHandler(transport=transport, coalescer=CcCoalescer(max_rate=50, clock=clock),
+                           echo_suppressor=EchoSuppressor(ttl=0.05, clock=clock))
+    handler.recall_batch_size = 4
+    recorder = SessionRecorder(path, clock=clock)
+    recorder.attach(handler)
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 14 01 40 F7 ')
+    # the echo of the CC sent to ableton is dropped while it is fresh, but not after the ttl
+    inject_midi(0.001, CC_STATUS_OFFSET, 23, 64)
+    # the coalescer sends 100 at once, 50 when it is due and 40 later on
+    for at, value in [(0.002, 100), (0.004, 60), (0.006, 50), (0.031, 40)]:
+        inject_midi(at, CC_STATUS_OFFSET + 5, 23, value)
+    inject_midi(0.2, CC_STATUS_OFFSET, 23, 64)
+    handler.coalescer.flush()
+    recorder.close()
+    session = read_session(path)
+    assert session.handler_options == {'max_cc_rate': 50, 'echo_ttl': 0.05, 'full_resync': False,
+                                       'recall_batch_size': 4, 'recall_gap': 0.0}
+    assert replay(session).matches
+    for option in ['max_cc_rate', 'echo_ttl']:
+        assert not replay(dc.replace(session, handler_options=dict(session.handler_options, **{option: None}))).matches
@@ -0,0 +1,65 @@
+from pytest import fixture, raises
+
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from SocketTransport import FrameReader, SocketEndpoint, SocketTransport, encode_short, encode_sys_ex, pair, \
+    SHORT_MESSAGE, SYS_EX_MESSAGE, ALL_PORTS, MAX_PAYLOAD
+
+
+@fixture
+def connection():
+    transport, endpoint = pair()
+    handler = EventHandler(transport=transport)
+    yield handler, transport, endpoint
+    transport.close()
+    endpoint.close()
+
+
+def test_frame_reader_reassembles_chunks():
+    stream = encode_short(1, 176, 23, 100) + encode_sys_ex(ALL_PORTS, bytes.fromhex('F0 7F 00 06 02 F7'))
+    reader = FrameReader()
+    frames = [frame for i in range(len(stream)) for frame in reader.feed(stream[i:i + 1])]
+    assert frames == [(SHORT_MESSAGE, 1, bytes((176, 23, 100))),
+                      (SYS_EX_MESSAGE, ALL_PORTS, bytes.fromhex('F0 7F 00 06 02 F7'))]
+    assert reader.buffer == bytearray()
+
+
+def test_reverse_cc_round_trip(connection):
+    handler, transport, endpoint = connection
+    endpoint.send_midi(handler.in_ports['loopMIDI'], CC_STATUS_OFFSET + 5, 23, 100)
+    frames = [endpoint.received.get(timeout=5)[1:] for _ in range(2)]
+    assert frames == [(SYS_EX_MESSAGE, ALL_PORTS, bytes.fromhex('F0 40 00 10 00 12 40 02 04 02 00 11 F7')),
+                      (SYS_EX_MESSAGE, ALL_PORTS, bytes.fromhex('F0 40 00 10 00 12 40 03 14 01 64 F7'))]
+
+
+def test_sys_ex_round_trip(connection):
+    handler, transport, endpoint = connection
+    endpoint.send_sys_ex(bytes.fromhex('F0 40 00 10 00 12 40 03 14 01 40 F7'))
+    assert endpoint.received.get(timeout=5)[1:] == (SHORT_MESSAGE, handler.out_ports['loopMIDI'],
+                                                    bytes((CC_STATUS_OFFSET, 23, 64)))
+
+
+def test_tcp():
+    server, port = SocketEndpoint.listen_tcp()
+    transport = SocketTransport.connect_tcp('127.0.0.1', port)
+    endpoint = SocketEndpoint.accept(server)
+    server.close()
+    handler = EventHandler(transport=transport)
+    endpoint.send_midi(handler.in_ports['loopMIDI'], CC_STATUS_OFFSET, 23, 1)
+    # tone 0 is active in all sections
+    assert [endpoint.received.get(timeout=5)[1] for _ in range(3)] == [SYS_EX_MESSAGE] * 3
+    transport.close()
+    endpoint.close()
+
+
+def test_sys_ex_batch(connection):
+    handler, transport, endpoint = connection
+    transport.send_sys_ex_batch(['F0 7F 00 06 02 F7', 'F0 7F 00 06 09 F7'])
+    assert [endpoint.received.get(timeout=5)[3] for _ in range(2)] == [bytes.fromhex('F0 7F 00 06 02 F7'),
+                                                                       bytes.fromhex('F0 7F 00 06 09 F7')]
+
+
+def test_oversized_sys_ex_is_rejected(connection):
+    handler, transport, endpoint = connection
+    assert len(encode_sys_ex(ALL_PORTS, bytes(MAX_PAYLOAD))) == MAX_PAYLOAD + 4
+    with raises(ValueError):
+        transport.send_sys_ex(' '.join(['00'] * (MAX_PAYLOAD + 1)))
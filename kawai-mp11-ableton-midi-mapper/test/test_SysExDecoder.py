@@ -0,0 +1,55 @@
+from pytest import fixture
+
+from CcReference import CcReference
+from SysExDecoder import SysExDecoder, MMC, TONE, PARAMETER
+
+
+@fixture
+def cut() -> SysExDecoder:
+    yield SysExDecoder(*CcReference.get_cc_sys_ex_info())
+
+
+def test_decode_mmc(cut):
+    decoded = cut.decode('F0 7F 00 06 02 F7 ')
+    assert decoded.kind == MMC
+    assert decoded.info.name == 'play'
+
+
+def test_decode_mmc_requires_exact_match(cut):
+    assert cut.decode('F0 7F 00 06 02 00 F7 ') is None
+
+
+def test_decode_tone(cut):
+    decoded = cut.decode('F0 40 00 10 00 12 40 03 28 02 00 1B F7 ')
+    assert decoded.kind == TONE
+    assert decoded.section_index == 2
+    assert decoded.data_size == 2
+    assert decoded.value == 27
+
+
+def test_decode_parameter(cut):
+    decoded = cut.decode(b'\xF0\x40\x00\x10\x00\x12\x40\x02\x4B\x01\x40\xF7')
+    assert decoded.kind == PARAMETER
+    assert decoded.info.name == 'reverb'
+    assert decoded.section_index == 1
+    assert decoded.data_size == 1
+    assert decoded.value == 64
+
+
+def test_decode_matches_string_slicing(cut):
+    simple_info, prefix_info = CcReference.get_cc_sys_ex_info()
+    prefix_map = {sys_ex: info for info in prefix_info for sys_ex in info.sys_ex_strings}
+    for prefix, info in prefix_map.items():
+        sys_ex = f'{prefix} 00 7F F7 ' if prefix.endswith('02') else f'{prefix} 7F F7 '
+        data_size = int(sys_ex[27:29], 16)
+        decoded = cut.decode(sys_ex)
+        assert decoded.info.control_number == info.control_number
+        assert decoded.section_index == info.map[prefix]
+        assert decoded.data_size == data_size
+        assert decoded.value == int(sys_ex[27 + 3 * data_size:29 + 3 * data_size], 16)
+
+
+def test_decode_unknown(cut):
+    assert cut.decode('F0 40 00 10 00 12 40 7F 7F 01 00 F7 ') is None
+    assert cut.decode('F0 40 00 10 00 12 40 01 27 01 ') is None
+    assert cut.decode('not sys ex') is None
@@ -0,0 +1,60 @@
+from pytest import fixture
+
+from SysExFramer import SysExFramer, is_complete
+
+MESSAGE = bytes.fromhex('F0 40 00 10 00 12 40 03 14 01 40 F7')
+
+
+@fixture
+def cut() -> SysExFramer:
+    yield SysExFramer(max_length=64)
+
+
+def test_complete_message(cut):
+    assert list(cut.feed(MESSAGE)) == [MESSAGE]
+    assert not cut.in_message
+    assert cut.messages == 1
+
+
+def test_reassembles_single_bytes(cut):
+    stream = MESSAGE * 3
+    assert [message for i in range(len(stream)) for message in cut.feed(stream[i:i + 1])] == [MESSAGE] * 3
+
+
+def test_split_like_midi_ox(cut):
+    assert list(cut.feed(MESSAGE[:7])) == []
+    assert cut.in_message
+    assert list(cut.feed(MESSAGE[7:])) == [MESSAGE]
+
+
+def test_skips_realtime_bytes(cut):
+    assert list(cut.feed(b'\xf8' + MESSAGE[:5] + b'\xf8\xfe' + MESSAGE[5:] + b'\xfa')) == [MESSAGE]
+
+
+def test_status_byte_aborts_message(cut):
+    assert list(cut.feed(MESSAGE[:5] + bytes((0xB0, 23, 100)) + MESSAGE[5:] + MESSAGE)) == [MESSAGE]
+    assert cut.dropped == 1
+
+
+def test_new_message_aborts_message(cut):
+    assert list(cut.feed(MESSAGE[:5] + MESSAGE)) == [MESSAGE]
+    assert cut.dropped == 1
+
+
+def test_drops_long_message(cut):
+    long_message = b'\xf0' + bytes(100) + b'\xf7'
+    assert list(cut.feed(long_message + MESSAGE)) == [MESSAGE]
+    assert cut.dropped == 1
+
+
+def test_bulk_dump():
+    cut = SysExFramer()
+    dump = b'\xf0' + bytes(range(0x80)) * 256 + b'\xf7'
+    stream = dump + MESSAGE
+    assert [message for i in range(0, len(stream), 256) for message in cut.feed(stream[i:i + 256])] == [dump, MESSAGE]
+
+
+def test_is_complete():
+    assert is_complete(MESSAGE)
+    assert not is_complete(MESSAGE[:-1])
+    assert not is_complete(MESSAGE[:5] + b'\xf8' + MESSAGE[5:])
@@ -0,0 +1,34 @@
+from pytest import fixture
+
+from Tone import Tone
+
+
+@fixture
+def cut() -> Tone:
+    yield Tone(id=3)
+
+
+def test_set_and_get(cut):
+    assert cut.get(23) is None
+    cut.set(23, 64)
+    assert cut.get(23) == 64
+    assert cut.dirty == 1 << 23
+
+
+def test_parameters_are_ordered_by_control_number(cut):
+    cut.set(103, 1)
+    cut.set(23, 64)
+    cut.set(0, 0)
+    assert list(cut.parameters()) == [(0, 0), (23, 64), (103, 1)]
+
+
+def test_copy_and_diff(cut):
+    cut.set(23, 64)
+    cut.set(28, 1)
+    copy = cut.copy()
+    assert copy == cut
+    assert cut.diff(copy) == 0
+    copy.set(23, 65)
+    copy.set(85, 0)
+    assert cut.values[23] == 64
+    assert cut.diff(copy) == 1 << 23 | 1 << 85
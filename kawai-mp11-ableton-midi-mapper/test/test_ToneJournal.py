@@ -0,0 +1,68 @@
+import os
+
+from pytest import fixture
+
+import ToneJournal
+from MidiOxProxy import EventHandler, CC_STATUS_OFFSET
+from Transport import LoopbackTransport
+
+
+@fixture
+def directory(tmp_path) -> str:
+    yield str(tmp_path / 'journal')
+
+
+def run_session(directory: str) -> EventHandler:
+    transport = LoopbackTransport()
+    handler = EventHandler(transport=transport, journal=ToneJournal.ToneJournal(directory))
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 28 02 00 1B F7 ')
+    transport.inject_sys_ex('F0 40 00 10 00 12 40 03 14 01 40 F7 ')
+    transport.inject_midi('loopMIDI Port 1', CC_STATUS_OFFSET + 5, 23, 100)
+    return handler
+
+
+def restored_handler(directory: str) -> EventHandler:
+    handler = EventHandler()
+    journal = ToneJournal.ToneJournal(directory)
+    journal.restore(handler)
+    journal.close()
+    return handler
+
+
+def assert_same_state(handler: EventHandler, restored: EventHandler):
+    assert restored.tones == handler.tones
+    assert [section.active_tone.id for section in restored.sections] == \
+           [section.active_tone.id for section in handler.sections]
+    assert restored.active_section.index == handler.active_section.index
+    assert restored.tone_sections == handler.tone_sections
+
+
+def test_restore_from_journal(directory):
+    handler = run_session(directory)
+    handler.journal.flush()
+    assert os.path.getsize(os.path.join(directory, ToneJournal.JOURNAL_FILE)) > 0
+    assert_same_state(handler, restored_handler(directory))
+
+
+def test_restore_from_snapshot(directory):
+    handler = run_session(directory)
+    handler.journal.close()
+    assert os.path.getsize(os.path.join(directory, ToneJournal.JOURNAL_FILE)) == 0
+    assert_same_state(handler, restored_handler(directory))
+
+
+def test_partial_record_is_ignored(directory):
+    handler = run_session(directory)
+    handler.journal.flush()
+    handler.journal.file.write(b'\x01\x02')
+    handler.journal.file.flush()
+    assert_same_state(handler, restored_handler(directory))
+
+
+def test_background_thread_writes_batches(directory):
+    journal = ToneJournal.ToneJournal(directory, flush_interval=0.01, snapshot_records=3)
+    journal.start()
+    for value in range(10):
+        journal.record_parameter(2, 23, value)
+    journal.close()
+    assert ToneJournal.load(directory).tones[2].get(23) == 9
@@ -0,0 +1,26 @@
+from ToneRouting import MP11_TONE_NUMBERS, TONE_IDS, TONE_COUNT
+
+
+def test_mp11_tone_numbers():
+    for tone_id in range(TONE_COUNT):
+        assert MP11_TONE_NUMBERS[tone_id][0] == tone_id
+        assert MP11_TONE_NUMBERS[tone_id][1] == tone_id + 12
+        assert MP11_TONE_NUMBERS[tone_id][2] == tone_id + (tone_id // 3) - (
+                int(tone_id > 11) * (4 + 3 * (15 - tone_id)) + int(tone_id == 15)) + 24
+
+
+def test_tone_ids():
+    for (section_index, tone_number), tone_id in TONE_IDS.items():
+        if section_index in range(2):
+            assert tone_id == tone_number - (section_index * 12)
+        else:
+            raw_channel = tone_number - 24
+            assert tone_id == int(raw_channel - raw_channel // 4 + int(not bool((raw_channel + 1) % 4)) * (
+                    11 - (2 * ((raw_channel + 1) / 4))))
+
+
+def test_tables_are_inverse():
+    assert len(TONE_IDS) == 3 * TONE_COUNT
+    for tone_id in range(TONE_COUNT):
+        for section_index in range(3):
+            assert TONE_IDS[(section_index, MP11_TONE_NUMBERS[tone_id][section_index])] == tone_id
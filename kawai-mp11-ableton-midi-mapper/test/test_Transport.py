@@ -0,0 +1,52 @@
+from pytest import fixture
+
+from MidiOxProxy import EventHandler
+from Transport import LoopbackTransport, MidiOxTransport, SYS_EX
+
+
+class MoxScript:
+    """Records the calls a MidiOxTransport makes to MIDI-OX"""
+
+    def __init__(self):
+        self.sys_ex_strings = []
+
+    # noinspection PyPep8Naming
+    def SendSysExString(self, sys_ex: str):
+        self.sys_ex_strings.append(sys_ex)
+
+
+@fixture
+def mox() -> MoxScript:
+    yield MoxScript()
+
+
+@fixture
+def cut(mox) -> MidiOxTransport:
+    yield MidiOxTransport(mox)
+
+
+def test_batch_is_one_call(cut, mox):
+    cut.send_sys_ex_batch(['F0 01 F7', 'F0 02 F7', 'F0 03 F7'])
+    assert mox.sys_ex_strings == ['F0 01 F7 F0 02 F7 F0 03 F7']
+
+
+def test_batch_size(cut, mox):
+    cut.send_sys_ex_batch(['F0 01 F7', 'F0 02 F7', 'F0 03 F7'], batch_size=2, gap=0.001)
+    assert mox.sys_ex_strings == ['F0 01 F7 F0 02 F7', 'F0 03 F7']
+
+
+def test_loopback_sends_batch_as_single_messages():
+    transport = LoopbackTransport()
+    transport.send_sys_ex_batch(['F0 01 F7', 'F0 02 F7'], gap=0.001)
+    assert transport.messages(SYS_EX) == [('F0 01 F7',), ('F0 02 F7',)]
+    assert transport.sent[1][0] - transport.sent[0][0] >= 0.001
+
+
+def test_recall_is_batched(cut, mox):
+    handler = EventHandler(transport=cut)
+    handler.tones[5].set(23, 100)
+    handler.tones[5].set(28, 1)
+    handler.recall_tone(handler.tones[5])
+    assert mox.sys_ex_strings == ['F0 40 00 10 00 12 40 01 70 01 64 F7 F0 40 00 10 00 12 40 03 14 01 64 F7 '
+                                  'F0 40 00 10 00 12 40 04 38 01 64 F7 F0 40 00 10 00 12 40 01 27 01 01 F7 '
+                                  'F0 40 00 10 00 12 40 02 4B 01 01 F7 F0 40 00 10 00 12 40 03 6F 01 01 F7']
@@ -1,9 +1,26 @@
 # Press the green button in the gutter to run the script.
+import argparse
+import threading
+
+import win32api
 import win32con
-import win32ui
 
 from MidiOxProxy import MidiOxProxy
 
+
+def wait_for_ok(stop: threading.Event):
+    win32api.MessageBox(0, "Entering Loop... Press OK to end.", "Python", win32con.MB_OK)
+    stop.set()
+
+
 if __name__ == '__main__':
-    with MidiOxProxy() as _:
-        win32ui.MessageBox("Entering Loop... Press OK to end.", "Python", win32con.MB_OK)
+    parser = argparse.ArgumentParser(description='Map between the mp11 and ableton through MIDI-OX')
+    parser.add_argument('--polling', action='store_true', help='poll the input instead of a COM callback per event')
+    parser.add_argument('--engine-process', action='store_true', help='run the mapping in a worker process')
+    arguments = parser.parse_args()
+    proxy = MidiOxProxy(polling=arguments.polling, engine_process=arguments.engine_process)
+    with proxy:
+        stop = threading.Event()
+        # the input is handled on this thread, which owns the MIDI-OX COM object
+        threading.Thread(target=wait_for_ok, args=(stop,), name='MessageBox', daemon=True).start()
+        proxy.serve(stop)